@@ -0,0 +1,42 @@
+"""Synthetic student cohorts in the SAMPLE_STUDENTS format of db.py."""
+import random
+
+SUBJECTS = ["Math", "Physics", "English", "History", "Informatics", "Russian language", "Chemistry", "Biology"]
+
+BIOS = [
+    "Likes math and chess.",
+    "Plays football, prefers practical tasks.",
+    "Reads a lot, wants to become a journalist.",
+    "Interested in programming and robotics.",
+    "Draws and visits an art school.",
+]
+
+
+def make_cohort(size, seed=0, duplicate_rate=0.1, classes=(7, 8, 9, 10, 11), marks_per_subject=6):
+    """
+    `size` raw student records. About duplicate_rate of them copy the marks,
+    class and bio of an earlier student (like ivan123 / ivan_petrov in db.py),
+    which exercises the LLM cache and single-flight deduplication.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(size):
+        login = f"bench_{seed}_{i:05d}"
+        if records and rng.random() < duplicate_rate:
+            source = rng.choice(records)
+            marks, personal = source["Marks and exams"], dict(source["Personal"])
+        else:
+            subjects = rng.sample(SUBJECTS, rng.randint(4, len(SUBJECTS)))
+            marks = {}
+            for subject in subjects:
+                base = rng.uniform(2.5, 5)
+                marks[subject] = [min(5, max(2, round(rng.gauss(base, 0.7)))) for _ in range(marks_per_subject)]
+            personal = {"Class": rng.choice(classes), "Bio": rng.choice(BIOS)}
+        records.append({
+            "Full Name": f"Bench Student {seed}-{i:05d}",
+            "Login": login,
+            "Password": "bench",
+            "Marks and exams": marks,
+            "Personal": personal,
+        })
+    return records
@@ -0,0 +1,218 @@
+"""
+Offline benchmark of the teacher flow.
+
+Starts the local stub LLM (bench/stub_server.py), then runs the batch flow
+(main.run_batch) over synthetic cohorts and reports reports/sec, per-student
+p50/p95/p99 latency, peak memory and cache effectiveness:
+
+    python -m bench.run_bench --students 1,100,1000 --latency 0.2 --concurrency 32
+    python -m bench.run_bench --students 10000 --error-rate 0.01 --warm --out bench.json
+
+Every cohort size runs in its own subprocess with its own LLM cache, node
+store, logs and rate-limit database (in a temporary directory), so sizes do
+not warm each other's caches and peak RSS belongs to one run.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import contextlib
+
+from bench.cohort import make_cohort
+from bench.stub_server import StubConfig, start_stub_server
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def _delta(before, after):
+    """after - before for (nested) counter dicts; gauges like entries/bytes are kept as is."""
+    if isinstance(after, dict):
+        return {key: _delta(before.get(key, 0) if isinstance(before, dict) else 0, value)
+                for key, value in after.items()}
+    if isinstance(after, (int, float)) and not isinstance(after, bool):
+        return after - before if isinstance(before, (int, float)) else after
+    return after
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_pass(db, logins, args, workdir, label):
+    """One main.run_batch pass; returns its measurements."""
+    import main
+    from utils.metrics import get_metrics
+    from utils.llm_cache import get_cache_stats
+    from utils.call_llm import get_single_flight_stats
+
+    namespace = argparse.Namespace(
+        concurrency=args.concurrency,
+        manifest=os.path.join(workdir, f"manifest_{label}.jsonl"),
+        output_dir=os.path.join(workdir, "output"),
+        no_cache=args.no_cache,
+        stream=args.stream,
+        per_subject=args.per_subject,
+        priority=args.priority,
+        max_subjects=10,
+        max_topics=10,
+        metrics=False,
+        metrics_file=None,
+        archive=args.archive,
+        run_id=f"bench-{label}",
+        resume=None,
+        no_checkpoint=False,
+    )
+    get_metrics().reset()
+    cache_before, single_flight_before = get_cache_stats(), get_single_flight_stats()
+    started = time.monotonic()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        failed = asyncio.run(main.run_batch(db, main.precompute_analytics(db.iter_students()), namespace))
+    elapsed = time.monotonic() - started
+
+    with open(namespace.manifest, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    errors = {}
+    for record in records:
+        if record["status"] != "ok":
+            kind = record["error"].split(":", 1)[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    llm = get_metrics().summary()["llm"]
+    return {
+        "pass": label,
+        "students": len(logins),
+        "failed": failed,
+        "elapsed": round(elapsed, 3),
+        "reports_per_sec": round((len(logins) - failed) / elapsed, 2) if elapsed else None,
+        "errors": errors,
+        "student_seconds": _percentiles([record["seconds"] for record in records]),
+        "llm": llm,
+        "cache": _delta(cache_before, get_cache_stats()),
+        "single_flight": _delta(single_flight_before, get_single_flight_stats()),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_worker(args):
+    """Child process: one cohort size, fresh caches in a temporary directory."""
+    from db import SQLiteRepository
+
+    with tempfile.TemporaryDirectory(prefix="teacher_bench_") as workdir:
+        os.environ.update({
+            "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+            "NODE_STORE_PATH": os.path.join(workdir, "node_results.db"),
+            "LLM_RATE_LIMIT_PATH": os.path.join(workdir, "rate_limits.db"),
+            "CHECKPOINT_PATH": os.path.join(workdir, "checkpoints.db"),
+            "LOG_DIR": os.path.join(workdir, "logs"),
+        })
+        db = SQLiteRepository(os.path.join(workdir, "students.db"))
+        db.import_records(make_cohort(args.size, seed=args.seed, duplicate_rate=args.duplicate_rate))
+        logins = db.list_logins()
+
+        results = [_run_pass(db, logins, args, workdir, "cold")]
+        if args.warm:
+            results.append(_run_pass(db, logins, args, workdir, "warm"))
+    print(json.dumps(results))
+
+
+def _print_result(size, result):
+    latency = result["student_seconds"]
+    print(
+        f"  {result['pass']:<5} {size:>6} students: {result['reports_per_sec']} reports/s, "
+        f"p50 {latency.get('p50')}s, p95 {latency.get('p95')}s, p99 {latency.get('p99')}s, "
+        f"failed {result['failed']}, peak RSS {result['peak_rss_mb']} MB"
+    )
+    if result["errors"]:
+        print(f"        failures: {result['errors']}")
+    for model, stats in result["llm"].items():
+        print(
+            f"        {model}: {stats.get('calls', 0)} calls, cache {stats['cache']}, "
+            f"hit rate {stats['cache_hit_rate']}, errors {stats.get('errors', 0)}"
+        )
+    single_flight = result["single_flight"]
+    if single_flight:
+        print(f"        single-flight: {single_flight}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the teacher flow against a local stub LLM.")
+    parser.add_argument("--students", default="1,10,100", help="Comma-separated cohort sizes (up to 10000)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Students processed at once")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1,
+                        help="Share of students with the same marks as an earlier student")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub latency per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Stub latency jitter (seconds)")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="Stub seconds per answer token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub answers that are 429/5xx")
+    parser.add_argument("--per-subject", action="store_true", help="Run the flow with --per-subject")
+    parser.add_argument("--priority", default="llm", help="Priority mode of the flow (llm, rules, rules+llm)")
+    parser.add_argument("--stream", action="store_true", help="Stream the final conclusion")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the LLM cache")
+    parser.add_argument("--archive", action="store_true", help="Write the reports into one zip archive")
+    parser.add_argument("--warm", action="store_true", help="Run every cohort a second time with warm caches")
+    parser.add_argument("--out", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    sizes = [int(size) for size in args.students.split(",")]
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.per_token_latency, args.seed)
+    server, base_url = start_stub_server(config)
+    print(f"🧪 Stub LLM at {base_url} (latency {args.latency}s ± {args.jitter}s, error rate {args.error_rate})")
+
+    env = dict(os.environ, LLM_PROVIDER="BENCH", BENCH_MODEL="stub", BENCH_BASE_URL=base_url)
+    # Injected errors carry a short Retry-After; keep the backoff of the others short too
+    env.setdefault("LLM_RETRY_BASE_DELAY", "0.1")
+    worker_args = [
+        "--worker", "--concurrency", str(args.concurrency), "--seed", str(args.seed),
+        "--duplicate-rate", str(args.duplicate_rate), "--priority", args.priority,
+    ] + [flag for flag, enabled in (
+        ("--per-subject", args.per_subject), ("--stream", args.stream),
+        ("--no-cache", args.no_cache), ("--warm", args.warm), ("--archive", args.archive),
+    ) if enabled]
+
+    results = {}
+    for size in sizes:
+        print(f"\n⏱️  Cohort of {size} students...")
+        requests_before = config.requests
+        worker = subprocess.run(
+            [sys.executable, "-m", "bench.run_bench", "--size", str(size)] + worker_args,
+            env=env, capture_output=True, text=True,
+        )
+        if worker.returncode != 0:
+            print(worker.stderr)
+            raise SystemExit(f"❌ Benchmark of {size} students failed")
+        results[size] = json.loads(worker.stdout.strip().splitlines()[-1])
+        for result in results[size]:
+            _print_result(size, result)
+        print(f"        stub requests: {config.requests - requests_before}")
+
+    server.shutdown()
+    print(f"\n✅ Stub served {config.requests} requests ({config.errors} injected errors)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Results: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
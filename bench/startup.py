@@ -0,0 +1,114 @@
+"""
+Startup-time benchmark and guard for the CLI.
+
+main.py is started by job schedulers many times a day, so import cost is paid
+on every run. This measures `import main` and `main.py --help` in fresh
+interpreters and fails (exit 1) when:
+- a module that must be imported lazily is loaded by `import main`
+- importing main writes anything to the working directory
+- the median import time is above --max-ms (when given)
+
+    python -m bench.startup --runs 20 --max-ms 400
+    python -m bench.startup --importtime 15    # slowest imports (python -X importtime)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use only (provider SDKs, HTTP clients, rendering)
+LAZY_MODULES = ["google.genai", "IPython", "markdown", "requests", "httpx"]
+
+
+def _python(args, cwd):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONDONTWRITEBYTECODE="1")
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def time_command(args, runs, cwd):
+    """Wall times (ms) of `runs` fresh interpreters running args."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = _python(args, cwd)
+        times.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            raise SystemExit(f"❌ {' '.join(args)} failed:\n{result.stderr}")
+    return times
+
+
+def loaded_lazy_modules(cwd):
+    code = (
+        "import sys, json, main; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    result = _python(["-c", code], cwd)
+    if result.returncode != 0:
+        raise SystemExit(f"❌ import main failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(cwd, top):
+    """(cumulative ms, module) of the slowest imports of `import main`."""
+    result = _python(["-X", "importtime", "-c", "import main"], cwd)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1000, module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def _describe(times):
+    return f"median {statistics.median(times):.0f} ms, min {min(times):.0f} ms, max {max(times):.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and guard the startup time of main.py.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per measurement")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if the median `import main` is slower")
+    parser.add_argument("--importtime", type=int, default=0, help="Show the N slowest imports")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="teacher_startup_") as cwd:
+        baseline = time_command(["-c", "pass"], args.runs, cwd)
+        import_main = time_command(["-c", "import main"], args.runs, cwd)
+        help_run = time_command([os.path.join(REPO_DIR, "main.py"), "--help"], args.runs, cwd)
+        lazy = loaded_lazy_modules(cwd)
+        written = sorted(os.listdir(cwd))
+        slowest = slowest_imports(cwd, args.importtime) if args.importtime else []
+
+    print(f"🚀 Startup ({args.runs} runs each)")
+    print(f"  python -c pass:      {_describe(baseline)}")
+    print(f"  import main:         {_describe(import_main)}")
+    print(f"  main.py --help:      {_describe(help_run)}")
+    if slowest:
+        print("\nSlowest imports (cumulative):")
+        for ms, module in slowest:
+            print(f"  {ms:8.1f} ms  {module}")
+
+    if lazy:
+        failures.append(f"loaded at import time: {', '.join(lazy)}")
+    if written:
+        failures.append(f"files written at import time: {', '.join(written)}")
+    median = statistics.median(import_main)
+    if args.max_ms is not None and median > args.max_ms:
+        failures.append(f"import main took {median:.0f} ms (budget {args.max_ms:.0f} ms)")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        raise SystemExit(1)
+    print("✅ No eager provider imports, no import-time I/O")
+
+
+if __name__ == "__main__":
+    main()
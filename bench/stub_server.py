@@ -0,0 +1,204 @@
+"""
+Local stand-in for an OpenAI compatible /v1/chat/completions endpoint.
+
+Answers every teacher-flow prompt with valid canned YAML / Markdown, with
+configurable latency and injected errors, so the whole flow can be run and
+measured without paying for model calls:
+
+    python -m bench.stub_server --port 8089 --latency 0.2 --error-rate 0.01
+    LLM_PROVIDER=BENCH BENCH_MODEL=stub BENCH_BASE_URL=http://127.0.0.1:8089 python main.py --all
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench.cohort import SUBJECTS
+
+LEVELS = ["Very Low", "Average", "Above Average", "High"]
+
+
+def _pick(prompt, options, salt=""):
+    """Deterministic choice per prompt, so cached and fresh answers agree."""
+    digest = hashlib.sha256(f"{salt}{prompt}".encode("utf-8")).digest()
+    return options[digest[0] % len(options)]
+
+
+def _subjects_in(prompt):
+    return [subject for subject in SUBJECTS if subject in prompt] or SUBJECTS[:1]
+
+
+def _yaml(text):
+    return f"```yaml\n{text}\n```"
+
+
+def _subject_yaml(subject, prompt, indent):
+    pad = " " * indent
+    return (
+        f'{pad}name: "{subject}"\n'
+        f'{pad}level: "{_pick(prompt, LEVELS, subject)}"\n'
+        f"{pad}reasoning: |\n{pad}  Marks in {subject} are stable with a few weak results.\n"
+        f'{pad}strengths:\n{pad}  - "Regular homework"\n'
+        f'{pad}gaps:\n{pad}  - "Exam preparation in {subject}"'
+    )
+
+
+def canned_answer(prompt):
+    """Answer for one teacher-flow prompt, recognized by its output template."""
+    if "Provide ONLY these missing fields" in prompt:
+        return _yaml("fixes: []")
+    if "итоговое заключение" in prompt:
+        return _conclusion(prompt)
+    if "Assess ONE school subject" in prompt:
+        subject = re.search(r"^Subject: (.+)$", prompt, re.MULTILINE).group(1).strip()
+        return _yaml("subject:\n" + _subject_yaml(subject, prompt, 2))
+    if "Do NOT change the order" in prompt:
+        ranked = re.findall(r"^\d+\. (.+)$", prompt, re.MULTILINE)
+        reasons = "\n".join(
+            f'  - subject: "{subject}"\n    reasoning: "Place {i} follows from the level and the gaps."'
+            for i, subject in enumerate(ranked, start=1)
+        )
+        return _yaml(f"reasons:\n{reasons}")
+    if "knowledge_to_discover:" in prompt:
+        topics = "\n".join(
+            f'  - topic: "{subject} review"\n    based_from: "identified gaps"\n'
+            f'    examples:\n      - "Solve five {subject} exercises"\n'
+            f'    subtopics:\n      - name: "{subject} basics"\n        based_from: "gap"'
+            for subject in _subjects_in(prompt)[:3]
+        )
+        return _yaml(f"knowledge_to_discover:\n{topics}")
+    if "learning_priority:" in prompt:
+        ranked = "\n".join(
+            f'  - subject: "{subject}"\n    priority: {i}\n    reasoning: "Gaps found."'
+            for i, subject in enumerate(_subjects_in(prompt), start=1)
+        )
+        return _yaml(f"learning_priority:\n{ranked}")
+    if "student_profile:" in prompt:
+        subjects = "\n".join(
+            "    -" + _subject_yaml(subject, prompt, 6)[5:] for subject in _subjects_in(prompt)
+        )
+        return _yaml(f"student_profile:\n  subjects:\n{subjects}")
+    return _conclusion(prompt)
+
+
+def _conclusion(prompt):
+    return (
+        "# Teacher conclusion\n\n"
+        "The student works steadily and should focus on the gaps listed below.\n\n"
+        "| Subject | Level |\n|---|---|\n"
+        + "\n".join(f"| {subject} | {_pick(prompt, LEVELS, subject)} |" for subject in _subjects_in(prompt))
+        + "\n\n## Recommendations\n\n- Practice regularly.\n- Review the weak topics every week.\n"
+    )
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, per_token_latency=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.per_token_latency = per_token_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next_fault(self):
+        """None, or (status, Retry-After header) of an injected error."""
+        with self.lock:
+            self.requests += 1
+            if self.random.random() >= self.error_rate:
+                return None
+            self.errors += 1
+            return self.random.choice([(429, "0.2"), (500, None), (503, "0.1")])
+
+    def delay(self, answer):
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency + jitter + self.per_token_latency * len(answer) / 4)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog (5) drops connections when a batch opens
+    # dozens at once, which shows up as 1s+ SYN retries and read errors
+    request_queue_size = 1024
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            fault = config.next_fault()
+            if fault:
+                status, retry_after = fault
+                body = json.dumps({"error": {"message": "injected error", "code": status}}).encode()
+                return self._send(status, body, headers={"Retry-After": retry_after} if retry_after else None)
+
+            prompt = request["messages"][-1]["content"]
+            answer = canned_answer(prompt)
+            time.sleep(config.delay(answer))
+
+            if request.get("stream"):
+                chunks = [answer[i:i + 40] for i in range(0, len(answer), 40)]
+                events = "".join(
+                    "data: " + json.dumps({"choices": [{"delta": {"content": chunk}}]}) + "\n\n"
+                    for chunk in chunks
+                ) + "data: [DONE]\n\n"
+                return self._send(200, events.encode("utf-8"), "text/event-stream; charset=utf-8")
+
+            body = json.dumps({
+                "choices": [{"message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4},
+            }, ensure_ascii=False).encode("utf-8")
+            self._send(200, body)
+
+    return Handler
+
+
+def start_stub_server(config, host="127.0.0.1", port=0):
+    """Start the stub on a daemon thread; returns (server, base_url)."""
+    server = StubServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI compatible stub for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base latency per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- latency (seconds)")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="Extra seconds per answer token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429/5xx")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.per_token_latency, args.seed)
+    server = StubServer((args.host, args.port), make_handler(config))
+    print(f"🧪 Stub LLM listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {config.requests} requests ({config.errors} injected errors)")
+
+
+if __name__ == "__main__":
+    main()
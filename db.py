@@ -1,77 +1,381 @@
 # db.py
 # просто файл пустышка со структурой данных, заполняемых из БД, или как представленно здесь...
-class Database:
-    def __init__(self):
-        self.data = [
-            {
-                "Full Name": "Иван Иванов",
-                "Login": "ivan123", # связка логин-пароль для авторизации
-                "Password": "ivan",
-                "Marks and exams": { # Оценки
-                    "Math": [5, 4, 3, 4, 5],
-                    "Physics": [5, 4, 3, 4, 5],
-                    "English": [5, 4, 3, 4, 5],
-                    "History": [5, 4, 3, 4, 5],
-                    "Informatics": [3, 4, 3, 4, 3],
-                    "Russian language": [2, 4, 3, 4, 2]
-                },
-                "Personal": {
-                    "Class": 9,
-                    "Bio": "Люблю математику и физику, играю в шахматы на уровне любителя."
-                }
-            },
-            {
-                "Full Name": "Иван Петров",
-                "Login": "ivan_petrov",
-                "Password": "ivan",
-                "Marks and exams": {
-                    "Math": [5, 4, 3, 4, 5],
-                    "Physics": [5, 4, 3, 4, 5],
-                    "English": [5, 4, 3, 4, 5],
-                    "History": [5, 4, 3, 4, 5],
-                    "Informatics": [3, 4, 3, 4, 3],
-                    "Russian language": [2, 4, 3, 4, 2]
-                },
-                "Personal": {
-                    "Class": 9,
-                    "Bio": "Люблю информатику, играю в шахматы на уровне гроссмейстера."
-                }
-            },
-            {
-                "Full Name": "Мария Петрова",
-                "Login": "maria123",
-                "Password": "maria",
-                "Marks and exams": {
-                    "Math": [5, 3, 4, 5],
-                    "Physics": [2, 4, 2, 4, 2],
-                    "English": [5, 2, 3, 4, 5],
-                    "History": [5, 4, 3, 4, 2],
-                    "Informatics": [3, 5, 5, 4, 5],
-                    "Russian language": [2, 4, 5, 4, 2]
-                },
-                "Personal": {
-                    "Class": 9,
-                    "Bio": "Мне нравится литература и история, я посещаю кружок по драме!"
-                }
-            }
-        ]
+# Хранилища учеников: в памяти (Database) и SQLite (SQLiteRepository), с одинаковым интерфейсом.
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 
+SAMPLE_STUDENTS = [
+    {
+        "Full Name": "Иван Иванов",
+        "Login": "ivan123", # связка логин-пароль для авторизации
+        "Password": "ivan",
+        "Marks and exams": { # Оценки
+            "Math": [5, 4, 3, 4, 5],
+            "Physics": [5, 4, 3, 4, 5],
+            "English": [5, 4, 3, 4, 5],
+            "History": [5, 4, 3, 4, 5],
+            "Informatics": [3, 4, 3, 4, 3],
+            "Russian language": [2, 4, 3, 4, 2]
+        },
+        "Personal": {
+            "Class": 9,
+            "Bio": "Люблю математику и физику, играю в шахматы на уровне любителя."
+        }
+    },
+    {
+        "Full Name": "Иван Петров",
+        "Login": "ivan_petrov",
+        "Password": "ivan",
+        "Marks and exams": {
+            "Math": [5, 4, 3, 4, 5],
+            "Physics": [5, 4, 3, 4, 5],
+            "English": [5, 4, 3, 4, 5],
+            "History": [5, 4, 3, 4, 5],
+            "Informatics": [3, 4, 3, 4, 3],
+            "Russian language": [2, 4, 3, 4, 2]
+        },
+        "Personal": {
+            "Class": 9,
+            "Bio": "Люблю информатику, играю в шахматы на уровне гроссмейстера."
+        }
+    },
+    {
+        "Full Name": "Мария Петрова",
+        "Login": "maria123",
+        "Password": "maria",
+        "Marks and exams": {
+            "Math": [5, 3, 4, 5],
+            "Physics": [2, 4, 2, 4, 2],
+            "English": [5, 2, 3, 4, 5],
+            "History": [5, 4, 3, 4, 2],
+            "Informatics": [3, 5, 5, 4, 5],
+            "Russian language": [2, 4, 5, 4, 2]
+        },
+        "Personal": {
+            "Class": 9,
+            "Bio": "Мне нравится литература и история, я посещаю кружок по драме!"
+        }
+    }
+]
+
+
+def normalize_student(student: dict) -> dict:
+    """
+    Normalize structure for AI nodes
+    """
+    return {
+        "Full Name": student["Full Name"],
+        "Class": student["Personal"]["Class"],
+        "Bio": student["Personal"]["Bio"],
+        "Marks": student["Marks and exams"]
+    }
+
+
+class StudentRepository(ABC):
+    """
+    Interface of a student store. Students are addressed by Login (student_id)
+    and returned normalized (see normalize_student).
+    """
+
+    @abstractmethod
     def get(self, login: str):
+        """Normalized student or None"""
+
+    def get_many(self, logins) -> dict:
+        """{login: normalized student} for the logins that exist"""
+        result = {}
+        for login in logins:
+            student = self.get(login)
+            if student:
+                result[login] = student
+        return result
+
+    @abstractmethod
+    def iter_students(self, batch_size: int = 500, student_class=None):
+        """Stream (login, normalized student) pairs, batch_size records at a time"""
+
+    @abstractmethod
+    def list_logins(self, student_class=None):
         """
-        Get student by login (used as student_id)
+        Logins of all students, optionally only those of one class
+        """
+
+    @abstractmethod
+    def get_raw(self, login: str):
+        """Stored record as is (with Login/Password), or None"""
+
+    def class_version(self, student_class):
+        """
+        Token that changes whenever a student of the class is added, changed
+        or removed, so results derived from the whole class can be stored
+        under it. None: the repository can't tell (don't store such results).
         """
-        for student in self.data:
-            if student.get("Login") == login:
-                return self._normalize(student)
         return None
 
-    def _normalize(self, student: dict) -> dict:
+
+class Database(StudentRepository):
+    """
+    In-memory repository with a hash index on Login (and on Class).
+    Normalized records are built once per student and reused.
+    """
+
+    def __init__(self, data=None):
+        self.data = list(SAMPLE_STUDENTS if data is None else data)
+        self._by_login = {student["Login"]: student for student in self.data}
+        self._by_class = {}
+        for student in self.data:
+            self._by_class.setdefault(student["Personal"]["Class"], []).append(student["Login"])
+        self._normalized = {}
+
+    def get(self, login: str):
         """
-        Normalize structure for AI nodes
+        Get student by login (used as student_id)
         """
+        normalized = self._normalized.get(login)
+        if normalized is None:
+            student = self._by_login.get(login)
+            if student is None:
+                return None
+            normalized = self._normalized[login] = self._normalize(student)
+        return normalized
+
+    def get_raw(self, login: str):
+        return self._by_login.get(login)
+
+    def iter_students(self, batch_size: int = 500, student_class=None):
+        for login in self.list_logins(student_class):
+            yield login, self.get(login)
+
+    def list_logins(self, student_class=None):
+        if student_class is None:
+            return list(self._by_login)
+        return list(self._by_class.get(student_class, []))
+
+    def _normalize(self, student: dict) -> dict:
+        return normalize_student(student)
+
+
+# Every write to students bumps the version of the affected classes
+# (class_versions), whoever the writer is: the triggers live in the file.
+# The BEFORE INSERT trigger covers INSERT OR REPLACE moving a student to
+# another class, which deletes the old row without firing delete triggers.
+_BUMP_CLASS = (
+    "INSERT INTO class_versions (class, version) SELECT IFNULL({cls}, -1), 1 {source}"
+    " ON CONFLICT(class) DO UPDATE SET version = version + 1;"
+)
+_VERSION_TRIGGERS = {
+    "students_version_replace": "BEFORE INSERT ON students BEGIN "
+        + _BUMP_CLASS.format(cls="class", source="FROM students WHERE login = NEW.login") + " END",
+    "students_version_insert": "AFTER INSERT ON students BEGIN "
+        + _BUMP_CLASS.format(cls="NEW.class", source="WHERE true") + " END",
+    "students_version_update": "AFTER UPDATE ON students BEGIN "
+        + _BUMP_CLASS.format(cls="OLD.class", source="WHERE true") + " "
+        + _BUMP_CLASS.format(cls="NEW.class", source="WHERE true") + " END",
+    "students_version_delete": "AFTER DELETE ON students BEGIN "
+        + _BUMP_CLASS.format(cls="OLD.class", source="WHERE true") + " END",
+}
+
+
+class SQLiteRepository(StudentRepository):
+    """
+    Students stored in SQLite: Login is the primary key and Class is indexed,
+    so lookups are index probes and cohorts are streamed with a cursor instead
+    of being loaded into memory. A bounded LRU keeps recently used normalized
+    records.
+    """
+
+    def __init__(self, path="students.db", cache_size=10000):
+        self.path = path
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._normalized = OrderedDict()
+        self._lock = threading.Lock()
+        self._repository_id = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS students ("
+                " login TEXT PRIMARY KEY,"
+                " password TEXT NOT NULL,"
+                " full_name TEXT NOT NULL,"
+                " class INTEGER,"
+                " bio TEXT,"
+                " marks TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_students_class ON students(class)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS class_versions ("
+                " class INTEGER NOT NULL PRIMARY KEY,"
+                " version INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS repository_meta ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL)"
+            )
+            for name, body in _VERSION_TRIGGERS.items():
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+            self._local.conn = conn
+        return conn
+
+    def import_records(self, records):
+        """Insert or replace raw records (same structure as SAMPLE_STUDENTS)"""
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO students (login, password, full_name, class, bio, marks)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        r["Login"], r["Password"], r["Full Name"], r["Personal"]["Class"],
+                        r["Personal"]["Bio"], json.dumps(r["Marks and exams"], ensure_ascii=False),
+                    )
+                    for r in records
+                ),
+            )
+        with self._lock:
+            self._normalized.clear()
+
+    @staticmethod
+    def _row_to_normalized(row):
+        login, password, full_name, student_class, bio, marks = row
+        return {
+            "Full Name": full_name,
+            "Class": student_class,
+            "Bio": bio,
+            "Marks": json.loads(marks),
+        }
+
+    def _remember(self, login, normalized):
+        with self._lock:
+            self._normalized[login] = normalized
+            self._normalized.move_to_end(login)
+            while len(self._normalized) > self.cache_size:
+                self._normalized.popitem(last=False)
+
+    def get(self, login: str):
+        with self._lock:
+            normalized = self._normalized.get(login)
+            if normalized is not None:
+                self._normalized.move_to_end(login)
+                return normalized
+        row = self._conn().execute(
+            "SELECT login, password, full_name, class, bio, marks FROM students WHERE login = ?", (login,)
+        ).fetchone()
+        if row is None:
+            return None
+        normalized = self._row_to_normalized(row)
+        self._remember(login, normalized)
+        return normalized
+
+    def get_many(self, logins) -> dict:
+        result = {}
+        missing = []
+        with self._lock:
+            for login in logins:
+                normalized = self._normalized.get(login)
+                if normalized is not None:
+                    result[login] = normalized
+                else:
+                    missing.append(login)
+        # SQLite limits the number of bound parameters, so query in chunks
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn().execute(
+                f"SELECT login, password, full_name, class, bio, marks FROM students WHERE login IN ({placeholders})",
+                chunk,
+            )
+            for row in rows:
+                normalized = self._row_to_normalized(row)
+                self._remember(row[0], normalized)
+                result[row[0]] = normalized
+        return result
+
+    def get_raw(self, login: str):
+        row = self._conn().execute(
+            "SELECT login, password, full_name, class, bio, marks FROM students WHERE login = ?", (login,)
+        ).fetchone()
+        if row is None:
+            return None
+        login, password, full_name, student_class, bio, marks = row
         return {
-            "Full Name": student["Full Name"],
-            "Class": student["Personal"]["Class"],
-            "Bio": student["Personal"]["Bio"],
-            "Marks": student["Marks and exams"]
+            "Full Name": full_name,
+            "Login": login,
+            "Password": password,
+            "Marks and exams": json.loads(marks),
+            "Personal": {"Class": student_class, "Bio": bio},
         }
+
+    def iter_students(self, batch_size: int = 500, student_class=None):
+        # Streams rows from the cursor; normalized records are not kept in the
+        # LRU here, a full cohort scan would only evict the useful entries
+        query = "SELECT login, password, full_name, class, bio, marks FROM students"
+        params = ()
+        if student_class is not None:
+            query += " WHERE class = ?"
+            params = (student_class,)
+        cursor = self._conn().execute(query + " ORDER BY login", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], self._row_to_normalized(row)
+
+    def list_logins(self, student_class=None):
+        if student_class is None:
+            rows = self._conn().execute("SELECT login FROM students ORDER BY login")
+        else:
+            rows = self._conn().execute(
+                "SELECT login FROM students WHERE class = ? ORDER BY login", (student_class,)
+            )
+        return [row[0] for row in rows]
+
+    def _id(self):
+        # Random ID of this database file: a recreated file restarts the
+        # class versions, its ID tells them apart from the old ones
+        if self._repository_id is None:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO repository_meta (key, value) VALUES ('id', ?)", (uuid.uuid4().hex,)
+                )
+            self._repository_id = conn.execute("SELECT value FROM repository_meta WHERE key = 'id'").fetchone()[0]
+        return self._repository_id
+
+    def class_version(self, student_class):
+        row = self._conn().execute(
+            "SELECT version FROM class_versions WHERE class = IFNULL(?, -1)", (student_class,)
+        ).fetchone()
+        return f"{self._id()}:{row[0] if row else 0}"
+
+
+def get_database(path=None):
+    """
+    Student repository to use: SQLite when a path is given (or STUDENT_DB_PATH
+    is set), otherwise the in-memory sample Database.
+    """
+    path = path or os.getenv("STUDENT_DB_PATH")
+    if path:
+        return SQLiteRepository(path)
+    return Database()
+
+
+if __name__ == "__main__":
+    # Export the sample students into a SQLite database:
+    #   python db.py students.db
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else "students.db"
+    repository = SQLiteRepository(target)
+    repository.import_records(SAMPLE_STUDENTS)
+    print(f"Exported {len(SAMPLE_STUDENTS)} students to {target}")
@@ -1,26 +1,174 @@
-from pocketflow import Flow
+import asyncio
+import copy
+from pocketflow import Flow, AsyncFlow, AsyncNode
+from utils.retry_policy import get_retry_policy
 
 from nodes import (
+    GradeAnalytics,
     AssessStudentLevel,
+    AssessStudentLevelPerSubject,
     PrioritizeSubjects,
+    PrioritizeSubjectsByRules,
     KnowledgeToDiscover,
     FinalTeacherConclusion,
+    AsyncAssessStudentLevel,
+    AsyncAssessStudentLevelPerSubject,
+    AsyncPrioritizeSubjects,
+    AsyncPrioritizeSubjectsByRules,
+    AsyncKnowledgeToDiscover,
+    AsyncFinalTeacherConclusion,
 )
 
-def create_teacher_flow():
-    """Creates and returns the Teacher AI Agent flow."""
+# How PrioritizeSubjects ranks subjects:
+#   "llm"       - the LLM ranks and explains (one LLM call)
+#   "rules"     - ranked locally by rules, template reasoning (no LLM call)
+#   "rules+llm" - ranked locally, the LLM only writes the reasoning
+PRIORITY_MODES = ("llm", "rules", "rules+llm")
 
-    assess_student = AssessStudentLevel(max_retries=3, wait=10)
-    prioritize_subjects = PrioritizeSubjects(max_retries=3, wait=10)
-    knowledge_to_discover = KnowledgeToDiscover(max_retries=3, wait=10)
+
+def _check_priority_mode(priority):
+    if priority not in PRIORITY_MODES:
+        raise ValueError(f"Unknown priority mode '{priority}', expected one of {PRIORITY_MODES}")
+
+
+class _Checkpointed:
+    """
+    Mixin for PocketFlow flows: shared is checkpointed after every node that
+    has a successor (utils.checkpoint.Checkpoint), and a resumed run starts
+    at the node after the last completed one.
+    """
+
+    def __init__(self, start, checkpoint, options=None):
+        super().__init__(start=start)
+        self.checkpoint = checkpoint
+        self.options = options or {}
+
+    def _resume_at(self, path):
+        curr = self.start_node
+        for action in path:
+            curr = self.get_next_node(curr, action)
+        return copy.copy(curr), path
+
+    def _resume(self, shared):
+        """(first node to run, actions of the completed nodes)"""
+        return self._resume_at(self.checkpoint.restore(shared, self.options))
+
+    def _next(self, shared, curr, path):
+        nxt = self.get_next_node(curr, path[-1])
+        if nxt:
+            self.checkpoint.save(shared, path, type(curr).__name__)
+        else:
+            self.checkpoint.finish()
+        return copy.copy(nxt)
+
+
+class CheckpointedFlow(_Checkpointed, Flow):
+    def _orch(self, shared, params=None):
+        curr, path = self._resume(shared)
+        p = params or {**self.params}
+        while curr:
+            curr.set_params(p)
+            path.append(curr._run(shared))
+            curr = self._next(shared, curr, path)
+        return path[-1] if path else None
+
+
+class CheckpointedAsyncFlow(_Checkpointed, AsyncFlow):
+    # checkpoint reads and writes are SQLite I/O: keep them off the event loop
+    async def _resume(self, shared):
+        return self._resume_at(await asyncio.to_thread(self.checkpoint.restore, shared, self.options))
+
+    async def _next(self, shared, curr, path):
+        nxt = self.get_next_node(curr, path[-1])
+        if nxt:
+            await asyncio.to_thread(self.checkpoint.save, shared, path, type(curr).__name__)
+        else:
+            await asyncio.to_thread(self.checkpoint.finish)
+        return copy.copy(nxt)
+
+    async def _orch_async(self, shared, params=None):
+        curr, path = await self._resume(shared)
+        p = params or {**self.params}
+        while curr:
+            curr.set_params(p)
+            path.append(await curr._run_async(shared) if isinstance(curr, AsyncNode) else curr._run(shared))
+            curr = await self._next(shared, curr, path)
+        return path[-1] if path else None
+
+
+def create_teacher_flow(per_subject=False, priority="llm", checkpoint=None):
+    """
+    Creates and returns the Teacher AI Agent flow.
+    per_subject: assess every subject in its own parallel LLM call.
+    priority: one of PRIORITY_MODES.
+    checkpoint: utils.checkpoint.Checkpoint to save shared after each node
+    and resume an interrupted run (None: no checkpoints).
+    """
+    _check_priority_mode(priority)
+    retry_policy = get_retry_policy()  # backoff / Retry-After aware, see utils.retry_policy
+
+    if per_subject:
+        assess_student = AssessStudentLevelPerSubject(retry_policy=retry_policy)
+    else:
+        assess_student = AssessStudentLevel(retry_policy=retry_policy)
+    if priority == "llm":
+        prioritize_subjects = PrioritizeSubjects(retry_policy=retry_policy)
+    else:
+        prioritize_subjects = PrioritizeSubjectsByRules(
+            explain=(priority == "rules+llm"), retry_policy=retry_policy.with_attempts(2))
+    knowledge_to_discover = KnowledgeToDiscover(retry_policy=retry_policy)
     final_conclusion = FinalTeacherConclusion()
 
+    grade_analytics = GradeAnalytics()
+
+    # Connect nodes
+    grade_analytics >> assess_student
+    assess_student >> prioritize_subjects
+    prioritize_subjects >> knowledge_to_discover
+    knowledge_to_discover >> final_conclusion
+
+    # Create flow
+    if checkpoint is not None:
+        options = {"per_subject": per_subject, "priority": priority}
+        return CheckpointedFlow(grade_analytics, checkpoint, options)
+    teacher_flow = Flow(start=grade_analytics)
+
+    return teacher_flow
+
+
+def create_async_teacher_flow(per_subject=False, priority="llm", checkpoint=None):
+    """
+    Creates the asyncio version of the Teacher AI Agent flow.
+    Run it with `await flow.run_async(shared)`; many flows can share one event loop.
+    Arguments as for create_teacher_flow.
+    """
+    _check_priority_mode(priority)
+    retry_policy = get_retry_policy()  # backoff / Retry-After aware, see utils.retry_policy
+
+    if per_subject:
+        assess_student = AsyncAssessStudentLevelPerSubject(retry_policy=retry_policy)
+    else:
+        assess_student = AsyncAssessStudentLevel(retry_policy=retry_policy)
+    if priority == "llm":
+        prioritize_subjects = AsyncPrioritizeSubjects(retry_policy=retry_policy)
+    else:
+        prioritize_subjects = AsyncPrioritizeSubjectsByRules(
+            explain=(priority == "rules+llm"), retry_policy=retry_policy.with_attempts(2))
+    knowledge_to_discover = AsyncKnowledgeToDiscover(retry_policy=retry_policy)
+    final_conclusion = AsyncFinalTeacherConclusion()
+
+    grade_analytics = GradeAnalytics()
+
     # Connect nodes
+    grade_analytics >> assess_student
     assess_student >> prioritize_subjects
     prioritize_subjects >> knowledge_to_discover
     knowledge_to_discover >> final_conclusion
 
     # Create flow
-    teacher_flow = Flow(start=assess_student)
+    if checkpoint is not None:
+        options = {"per_subject": per_subject, "priority": priority}
+        return CheckpointedAsyncFlow(grade_analytics, checkpoint, options)
+    teacher_flow = AsyncFlow(start=grade_analytics)
 
     return teacher_flow
@@ -0,0 +1,255 @@
+"""
+Background report generation through a durable job queue (utils.job_queue).
+
+    python jobs.py enqueue --all --priority 5          # or --students FILE / --class N
+    python jobs.py work --threads 8 --processes 2      # lease jobs and run the teacher flow
+    python jobs.py work --exit-when-empty              # nightly run: drain the queue, then exit
+    python jobs.py stats
+    python jobs.py requeue-dead
+
+Jobs survive crashes: a job whose worker died is leased again after
+--visibility-timeout, a failed job is retried with backoff and dead-lettered
+after --max-attempts; a retried job resumes after the last node its previous
+attempt completed (utils.checkpoint). Workers lease the next job as soon as
+one finishes, so threads x processes flows keep the LLM quota busy; the
+shared rate limiter (utils.rate_limit) keeps them under it.
+"""
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+import multiprocessing
+
+import dotenv
+
+from db import get_database
+from flow import create_teacher_flow, PRIORITY_MODES
+from main import build_shared, class_analytics, select_students
+from utils.job_queue import get_job_queue
+from utils.checkpoint import Checkpoint
+
+
+class _ClassAnalytics:
+    """Cohort analytics per class, computed once per worker process."""
+
+    def __init__(self, db):
+        self.db = db
+        self._by_class = {}
+        self._lock = threading.Lock()
+
+    def get(self, student_class, login):
+        with self._lock:
+            analytics = self._by_class.get(student_class)
+            if analytics is None:
+                analytics = self._by_class[student_class] = class_analytics(self.db, student_class)
+        return analytics.get(login)
+
+
+class _Heartbeat:
+    """Extends the leases of the jobs running in this process."""
+
+    def __init__(self, queue, visibility_timeout):
+        self.queue = queue
+        self.visibility_timeout = visibility_timeout
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name="job-heartbeat", daemon=True).start()
+
+    def add(self, job):
+        with self._lock:
+            self.jobs[job.id] = job
+
+    def remove(self, job):
+        with self._lock:
+            self.jobs.pop(job.id, None)
+
+    def _run(self):
+        while not self._stop.wait(self.visibility_timeout / 3):
+            with self._lock:
+                jobs = list(self.jobs.values())
+            for job in jobs:
+                if not self.queue.heartbeat(job, self.visibility_timeout):
+                    print(f"⚠️  Lost the lease of job {job.id} ({job.student_id})")
+
+
+class StudentNotFoundError(ValueError):
+    """The job's student is not in the database; retrying won't add them."""
+
+    retryable = False
+
+
+def run_job(job, queue, db, analytics, args, worker):
+    started = time.monotonic()
+    try:
+        student_data = db.get(job.student_id)
+        if not student_data:
+            raise StudentNotFoundError(f"Student '{job.student_id}' not found in database")
+        shared = build_shared(job.student_id, student_data, args, analytics.get(student_data["Class"], job.student_id))
+        run_id = f"job-{job.id}"
+        checkpoint = None if args.no_checkpoint else Checkpoint(job.student_id, run_id, resume_from=run_id)
+        create_teacher_flow(per_subject=args.per_subject, priority=args.priority_mode, checkpoint=checkpoint).run(shared)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        # LLM errors tell whether a retry can help (4xx, truncated answers can't)
+        status = queue.fail(job, error, args.retry_delay, retry=getattr(e, "retryable", True))
+        label = {"dead": "dead-lettered", "queued": "will retry"}.get(status, "lease lost")
+        print(f"❌ [{worker}] {job.student_id} attempt {job.attempts}/{job.max_attempts} failed ({label}): {error}")
+        return
+    seconds = round(time.monotonic() - started, 2)
+    if queue.complete(job, {"html_file": shared.get("teacher_conclusion_html"), "seconds": seconds}):
+        print(f"✅ [{worker}] {job.student_id} ({seconds}s)")
+    else:
+        print(f"⚠️  [{worker}] {job.student_id} finished after its lease was lost ({seconds}s)")
+
+
+def _worker_thread(worker, queue, db, analytics, heartbeat, args, stop):
+    while not stop.is_set():
+        job = queue.lease(worker, args.visibility_timeout)
+        if job is None:
+            if args.exit_when_empty and queue.pending() == 0:
+                return
+            stop.wait(args.poll)
+            continue
+        if stop.is_set():
+            queue.release(job)
+            return
+        heartbeat.add(job)
+        try:
+            run_job(job, queue, db, analytics, args, worker)
+        finally:
+            heartbeat.remove(job)
+
+
+def run_workers(args, process_index=0):
+    """args.threads worker threads in this process, until stopped (or the queue is empty)."""
+    queue = get_job_queue(args.queue)
+    db = get_database(args.db)
+    analytics = _ClassAnalytics(db)
+    heartbeat = _Heartbeat(queue, args.visibility_timeout)
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if not stop.is_set():
+            print(f"🛑 Stopping after the running jobs (signal {signum})...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(
+            target=_worker_thread,
+            args=(f"{prefix}:{process_index}.{i}", queue, db, analytics, heartbeat, args, stop),
+            name=f"job-worker-{i}",
+        )
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    # join with a timeout, so the main thread keeps handling signals
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=0.5)
+
+
+def cmd_work(args):
+    print(f"👷 {args.processes} process(es) x {args.threads} thread(s) working on {args.queue}")
+    if args.processes <= 1:
+        run_workers(args)
+    else:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=run_workers, args=(args, i)) for i in range(args.processes)]
+        for process in processes:
+            process.start()
+
+        def forward(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signum)
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, lambda signum, frame: None)  # children get Ctrl+C themselves
+        for process in processes:
+            process.join()
+    print(f"📋 Queue: {get_job_queue(args.queue).stats()}")
+
+
+def cmd_enqueue(args):
+    db = get_database(args.db)
+    if args.student_ids:
+        logins = args.student_ids
+    elif args.all or args.students or args.student_class is not None:
+        logins = select_students(db, args)
+    else:
+        raise SystemExit("Give student IDs, --all, --students FILE or --class N")
+    added = get_job_queue(args.queue).enqueue(logins, priority=args.priority, max_attempts=args.max_attempts)
+    print(f"📥 Queued {added} of {len(logins)} students (priority {args.priority}); "
+          f"{len(logins) - added} already queued")
+
+
+def cmd_stats(args):
+    queue = get_job_queue(args.queue)
+    print(f"📋 Queue {args.queue}: {queue.stats()}")
+    for job_id, student_id, attempts, error in queue.dead_jobs():
+        print(f"  💀 job {job_id} {student_id} after {attempts} attempts: {error}")
+
+
+def cmd_requeue_dead(args):
+    print(f"♻️  Requeued {get_job_queue(args.queue).requeue_dead()} dead jobs")
+
+
+def cmd_purge(args):
+    print(f"🧹 Removed {get_job_queue(args.queue).purge_done(args.older_than * 3600)} finished jobs")
+
+
+def main():
+    dotenv.load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Durable job queue for teacher report generation.")
+    parser.add_argument("--queue", default=os.getenv("JOB_QUEUE_PATH", "jobs.db"), help="SQLite queue file")
+    parser.add_argument("--db", default=None,
+                        help="SQLite student database (default: STUDENT_DB_PATH or the built-in sample data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue report jobs")
+    enqueue.add_argument("student_ids", nargs="*", help="Student IDs (default: --all / --students / --class)")
+    enqueue.add_argument("--all", action="store_true", help="Every student in the database")
+    enqueue.add_argument("--students", help="File with one student ID per line")
+    enqueue.add_argument("--class", dest="student_class", type=int, default=None, help="Only this class")
+    enqueue.add_argument("--priority", type=int, default=0, help="Higher runs first")
+    enqueue.add_argument("--max-attempts", type=int, default=3, help="Attempts before a job is dead-lettered")
+    enqueue.set_defaults(handler=cmd_enqueue)
+
+    work = commands.add_parser("work", help="Run workers that lease jobs and generate reports")
+    work.add_argument("--threads", type=int, default=8, help="Worker threads per process")
+    work.add_argument("--processes", type=int, default=1, help="Worker processes")
+    work.add_argument("--visibility-timeout", type=float, default=600,
+                      help="Seconds a leased job stays hidden; extended while the worker is alive")
+    work.add_argument("--retry-delay", type=float, default=60, help="Backoff base for failed jobs (seconds)")
+    work.add_argument("--poll", type=float, default=2, help="Seconds between polls of an empty queue")
+    work.add_argument("--exit-when-empty", action="store_true", help="Exit once no job is queued or running")
+    work.add_argument("--output-dir", default="output", help="Directory for generated reports")
+    work.add_argument("--no-cache", action="store_true", help="Disable LLM response caching")
+    work.add_argument("--no-checkpoint", action="store_true", help="Retries start over instead of resuming")
+    work.add_argument("--per-subject", action="store_true", help="Assess each subject in its own LLM call")
+    work.add_argument("--priority-mode", choices=PRIORITY_MODES, default="llm", help="How subjects are ranked")
+    work.add_argument("--max-subjects", type=int, default=10, help="Maximum number of subjects to assess")
+    work.add_argument("--max-topics", type=int, default=10, help="Maximum number of learning topics")
+    work.set_defaults(handler=cmd_work, stream=False)
+
+    commands.add_parser("stats", help="Job counts and recent dead jobs").set_defaults(handler=cmd_stats)
+    commands.add_parser("requeue-dead", help="Retry dead-lettered jobs").set_defaults(handler=cmd_requeue_dead)
+    purge = commands.add_parser("purge", help="Delete finished jobs")
+    purge.add_argument("--older-than", type=float, default=24, help="Hours")
+    purge.set_defaults(handler=cmd_purge)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,282 @@
+import os
+import json
+import time
+import asyncio
 import dotenv
 import argparse
-from db import Database
-from flow import create_teacher_flow
+from db import get_database
+from flow import create_teacher_flow, create_async_teacher_flow, PRIORITY_MODES
+from utils.grade_analytics import CohortAnalytics
+from utils.metrics import get_metrics, write_prometheus
+from utils.llm_cache import get_cache_stats
+from utils.node_store import get_node_store, stage_fingerprint
+from utils.call_llm import get_single_flight_stats
+from utils.report_writer import ARCHIVE_NAME, INDEX_NAME, ReportBundle, index_page, write_if_changed
+from utils.checkpoint import LATEST, Checkpoint, new_run_id
 
-dotenv.load_dotenv()
+
+def build_shared(student_id, student_data, args, grade_analytics=None, report_bundle=None):
+    """Shared state for PocketFlow"""
+    shared = {
+        "student_id": student_id,
+        "student_data": student_data,
+        "use_cache": not args.no_cache,
+        "max_subjects": args.max_subjects,
+        "max_topics": args.max_topics,
+        "output_dir": args.output_dir,
+        "stream": args.stream,
+    }
+    if grade_analytics is not None:
+        shared["grade_analytics"] = grade_analytics
+    if report_bundle is not None:
+        shared["report_bundle"] = report_bundle
+    return shared
+
+
+def make_checkpoint(student_id, args):
+    """Checkpoint of one student's flow in this run (None with --no-checkpoint)."""
+    if args.no_checkpoint:
+        return None
+    return Checkpoint(student_id, args.run_id, resume_from=args.resume)
+
+
+def precompute_analytics(students):
+    """
+    Grade analytics for a whole cohort in one vectorized pass, from streamed
+    (login, student) pairs; the records themselves are not kept.
+    """
+    return CohortAnalytics.from_students(students)
+
+
+def class_analytics(db, student_class):
+    """Grade analytics of one class (percentiles are relative to the class)."""
+    return precompute_analytics(db.iter_students(student_class=student_class))
+
+
+def student_analytics(db, student_id, student_class):
+    """
+    Grade analytics of one student relative to the class. They are kept in
+    the node store under the class data version (db.class_version): the class
+    is scanned once per version, a repeated run is a single lookup.
+    """
+    version = db.class_version(student_class)
+    if version is None:
+        return class_analytics(db, student_class).get(student_id)
+
+    def key(login):
+        return stage_fingerprint("class_analytics:v1", {"class": student_class, "version": version, "student": login})
+
+    store = get_node_store()
+    analytics = store.get(key(student_id))
+    if analytics is None:
+        cohort = class_analytics(db, student_class)
+        for login in cohort.logins():
+            store.set(key(login), cohort.get(login))
+        analytics = cohort.get(student_id)
+    return analytics
+
+
+def report_metrics(args, final=True):
+    """Write the Prometheus file (--metrics-file) and print the JSON run summary (--metrics)."""
+    if args.metrics_file:
+        write_prometheus(args.metrics_file)
+    if final and args.metrics:
+        summary = get_metrics().summary()
+        summary["cache"] = get_cache_stats()
+        summary["single_flight"] = get_single_flight_stats()
+        print("\n📊 Run metrics:")
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+def iter_cohort(db, args):
+    """
+    (login, student) pairs of a batch (--all, --students FILE, --class N),
+    streamed from the database. With --students, logins that are not in the
+    database are kept (student None) so the batch records them as failed.
+    """
+    if not args.students:
+        yield from db.iter_students(student_class=args.student_class)
+        return
+    with open(args.students, "r", encoding="utf-8") as f:
+        for line in f:
+            login = line.strip()
+            if not login or login.startswith("#"):
+                continue
+            student = db.get(login)
+            if student is None:
+                if args.student_class is None:
+                    yield login, None
+            elif args.student_class is None or student["Class"] == args.student_class:
+                yield login, student
+
+
+def select_students(db, args):
+    """Logins to process in batch mode (--all, --students FILE, --class N)."""
+    if args.students:
+        with open(args.students, "r", encoding="utf-8") as f:
+            logins = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        logins = db.list_logins()
+    if args.student_class is not None:
+        allowed = set(db.list_logins(student_class=args.student_class))
+        logins = [login for login in logins if login in allowed]
+    return logins
+
+
+async def run_batch(db, cohort, args):
+    """
+    Run the async teacher flow for every student of the cohort
+    (CohortAnalytics, see precompute_analytics) with args.concurrency worker
+    tasks; each student record is fetched when its turn comes, so memory
+    does not grow with the cohort. A failed student is recorded in the
+    manifest (one JSON line per student) and does not stop the batch.
+    Reports are listed in <output-dir>/index.html, or with args.archive all
+    go into one zip archive (with its own index.html).
+    """
+    total = len(cohort)
+    started = time.monotonic()
+    progress = {"done": 0, "failed": 0}
+    bundle = ReportBundle(os.path.join(args.output_dir, ARCHIVE_NAME)) if args.archive else None
+
+    manifest_path = args.manifest or os.path.join(args.output_dir, "batch_manifest.jsonl")
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+
+    with open(manifest_path, "w", encoding="utf-8") as manifest:
+
+        async def run_one(login):
+            record = {"student_id": login}
+            student_started = time.monotonic()
+            try:
+                student_data = db.get(login)
+                if not student_data:
+                    raise ValueError(f"Student '{login}' not found in database")
+                shared = build_shared(login, student_data, args, cohort.get(login), bundle)
+                checkpoint = make_checkpoint(login, args)
+                await create_async_teacher_flow(
+                    per_subject=args.per_subject, priority=args.priority, checkpoint=checkpoint
+                ).run_async(shared)
+                record["status"] = "ok"
+                record["html_file"] = shared.get("teacher_conclusion_html")
+            except Exception as e:
+                progress["failed"] += 1
+                record["status"] = "failed"
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["seconds"] = round(time.monotonic() - student_started, 2)
+
+            progress["done"] += 1
+            manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+            manifest.flush()
+            report_metrics(args, final=False)  # keep the metrics file current during the batch
+
+            done = progress["done"]
+            elapsed = time.monotonic() - started
+            eta = elapsed / done * (total - done)
+            status = "✅" if record["status"] == "ok" else "❌"
+            print(
+                f"{status} [{done}/{total}] {login} "
+                f"({record['seconds']}s, failed: {progress['failed']}, "
+                f"elapsed: {elapsed:.0f}s, ETA: {eta:.0f}s)"
+            )
+
+        # A fixed pool of workers takes the logins one by one from a shared
+        # iterator, instead of one coroutine per student up front
+        logins = cohort.logins()
+
+        async def worker():
+            for login in logins:
+                await run_one(login)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(args.concurrency, total)))))
+
+    # The index is built from the manifest, not from records kept in memory
+    records = _read_manifest(manifest_path)
+
+    if bundle is not None:
+        bundle.close(records)
+        reports = bundle.path
+    else:
+        reports = os.path.join(args.output_dir, INDEX_NAME)
+        write_if_changed(reports, index_page(records))
+
+    elapsed = time.monotonic() - started
+    print("\n" + "=" * 60)
+    print(f"Batch finished: {total - progress['failed']}/{total} succeeded, "
+          f"{progress['failed']} failed in {elapsed:.1f}s")
+    print(f"Manifest: {manifest_path}")
+    print(f"Reports: {reports}")
+    if progress["failed"] and not args.no_checkpoint:
+        print("Resume the failed students after their last completed step with --resume")
+    print("=" * 60)
+    return progress["failed"]
+
+
+def _read_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
 
 
 def main():
+    dotenv.load_dotenv()  # at startup of the CLI, not on import (bench/ imports run_batch)
+
     parser = argparse.ArgumentParser(
         description="Generate personalized teacher feedback for a student."
     )
 
-    parser.add_argument(
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
         "--student-id",
-        required=True,
         help="Student ID in the database (e.g. student_001)"
     )
+    target.add_argument(
+        "--all",
+        action="store_true",
+        help="Batch mode: generate feedback for every student in the database"
+    )
+    target.add_argument(
+        "--students",
+        help="Batch mode: file with one student ID per line"
+    )
+
+    parser.add_argument(
+        "--class",
+        dest="student_class",
+        type=int,
+        default=None,
+        help="Batch mode: only students of this class (e.g. 9)"
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Batch mode: maximum number of students processed at once"
+    )
+
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Batch mode: path of the per-student JSONL manifest "
+             "(default: <output-dir>/batch_manifest.jsonl)"
+    )
+
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help=f"Batch mode: write all reports into one zip archive (<output-dir>/{ARCHIVE_NAME}) "
+             "instead of one HTML file per student"
+    )
+
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="SQLite student database (default: STUDENT_DB_PATH or the built-in sample data)"
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        default="output",
+        help="Directory for generated reports"
+    )
 
     parser.add_argument(
         "--no-cache",
@@ -23,6 +284,62 @@ def main():
         help="Disable LLM response caching (default: enabled)"
     )
 
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the final conclusion: each rendered block is appended to <report>.partial "
+             "as it arrives, and the finished page replaces the report"
+    )
+
+    parser.add_argument(
+        "--per-subject",
+        action="store_true",
+        help="Assess each subject in its own parallel LLM call (cached per subject)"
+    )
+
+    parser.add_argument(
+        "--priority",
+        choices=PRIORITY_MODES,
+        default="llm",
+        help="How subjects are ranked: by the LLM, by local rules, "
+             "or by local rules with LLM-written reasoning"
+    )
+
+    parser.add_argument(
+        "--run-id",
+        default=None,
+        help="ID under which this run's checkpoints are saved (default: a new one, printed at start)"
+    )
+
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const=LATEST,
+        default=None,
+        metavar="RUN_ID",
+        help="Continue an interrupted run after its last completed node: the given run, "
+             "or each student's latest checkpoint"
+    )
+
+    parser.add_argument(
+        "--no-checkpoint",
+        action="store_true",
+        help="Do not checkpoint the flow after each node (checkpoints: CHECKPOINT_PATH, default checkpoints.db)"
+    )
+
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Print a JSON summary of node timings, LLM latency, tokens and cache hits at the end"
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        default=os.getenv("METRICS_FILE"),
+        help="Write metrics in Prometheus text format to this file "
+             "(e.g. for the node_exporter textfile collector; default: METRICS_FILE)"
+    )
+
     parser.add_argument(
         "--max-subjects",
         type=int,
@@ -38,34 +355,52 @@ def main():
     )
 
     args = parser.parse_args()
+    args.run_id = args.run_id or new_run_id()
 
     # Load student data
-    db = Database()
+    db = get_database(args.db)
+
+    if not args.student_id:
+        cohort = precompute_analytics(iter_cohort(db, args))
+        print(f"🎓 Generating teacher feedback for {len(cohort)} students "
+              f"(concurrency: {args.concurrency})")
+        print(f"LLM caching: {'Disabled' if args.no_cache else 'Enabled'}")
+        if not args.no_checkpoint:
+            print(f"Run ID: {args.run_id}")
+        failed = asyncio.run(run_batch(db, cohort, args))
+        report_metrics(args)
+        raise SystemExit(1 if failed else 0)
+
     student_data = db.get(args.student_id)
 
     if not student_data:
         raise ValueError(f"Student '{args.student_id}' not found in database")
 
-    # Shared state for PocketFlow
-    shared = {
-        "student_data": student_data,
-        "use_cache": not args.no_cache,
-        "max_subjects": args.max_subjects,
-        "max_topics": args.max_topics,
-    }
+    # Percentiles are relative to the student's class
+    analytics = student_analytics(db, args.student_id, student_data["Class"])
+    shared = build_shared(args.student_id, student_data, args, analytics)
 
     print(f"🎓 Generating teacher feedback for: {student_data.get('Full Name')}")
     print(f"LLM caching: {'Disabled' if args.no_cache else 'Enabled'}")
 
     # Create and run flow
-    teacher_flow = create_teacher_flow()
-    teacher_flow.run(shared)
+    checkpoint = make_checkpoint(args.student_id, args)
+    teacher_flow = create_teacher_flow(per_subject=args.per_subject, priority=args.priority, checkpoint=checkpoint)
+    try:
+        teacher_flow.run(shared)
+    except Exception:
+        if checkpoint is not None:
+            print(f"\n💾 Progress is checkpointed; continue after the last completed step with: "
+                  f"python main.py --student-id {args.student_id} --resume {checkpoint.run_id}")
+        raise
 
     # Output result
     print("\n" + "=" * 60)
     print(shared["teacher_conclusion"])
     print("=" * 60)
 
+    report_metrics(args)
+
 
 if __name__ == "__main__":
     main()
@@ -1,41 +1,241 @@
 import os
-import re
-import yaml
-from pocketflow import Node, BatchNode
-from utils.call_llm import call_llm
-from db import Database
-import markdown
-from IPython.display import display, HTML
+import copy
+import time
+import asyncio
+import contextvars
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pocketflow import Node, BatchNode, AsyncNode
+from utils.call_llm import call_llm, acall_llm, stream_llm, astream_llm, get_llm_model
+from utils.markdown_stream import MarkdownBlockSplitter, render_markdown
+from utils.report_writer import ReportWriter, StreamingReportFile, get_report_writer, report_file_name
+from utils.node_store import get_node_store, stage_fingerprint
+from utils.grade_analytics import compute_cohort_analytics, format_analytics
+from utils.priority_rules import rank_subjects
+from utils.prompt_format import (
+    YAML_STOP, compact, to_yaml, unwrap, fit_yaml, fit_sections, get_input_budget, get_max_tokens,
+    estimate_tokens, shorten,
+)
+from utils.structured_output import (
+    OutputSpec, MissingFieldsError, parse_structured, repair_prompt, apply_repair,
+)
+from utils.retry_policy import RetryPolicy
+from utils.metrics import NodeRun, record_retry
+
+
+
+
+# Measured stages - prep / exec / post timed for every node run (utils.metrics)
+# --------------------------------------------------------
+class _MeasuredStage:
+    """
+    Mixin: runs prep / exec / post itself so every phase is timed; LLM calls
+    made during the run are attributed to the node. _exec_stage is the exec
+    step (the result store lookup of _StoredStage hooks in there).
+    """
+
+    def _node_name(self):
+        return type(self).__name__.removeprefix("Async")
+
+    def _exec_stage(self, shared, prep_res, run):
+        return self._exec(prep_res)
+
+    def _run(self, shared):
+        with NodeRun(self._node_name()) as run:
+            with run.phase("prep"):
+                prep_res = self.prep(shared)
+            with run.phase("exec"):
+                exec_res = self._exec_stage(shared, prep_res, run)
+            with run.phase("post"):
+                return self.post(shared, prep_res, exec_res)
+
+
+# Stored stages - skip a node whose semantic inputs were already processed
+# --------------------------------------------------------
+class _StoredStage(_MeasuredStage, ABC):
+    """
+    Mixin: results are saved in the node result store under a fingerprint of
+    the node's inputs (see _fingerprint). When shared["use_cache"] is on and the
+    fingerprint is known, exec is skipped and the stored result goes to post.
+    Bump result_version when the prompt or the parsing of a node changes.
+    Failed attempts are retried according to retry_policy (utils.retry_policy);
+    without one, max_retries / wait behave like PocketFlow's fixed wait.
+    """
+
+    result_version = 3
+    use_store = True
+    stop = YAML_STOP  # LLM stop sequences (None for free text)
+    spec = None  # OutputSpec of the YAML answer (utils.structured_output)
+
+    def __init__(self, *args, retry_policy=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_policy = retry_policy
+
+    @abstractmethod
+    def _fingerprint(self, prep_res):
+        """JSON-serializable inputs that fully determine the output."""
+
+    def _retry_policy(self):
+        return self.retry_policy or RetryPolicy.fixed(self.max_retries, self.wait)
+
+    def _retry_delay(self, error):
+        """Seconds to wait before the next attempt, or None to give up."""
+        delay = self._retry_policy().delay(self.cur_retry, error)
+        if delay is not None:
+            record_retry(self._node_name())
+            print(f"{self._node_name()} attempt {self.cur_retry + 1} failed ({error}), retrying in {delay:.1f}s...")
+        return delay
+
+    def _exec(self, prep_res):
+        self.cur_retry = 0
+        while True:
+            try:
+                return self.exec(prep_res)
+            except Exception as e:
+                delay = self._retry_delay(e)
+                if delay is None:
+                    return self.exec_fallback(prep_res, e)
+                time.sleep(delay)
+                self.cur_retry += 1
+
+    def _input_budget(self):
+        return get_input_budget(self._node_name())
+
+    def _llm_options(self):
+        """max_tokens / stop for call_llm (see utils.prompt_format.TOKEN_BUDGETS)."""
+        return {"max_tokens": get_max_tokens(self._node_name()), "stop": self.stop}
+
+    def _structured(self, response, use_cache):
+        """
+        Parse the YAML answer with local repairs. If required fields are still
+        missing, only those are asked for in a small follow-up call instead of
+        regenerating the whole answer.
+        """
+        try:
+            return parse_structured(response, self.spec)
+        except MissingFieldsError as e:
+            print(f"{e} - asking for the missing fields only...")
+            return apply_repair(e, call_llm(repair_prompt(e), use_cache=use_cache, stop=YAML_STOP))
+
+    def _stage_key(self, prep_res):
+        stage = f"{self._node_name()}:v{self.result_version}"
+        return stage_fingerprint(stage, self._fingerprint(prep_res), get_llm_model())
+
+    def _load_result(self, key, prep_res):
+        return get_node_store().get(key)
+
+    def _lookup(self, shared, prep_res, run):
+        """(store key, stored result or None); the key is None when the store is off."""
+        if not self.use_store:
+            return None, None
+        key = self._stage_key(prep_res)
+        exec_res = self._load_result(key, prep_res) if shared.get("use_cache", True) else None
+        if exec_res is not None:
+            run.store_hit()
+        return key, exec_res
+
+    def _store(self, key, exec_res):
+        if key is not None:
+            get_node_store().set(key, exec_res)
+
+    def _exec_stage(self, shared, prep_res, run):
+        key, exec_res = self._lookup(shared, prep_res, run)
+        if exec_res is None:
+            exec_res = self._exec(prep_res)
+            self._store(key, exec_res)
+        return exec_res
+
+
+
+
+# Node 0 - GradeAnalytics - deterministic grade statistics (no LLM)
+# --------------------------------------------------------
+class GradeAnalytics(_MeasuredStage, Node):
+    """
+    Node: GradeAnalytics
+    Purpose: Per-subject mean, median, trend, variance, failing marks and
+    cohort percentile, fed to AssessStudentLevel instead of raw mark lists.
+    Cohort runs precompute shared["grade_analytics"] for everyone at once
+    (utils.grade_analytics.compute_cohort_analytics); otherwise the student
+    is analysed alone.
+    """
+
+    def prep(self, shared):
+        return shared.get("grade_analytics"), shared["student_data"]
+
+    def exec(self, prep_res):
+        analytics, student_data = prep_res
+        if analytics is not None:
+            return analytics
+        return compute_cohort_analytics({"student": student_data})["student"]
+
+    def post(self, shared, prep_res, exec_res):
+        shared["grade_analytics"] = exec_res
 
 
 
 
 # Node 1 - AppriseStudentGrades - Results of person
 # --------------------------------------------------------
-class AssessStudentLevel(Node):
+class AssessStudentLevel(_StoredStage, Node):
     """
     Node: AssessStudentLevel
     Purpose: Evaluate student's knowledge across subjects
     and generate a structured profile.
     """
 
+    spec = OutputSpec("student_profile", required=("name", "level"), id_field="name", items_key="subjects")
+
     def prep(self, shared):
         student_data = shared["student_data"]  # dict from Database['data']
         use_cache = shared.get("use_cache", True)
         max_subjects = shared.get("max_subjects", 10)
-        return student_data, use_cache, max_subjects
+        analytics = shared.get("grade_analytics")
+        return student_data, use_cache, max_subjects, analytics
 
     def exec(self, prep_res):
-        student_data, use_cache, max_subjects = prep_res
+        student_data, use_cache, max_subjects, analytics = prep_res
         print(f"Assessing knowledge level for {student_data.get('Full Name', 'Unknown')}...")
-
-        prompt = f"""
+        use_cache = use_cache and self.cur_retry == 0
+        response = call_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._parse(self._structured(response, use_cache))
+
+    def _fingerprint(self, prep_res):
+        student_data, use_cache, max_subjects, analytics = prep_res
+        return {"student_data": student_data, "max_subjects": max_subjects, "analytics": analytics}
+
+    def _student_block(self, student_data, analytics, max_subjects, budget=None):
+        # max_subjects is a real cap: later subjects never reach the prompt
+        subjects = list(student_data.get("Marks", {}))[:max_subjects]
+
+        def render(bio):
+            if not analytics:
+                data = dict(student_data, Bio=bio, Marks={name: student_data["Marks"][name] for name in subjects})
+                return to_yaml(compact(data))
+            # Precomputed statistics replace the raw mark lists
+            return (
+                f"Full Name: {student_data.get('Full Name')}\n"
+                f"Class: {student_data.get('Class')}\n"
+                f"Bio: {bio}\n"
+                f"Grade statistics per subject (computed from all marks):\n"
+                f"{format_analytics({name: analytics[name] for name in subjects if name in analytics})}"
+            )
+
+        block = render(student_data.get("Bio"))
+        if budget and estimate_tokens(block) > budget:
+            # Over the input budget only the biography is shortened; marks and statistics stay complete
+            block = render(shorten(student_data.get("Bio"), budget - estimate_tokens(render(""))))
+        return block
+
+    def _prompt(self, prep_res):
+        student_data, use_cache, max_subjects, analytics = prep_res
+        return f"""
 You are an experienced school teacher AI. The data you received 
  contains school grades for subjects (highest score is 5), class number,
  and student biography.
 
 Student Data:
-{student_data}
+{self._student_block(student_data, analytics, max_subjects, self._input_budget())}
 
 For EACH subject (up to {max_subjects}):
 1. Assign a knowledge level: Very Low, Average, Above Average, High.
@@ -57,17 +257,8 @@ student_profile:
         - ""
 ```"""
 
-        response = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0))
-
-        # --- Extract YAML safely ---
-        match = re.search(r"```yaml(.*?)```", response, re.DOTALL)
-        if not match:
-            raise ValueError("No YAML block found in LLM output")
-        yaml_str = match.group(1).strip()
-
-        profile = yaml.safe_load(yaml_str)
-        if "student_profile" not in profile:
-            raise ValueError("Missing 'student_profile' key in LLM output.")
+    def _parse(self, profile):
+        # Shape and required fields are checked by self.spec
         return profile
 
     def post(self, shared, prep_res, exec_res):
@@ -77,15 +268,117 @@ student_profile:
 
 
 
+# Node 1 (per-subject variant) - one small LLM call per subject
+# --------------------------------------------------------
+class AssessStudentLevelPerSubject(_StoredStage, BatchNode):
+    """
+    Node: AssessStudentLevelPerSubject
+    Purpose: Same result as AssessStudentLevel, but every subject is assessed
+    in its own small prompt and the calls run in parallel threads.
+    The prompt only holds that subject's marks, the class and the bio, so the
+    LLM cache is effectively keyed per subject: when one grade changes, only
+    that subject is regenerated.
+    """
+
+    max_workers = 8
+
+    def prep(self, shared):
+        student_data = shared["student_data"]
+        use_cache = shared.get("use_cache", True)
+        max_subjects = shared.get("max_subjects", 10)
+        print(f"Assessing knowledge level for {student_data.get('Full Name', 'Unknown')} (per subject)...")
+        analytics = shared.get("grade_analytics") or {}
+        subjects = list(student_data["Marks"].items())[:max_subjects]
+        return [
+            (subject, marks, student_data.get("Class"), student_data.get("Bio", ""),
+             analytics.get(subject), use_cache)
+            for subject, marks in subjects
+        ]
+
+    def _exec(self, items):
+        # Each item runs on its own copy of the node, so retries (cur_retry) don't interfere,
+        # and in a copy of the caller's context, so its LLM calls are attributed to this node
+        jobs = [(contextvars.copy_context(), copy.copy(self), item) for item in items or []]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda job: job[0].run(_StoredStage._exec, job[1], job[2]), jobs))
+
+    spec = OutputSpec("subject", required=("level",), single=True)
+
+    def exec(self, item):
+        subject, marks, student_class, bio, stats, use_cache = item
+        use_cache = use_cache and self.cur_retry == 0
+        response = call_llm(self._prompt(item), use_cache=use_cache, **self._llm_options())
+        return self._parse(self._structured(response, use_cache), subject)
+
+    def _fingerprint(self, prep_res):
+        # Everything that reaches the prompt: no use_cache, no cohort percentile
+        return [
+            (subject, marks, student_class, bio,
+             {k: v for k, v in (stats or {}).items() if k != "percentile"})
+            for subject, marks, student_class, bio, stats, use_cache in prep_res
+        ]
+
+    def _prompt(self, item):
+        subject, marks, student_class, bio, stats, use_cache = item
+        # The cohort percentile is left out: it changes with the cohort and
+        # would invalidate the per-subject cache entry of unchanged marks
+        stats_line = format_analytics({subject: stats}, include_percentile=False) if stats else ""
+        budget = self._input_budget()
+        if budget:
+            # Over the input budget only the biography is shortened
+            bio = shorten(bio, budget - estimate_tokens(f"{student_class}{subject}{marks}{stats_line}"))
+        return f"""
+You are an experienced school teacher AI. Assess ONE school subject of a student.
+Grades are on a 5-point scale (highest score is 5).
+
+Class: {student_class}
+Student biography: {bio}
+Subject: {subject}
+Marks: {marks}
+{stats_line}
+
+1. Assign a knowledge level: Very Low, Average, Above Average, High.
+2. Provide reasoning in 1-3 sentences.
+3. Identify main strengths and gaps.
+
+Output STRICTLY in YAML format:
+
+```yaml
+subject:
+  name: "{subject}"
+  level: ""
+  reasoning: |
+    ...
+  strengths:
+    - ""
+  gaps:
+    - ""
+```"""
+
+    def _parse(self, data, subject):
+        assessment = data["subject"]
+        assessment["name"] = subject  # keep the database name, whatever the model wrote
+        return assessment
+
+    def post(self, shared, prep_res, exec_res):
+        # Same structure as AssessStudentLevel produces
+        shared["student_profile"] = {"student_profile": {"subjects": list(exec_res)}}
+        print("Student profile stored in shared['student_profile'].")
+
+
+
+
 # Node 2 - PrioritizeSubjects - Generate learning priority list(of subjects)
 # --------------------------------------------------------
-class PrioritizeSubjects(Node):
+class PrioritizeSubjects(_StoredStage, Node):
     """
     Node: PrioritizeSubjects
     Purpose: Create a ranked list of subjects for a student
     based on their knowledge level and gaps.
     """
 
+    spec = OutputSpec("learning_priority", required=("subject", "priority"), id_field="subject")
+
     def prep(self, shared):
         student_profile = shared.get("student_profile")
         if not student_profile:
@@ -96,12 +389,21 @@ class PrioritizeSubjects(Node):
     def exec(self, prep_res):
         student_profile, use_cache = prep_res
         print("Prioritizing subjects based on student profile...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = call_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._parse(self._structured(response, use_cache))
+
+    def _fingerprint(self, prep_res):
+        student_profile, use_cache = prep_res
+        return {"student_profile": student_profile}
 
-        prompt = f"""
+    def _prompt(self, prep_res):
+        student_profile, use_cache = prep_res
+        return f"""
 You are an AI educational planner. You received a student's profile
 with subjects, knowledge levels, strengths, and gaps:
 
-{student_profile}
+{fit_yaml(unwrap(student_profile, "student_profile"), self._input_budget())}
 
 Task:
 1. Rank the subjects from highest priority (needs most attention) to lowest.
@@ -121,30 +423,89 @@ learning_priority:
       ...
 ```"""
 
-        response = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0))
-
-        # --- Extract YAML safely ---
-        import re
-        match = re.search(r"```yaml(.*?)```", response, re.DOTALL)
-        if not match:
-            raise ValueError("No YAML block found in LLM output")
-        yaml_str = match.group(1).strip()
-
-        import yaml
-        priority_list = yaml.safe_load(yaml_str)
-
-        if "learning_priority" not in priority_list or not isinstance(priority_list["learning_priority"], list):
-            raise ValueError("Missing or invalid 'learning_priority' in LLM output.")
-
+    def _parse(self, priority_list):
         return priority_list
 
     def post(self, shared, prep_res, exec_res):
         shared["learning_priority"] = exec_res
         print("Learning priority stored in shared['learning_priority'].")
 
+
+# Node 2 (rule-based variant) - ranking computed locally
+# --------------------------------------------------------
+class PrioritizeSubjectsByRules(PrioritizeSubjects):
+    """
+    Node: PrioritizeSubjectsByRules
+    Purpose: Same output as PrioritizeSubjects, ranked locally with the rules
+    the LLM prompt describes (utils.priority_rules). No LLM call by default.
+    explain=True: the LLM only rewrites the reasoning texts for the fixed
+    order; if that fails, the template reasoning is kept.
+    """
+
+    spec = OutputSpec("reasons", required=("subject", "reasoning"), id_field="subject")
+
+    def __init__(self, explain=False, retry_policy=None, max_retries=1, wait=0):
+        super().__init__(retry_policy=retry_policy, max_retries=max_retries, wait=wait)
+        self.explain = explain
+        self.use_store = explain  # ranking alone is cheaper than a store lookup
+
+    def prep(self, shared):
+        student_profile, use_cache = super().prep(shared)
+        return student_profile, use_cache, shared.get("grade_analytics")
+
+    def exec(self, prep_res):
+        student_profile, use_cache, analytics = prep_res
+        ranking = rank_subjects(student_profile, analytics)
+        if not self.explain:
+            return {"learning_priority": ranking}
+        print("Writing priority reasoning...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = call_llm(self._reasoning_prompt(student_profile, ranking), use_cache=use_cache, **self._llm_options())
+        return self._merge_reasoning(ranking, self._structured(response, use_cache))
+
+    def exec_fallback(self, prep_res, exc):
+        student_profile, use_cache, analytics = prep_res
+        print(f"Priority reasoning failed ({exc}), keeping template reasoning.")
+        return {"learning_priority": rank_subjects(student_profile, analytics)}
+
+    def _fingerprint(self, prep_res):
+        student_profile, use_cache, analytics = prep_res
+        return {"student_profile": student_profile, "analytics": analytics}
+
+    def _reasoning_prompt(self, student_profile, ranking):
+        order = "\n".join(f"{item['priority']}. {item['subject']}" for item in ranking)
+        return f"""
+You are an AI educational planner. You received a student's profile
+with subjects, knowledge levels, strengths, and gaps:
+
+{fit_yaml(unwrap(student_profile, "student_profile"), self._input_budget())}
+
+The subjects are already ranked (1 = needs most attention):
+{order}
+
+Do NOT change the order. For each subject, explain its place in 1-3 sentences.
+
+Output STRICTLY in YAML format:
+
+```yaml
+reasons:
+  - subject: ""
+    reasoning: |
+      ...
+```"""
+
+    def _merge_reasoning(self, ranking, data):
+        reasons = {str(item["subject"]): item["reasoning"] for item in data["reasons"]}
+        for item in ranking:
+            if reasons.get(item["subject"]):
+                item["reasoning"] = reasons[item["subject"]]
+        return {"learning_priority": ranking}
+
 # Node 3 - KnowledgeToDiscover - Lists a theme and topic to learn
 # --------------------------------------------------------
-class KnowledgeToDiscover(Node):
+class KnowledgeToDiscover(_StoredStage, Node):
+
+    spec = OutputSpec("knowledge_to_discover", required=("topic", "subtopics"), id_field="topic")
 
     def prep(self, shared):
         student_profile = shared.get("student_profile")
@@ -158,16 +519,33 @@ class KnowledgeToDiscover(Node):
     def exec(self, prep_res):
         student_profile, learning_priority, use_cache, max_topics = prep_res
         print("Generating topics and subtopics to discover...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = call_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._parse(self._structured(response, use_cache), max_topics)
+
+    def _fingerprint(self, prep_res):
+        student_profile, learning_priority, use_cache, max_topics = prep_res
+        return {
+            "student_profile": student_profile,
+            "learning_priority": learning_priority,
+            "max_topics": max_topics,
+        }
 
-        prompt = f"""
+    def _prompt(self, prep_res):
+        student_profile, learning_priority, use_cache, max_topics = prep_res
+        sections = fit_sections({
+            "profile": unwrap(student_profile, "student_profile"),
+            "priority": unwrap(learning_priority, "learning_priority"),
+        }, self._input_budget())
+        return f"""
 You are an AI tutor. You received the following data:
 
 1. Student profile with subjects, knowledge levels (Very Low / Average / Above Average / High),
    strengths, and gaps:
-{student_profile}
+{sections["profile"]}
 
 2. Ranked learning priority of subjects (highest priority = needs most attention):
-{learning_priority}
+{sections["priority"]}
 
 Task:
 - Generate a clear study plan for the student.
@@ -194,105 +572,321 @@ knowledge_to_discover:
         based_from: "gap or weakness"
       - name: "Subtopic 2"
         based_from: "gap or weakness"
-# Repeat up to 10 main topics```
+# Repeat up to {max_topics} main topics
+```
 """
-        response = call_llm(prompt, use_cache=(use_cache and self.cur_retry == 0))
-
-        # Extract YAML safely
-        match = re.search(r"```yaml(.*?)```", response, re.DOTALL)
-        if not match:
-            raise ValueError("No YAML block found in LLM output")
-        yaml_str = match.group(1).strip()
-        knowledge = yaml.safe_load(yaml_str)
-
-        if "knowledge_to_discover" not in knowledge or not isinstance(knowledge["knowledge_to_discover"], list):
-            raise ValueError("Missing or invalid 'knowledge_to_discover' key in LLM output.")
 
+    def _parse(self, knowledge, max_topics=None):
+        if max_topics:
+            knowledge["knowledge_to_discover"] = knowledge["knowledge_to_discover"][:max_topics]
         return knowledge
 
     def post(self, shared, prep_res, exec_res):
             shared["knowledge_to_discover"] = exec_res
             print("Knowledge topics and subtopics stored in shared['knowledge_to_discover'].")
 
-class FinalTeacherConclusion(Node):
+class FinalTeacherConclusion(_StoredStage, Node):
     """
     Generates a complete teacher conclusion and saves as HTML using Markdown rendering.
+    Streaming mode (shared["stream"] or shared["on_html_block"]): tokens are
+    consumed as they arrive and every finished Markdown block is rendered,
+    passed to shared["on_html_block"] and appended to <report>.partial; the
+    finished page then replaces the report (the same page as without
+    streaming). Reports that go into a batch archive are added at the end.
     """
 
+    stop = None  # free Markdown text, no stop sequence
+
     def prep(self, shared):
+        on_block = shared.get("on_html_block")
         return (
             shared["student_data"],
             shared["student_profile"],
             shared["learning_priority"],
             shared["knowledge_to_discover"],
-            shared.get("output_dir", "output"),
+            self._html_file(shared),
             shared.get("use_cache", True),
+            on_block,
+            shared.get("report_bundle"),
+            bool(shared.get("stream")) or on_block is not None,
         )
 
     def exec(self, prep_res):
-        student_data, profile, priority, plan, output_dir, use_cache = prep_res
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
+        use_cache = use_cache and getattr(self, "cur_retry", 0) == 0
+
+        if stream:
+            report_stream = self._report_stream(prep_res)
+            try:
+                for chunk in stream_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options()):
+                    report_stream.feed(chunk)
+                text, report = report_stream.finish()
+            finally:
+                report_stream.discard()
+            return self._saved(text, report or ReportWriter.write(text, student_data, html_file, bundle))
 
+        # ---- Вызов LLM ----
+        text = call_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._save(text, prep_res)
+
+    def _fingerprint(self, prep_res):
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
+        return {
+            "name": student_data.get("Full Name"),
+            "class": student_data.get("Class"),
+            "profile": profile,
+            "priority": priority,
+            "plan": plan,
+        }
+
+    def _load_result(self, key, prep_res):
+        # Only the text is reused; the HTML file is rendered again locally
+        # (and not rewritten if it is unchanged)
+        stored = super()._load_result(key, prep_res)
+        if stored is None:
+            return None
+        return self._save(stored["text"], prep_res)
+
+    def _prompt(self, prep_res):
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
         name = student_data.get("Full Name", "ученик")
         grade = student_data.get("Class", "N/A")
+        sections = fit_sections({
+            "profile": unwrap(profile, "student_profile"),
+            "priority": unwrap(priority, "learning_priority"),
+            "plan": unwrap(plan, "knowledge_to_discover"),
+        }, self._input_budget())
 
         # ---- Prompt ----
-        prompt = f"""
+        return f"""
 Вы — заботливый и опытный школьный учитель.
 
 Имя ученика: {name}
 Класс: {grade}
 
 Профиль ученика:
-{profile}
+{sections["profile"]}
 
 Приоритеты:
-{priority}
+{sections["priority"]}
 
 Учебный план:
-{plan}
+{sections["plan"]}
 
 Составьте итоговое заключение на русском языке в Markdown,
 с заголовками, списками, таблицами и отступами.
 """
 
-        # ---- Вызов LLM ----
-        text = call_llm(prompt, use_cache=(use_cache and getattr(self, "cur_retry", 0) == 0))
-
-        os.makedirs(output_dir, exist_ok=True)
-        safe_name = re.sub(r"[^\w]+", "_", name.lower())
-        html_file = os.path.join(output_dir, f"{safe_name}_teacher_conclusion.html")
-
-        # ---- Markdown -> HTML ----
-        html_body = markdown.markdown(text, extensions=['tables', 'fenced_code'])
-        full_html = f"""
-<html>
-<head>
-<meta charset="utf-8">
-<title>Заключение учителя: {name}</title>
-<style>
-body {{ font-family: DejaVu Sans, Arial, sans-serif; line-height: 1.5; padding: 20px; }}
-h1,h2,h3,h4 {{ margin-top: 20px; }}
-table {{ border-collapse: collapse; width: 100%; margin: 10px 0; }}
-table, th, td {{ border: 1px solid #333; padding: 6px; }}
-code {{ background-color: #f0f0f0; padding: 2px 4px; border-radius: 4px; }}
-pre {{ background-color: #f9f9f9; padding: 10px; border-radius: 4px; overflow-x: auto; }}
-ul, ol {{ padding-left: 20px; }}
-</style>
-</head>
-<body>
-<h1>Итоговое заключение учителя для {name}</h1>
-<h2>Класс: {grade}</h2>
-{html_body}
-</body>
-</html>
-"""
-
-        with open(html_file, "w", encoding="utf-8") as f:
-            f.write(full_html)
-
-        return {"text": text, "html_file": html_file}
+    def _html_file(self, shared):
+        # Named by student_id (the unique Login), never by Full Name
+        student_id = shared.get("student_id") or shared["student_data"].get("Full Name", "ученик")
+        return os.path.join(shared.get("output_dir", "output"), report_file_name(student_id))
+
+    def _report_stream(self, prep_res):
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
+        report_file = None
+        if bundle is None:
+            report_file = StreamingReportFile(html_file, student_data)
+            print(f"📝 Streaming teacher conclusion to {report_file.partial_path}")
+        return _StreamingReport(on_block, report_file)
+
+    def _save(self, text, prep_res):
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
+        report = ReportWriter.write(text, student_data, html_file, bundle)
+        return self._saved(text, report, on_block)
+
+    @staticmethod
+    def _saved(text, report, on_block=None):
+        if on_block is not None:
+            on_block(report["html_body"])
+        return {"text": text, "html_file": report["html_file"], "changed": report["changed"]}
 
     def post(self, shared, prep_res, exec_res):
         shared["teacher_conclusion"] = exec_res["text"]
         shared["teacher_conclusion_html"] = exec_res["html_file"]
-        print(f"📄 Teacher conclusion saved as HTML: {exec_res['html_file']}")
+        if exec_res.get("changed", True):
+            print(f"📄 Teacher conclusion saved as HTML: {exec_res['html_file']}")
+        else:
+            print(f"📄 Teacher conclusion unchanged: {exec_res['html_file']}")
+
+
+class _StreamingReport:
+    """
+    Streaming mode of FinalTeacherConclusion: every finished Markdown block is
+    rendered once, as soon as it is complete, and passed to on_block (if any)
+    and to the report file being written (StreamingReportFile, if any).
+    """
+
+    def __init__(self, on_block=None, report_file=None):
+        self.on_block = on_block
+        self.report_file = report_file
+        self.parts = []
+        self.splitter = MarkdownBlockSplitter()
+
+    def _emit(self, blocks):
+        for block in blocks:
+            html_block = render_markdown(block)
+            if self.on_block is not None:
+                self.on_block(html_block)
+            if self.report_file is not None:
+                self.report_file.add(html_block)
+
+    def feed(self, chunk):
+        self.parts.append(chunk)
+        self._emit(self.splitter.feed(chunk))
+
+    def finish(self):
+        """(whole text, written report or None without a report file), after the last block."""
+        self._emit(self.splitter.flush())
+        report = self.report_file.commit() if self.report_file is not None else None
+        return "".join(self.parts), report
+
+    def discard(self):
+        """Remove the partial report file if the stream did not finish."""
+        if self.report_file is not None:
+            self.report_file.discard()
+
+
+# Async variants - same prompts and parsing, but the LLM call is awaited,
+# so one event loop can run many student flows concurrently.
+# --------------------------------------------------------
+class _AsyncLLMNode(AsyncNode):
+    """
+    Adapter that reuses the sync node's prep/post, result store lookup and
+    retry policy. Also tracks cur_retry (AsyncNode does not), so retries
+    bypass the cache exactly like the sync nodes do.
+    """
+
+    async def prep_async(self, shared):
+        return self.prep(shared)
+
+    async def post_async(self, shared, prep_res, exec_res):
+        return self.post(shared, prep_res, exec_res)
+
+    async def _run_async(self, shared):
+        with NodeRun(self._node_name()) as run:
+            with run.phase("prep"):
+                prep_res = await self.prep_async(shared)
+            with run.phase("exec"):
+                # The node store is SQLite: its reads and writes run in worker threads
+                key, exec_res = await asyncio.to_thread(self._lookup, shared, prep_res, run)
+                if exec_res is not None:
+                    exec_res = await self._restore_async(exec_res, prep_res)
+                else:
+                    exec_res = await self._exec(prep_res)
+                    await asyncio.to_thread(self._store, key, exec_res)
+            with run.phase("post"):
+                return await self.post_async(shared, prep_res, exec_res)
+
+    async def _restore_async(self, exec_res, prep_res):
+        """Stored result -> exec result (a hook for nodes that do more than reuse it)."""
+        return exec_res
+
+    async def _astructured(self, response, use_cache):
+        """Async version of _StoredStage._structured."""
+        try:
+            return parse_structured(response, self.spec)
+        except MissingFieldsError as e:
+            print(f"{e} - asking for the missing fields only...")
+            return apply_repair(e, await acall_llm(repair_prompt(e), use_cache=use_cache, stop=YAML_STOP))
+
+    async def _exec(self, prep_res):
+        self.cur_retry = 0
+        while True:
+            try:
+                return await self.exec_async(prep_res)
+            except Exception as e:
+                delay = self._retry_delay(e)
+                if delay is None:
+                    return await self.exec_fallback_async(prep_res, e)
+                await asyncio.sleep(delay)
+                self.cur_retry += 1
+
+
+class AsyncAssessStudentLevel(_AsyncLLMNode, AssessStudentLevel):
+    async def exec_async(self, prep_res):
+        student_data, use_cache, max_subjects, analytics = prep_res
+        print(f"Assessing knowledge level for {student_data.get('Full Name', 'Unknown')}...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = await acall_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._parse(await self._astructured(response, use_cache))
+
+
+class AsyncAssessStudentLevelPerSubject(_AsyncLLMNode, AssessStudentLevelPerSubject):
+    async def _exec(self, items):
+        # All subjects are assessed concurrently, each on its own node copy
+        return await asyncio.gather(*(_AsyncLLMNode._exec(copy.copy(self), item) for item in items or []))
+
+    async def exec_async(self, item):
+        subject, marks, student_class, bio, stats, use_cache = item
+        use_cache = use_cache and self.cur_retry == 0
+        response = await acall_llm(self._prompt(item), use_cache=use_cache, **self._llm_options())
+        return self._parse(await self._astructured(response, use_cache), subject)
+
+
+class AsyncPrioritizeSubjects(_AsyncLLMNode, PrioritizeSubjects):
+    async def exec_async(self, prep_res):
+        student_profile, use_cache = prep_res
+        print("Prioritizing subjects based on student profile...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = await acall_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._parse(await self._astructured(response, use_cache))
+
+
+class AsyncPrioritizeSubjectsByRules(_AsyncLLMNode, PrioritizeSubjectsByRules):
+    async def exec_async(self, prep_res):
+        student_profile, use_cache, analytics = prep_res
+        ranking = rank_subjects(student_profile, analytics)
+        if not self.explain:
+            return {"learning_priority": ranking}
+        print("Writing priority reasoning...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = await acall_llm(self._reasoning_prompt(student_profile, ranking), use_cache=use_cache, **self._llm_options())
+        return self._merge_reasoning(ranking, await self._astructured(response, use_cache))
+
+    async def exec_fallback_async(self, prep_res, exc):
+        return self.exec_fallback(prep_res, exc)
+
+
+class AsyncKnowledgeToDiscover(_AsyncLLMNode, KnowledgeToDiscover):
+    async def exec_async(self, prep_res):
+        student_profile, learning_priority, use_cache, max_topics = prep_res
+        print("Generating topics and subtopics to discover...")
+        use_cache = use_cache and self.cur_retry == 0
+        response = await acall_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return self._parse(await self._astructured(response, use_cache), max_topics)
+
+
+class AsyncFinalTeacherConclusion(_AsyncLLMNode, FinalTeacherConclusion):
+    async def exec_async(self, prep_res):
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
+        use_cache = use_cache and self.cur_retry == 0
+
+        if stream:
+            report_stream = self._report_stream(prep_res)
+            try:
+                async for chunk in astream_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options()):
+                    report_stream.feed(chunk)
+                text, report = report_stream.finish()
+            finally:
+                report_stream.discard()
+            if report is not None:
+                return self._saved(text, report)
+            on_block = None  # the blocks were already delivered
+        else:
+            text = await acall_llm(self._prompt(prep_res), use_cache=use_cache, **self._llm_options())
+        return await self._asave(text, prep_res, on_block)
+
+    def _load_result(self, key, prep_res):
+        # Only the stored text; the page is rendered by _restore_async on the report pool
+        return _StoredStage._load_result(self, key, prep_res)
+
+    async def _restore_async(self, exec_res, prep_res):
+        student_data, profile, priority, plan, html_file, use_cache, on_block, bundle, stream = prep_res
+        return await self._asave(exec_res["text"], prep_res, on_block)
+
+    async def _asave(self, text, prep_res, on_block):
+        student_data, profile, priority, plan, html_file, use_cache, _, bundle, stream = prep_res
+        # Rendering and the file write run on the report pool, not on the event loop
+        report = await asyncio.wrap_future(get_report_writer().submit(text, student_data, html_file, bundle))
+        return self._saved(text, report, on_block)
@@ -0,0 +1,429 @@
+"""
+Web portal: a student logs in with Login / Password (db.py) and gets the
+teacher conclusion generated for them.
+
+Reports are never generated on the request path. A view is served from the
+report cache (utils.report_cache), keyed by student and data version; on a
+miss the teacher flow is queued on a background event loop and the request
+returns 202 at once with a status URL. Cached pages are sent gzip-compressed
+with an ETag, so a repeat view is a 304 without a body.
+
+    python portal.py --port 8080 --db students.db --precompute
+
+Endpoints:
+    GET  /                login form (or redirect to /report)
+    POST /login           form fields login, password; sets the session cookie
+    POST /logout
+    GET  /report          the report, or 202 + Location: /status/<job id>
+    GET  /status/<job id> {"status": "queued" | "running" | "done" | "failed", ...}
+    GET  /healthz
+Scripts can use HTTP Basic auth instead of the session cookie.
+"""
+import os
+import hmac
+import json
+import time
+import uuid
+import html
+import base64
+import asyncio
+import hashlib
+import secrets
+import argparse
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import dotenv
+
+from db import get_database
+from flow import create_async_teacher_flow, PRIORITY_MODES
+from main import build_shared, class_analytics
+from utils.call_llm import get_llm_model
+from utils.report_cache import get_report_cache, report_key
+from utils.report_writer import render_report
+
+SESSION_COOKIE = "teacher_session"
+
+# Finished and failed jobs are forgotten after this many seconds (the report
+# itself stays in the cache)
+JOB_TTL = 3600
+
+# Largest form body accepted by POST (login form)
+MAX_FORM_BYTES = 16 * 1024
+
+
+class Job:
+    def __init__(self, student_id, key):
+        self.id = uuid.uuid4().hex
+        self.student_id = student_id
+        self.key = key
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        data = {"id": self.id, "status": self.status}
+        if self.status == "done":
+            data["report_url"] = "/report"
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class Portal:
+    """Report lookup and background generation, shared by all request threads."""
+
+    def __init__(self, db, cache, args):
+        self.db = db
+        self.cache = cache
+        self.args = args
+        self.secret = os.getenv("PORTAL_SECRET", "").encode("utf-8") or secrets.token_bytes(32)
+        self.session_ttl = float(os.getenv("PORTAL_SESSION_HOURS", "12")) * 3600
+        self._jobs = {}         # job id -> Job
+        self._jobs_by_key = {}  # report key -> queued / running Job
+        self._lock = threading.Lock()
+        # Class analytics, computed once per class while report jobs are pending
+        # (e.g. a --precompute run) and dropped when the queue is empty
+        self._class_analytics = {}
+        self._analytics_lock = threading.Lock()
+        # Flows run on one event loop thread, at most args.concurrency at once
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="portal-flows", daemon=True).start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self.loop).result()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.args.concurrency)
+
+    # ---- authentication ----
+
+    def check_password(self, login, password):
+        record = self.db.get_raw(login) if login else None
+        if record is None:
+            hmac.compare_digest(b"x", password.encode("utf-8"))  # same work for unknown logins
+            return False
+        return hmac.compare_digest(str(record["Password"]).encode("utf-8"), password.encode("utf-8"))
+
+    def make_session(self, login):
+        expires = str(int(time.time() + self.session_ttl))
+        payload = base64.urlsafe_b64encode(login.encode("utf-8")).decode("ascii") + "." + expires
+        signature = hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).hexdigest()
+        return f"{payload}.{signature}"
+
+    def session_login(self, token):
+        """Login of a valid, unexpired session token, else None."""
+        try:
+            encoded_login, expires, signature = token.split(".")
+        except (AttributeError, ValueError):
+            return None
+        # The cookie is client input: any character may arrive, so compare bytes
+        payload = f"{encoded_login}.{expires}".encode("utf-8", "replace")
+        expected = hmac.new(self.secret, payload, hashlib.sha256).hexdigest().encode("ascii")
+        try:
+            if not hmac.compare_digest(expected, signature.encode("utf-8", "replace")) or int(expires) < time.time():
+                return None
+            return base64.urlsafe_b64decode(encoded_login).decode("utf-8")
+        except (UnicodeError, TypeError, ValueError):
+            return None
+
+    # ---- reports ----
+
+    def report(self, login):
+        """(cached report, None) or (None, job generating it)."""
+        student_data = self.db.get(login)
+        if student_data is None:
+            raise KeyError(login)
+        key = report_key(login, student_data, get_llm_model())
+        prepared = self.cache.get(key)
+        if prepared is not None:
+            return prepared, None
+        return None, self.enqueue(login, key)
+
+    def enqueue(self, login, key):
+        """The queued / running job for this report, or a new one."""
+        with self._lock:
+            job = self._jobs_by_key.get(key)
+            if job is not None:
+                return job
+            self._forget_old_jobs()
+            job = Job(login, key)
+            self._jobs[job.id] = job
+            self._jobs_by_key[key] = job
+        asyncio.run_coroutine_threadsafe(self._generate(job), self.loop)
+        return job
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    async def _generate(self, job):
+        async with self._semaphore:
+            job.status = "running"
+            try:
+                student_data = self.db.get(job.student_id)
+                analytics = await asyncio.to_thread(self._student_analytics, job.student_id, student_data["Class"])
+                shared = build_shared(job.student_id, student_data, self.args, analytics)
+                flow = create_async_teacher_flow(per_subject=self.args.per_subject, priority=self.args.priority)
+                await flow.run_async(shared)
+                page, _ = render_report(shared["teacher_conclusion"], student_data)
+                # Store under the key of the data the report was made from; if the
+                # marks changed meanwhile, the next view queues a new version
+                await asyncio.to_thread(self.cache.set, job.key, page)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+                print(f"❌ Report for {job.student_id} failed: {job.error}")
+            finally:
+                job.finished = time.time()
+                with self._lock:
+                    if self._jobs_by_key.get(job.key) is job:
+                        del self._jobs_by_key[job.key]
+                    idle = not self._jobs_by_key
+                if idle:
+                    # Later views see the current class data
+                    with self._analytics_lock:
+                        self._class_analytics.clear()
+
+    def _student_analytics(self, login, student_class):
+        """Grade analytics of one student; its class is scanned once per batch of jobs."""
+        with self._analytics_lock:
+            analytics = self._class_analytics.get(student_class)
+            if analytics is None:
+                analytics = self._class_analytics[student_class] = class_analytics(self.db, student_class)
+            return analytics.get(login)
+
+    def precompute(self):
+        """Queue every student whose current report is not cached yet."""
+        queued = 0
+        for login, student_data in self.db.iter_students():
+            key = report_key(login, student_data, get_llm_model())
+            if self.cache.get(key) is None:
+                self.enqueue(login, key)
+                queued += 1
+        return queued
+
+
+_LOGIN_PAGE = """<html>
+<head><meta charset="utf-8"><title>Вход</title></head>
+<body style="font-family: DejaVu Sans, Arial, sans-serif; padding: 20px;">
+<h1>Рекомендации учителя</h1>
+{message}
+<form method="post" action="/login">
+<p><label>Логин <input name="login" autocomplete="username"></label></p>
+<p><label>Пароль <input name="password" type="password" autocomplete="current-password"></label></p>
+<p><button type="submit">Войти</button></p>
+</form>
+</body>
+</html>
+"""
+
+_PENDING_PAGE = """<html>
+<head><meta charset="utf-8"><meta http-equiv="refresh" content="{retry}"><title>Готовим заключение</title></head>
+<body style="font-family: DejaVu Sans, Arial, sans-serif; padding: 20px;">
+<h1>Заключение готовится</h1>
+<p>Статус: {status}. Страница обновится автоматически (<a href="{status_url}">статус</a>).</p>
+</body>
+</html>
+"""
+
+
+def _accepts_gzip(header):
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def make_handler(portal):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "TeacherPortal"
+
+        def log_message(self, format, *args):
+            if portal.args.access_log:
+                super().log_message(format, *args)
+
+        # ---- helpers ----
+
+        def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if body or status not in (204, 304):
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body and self.command != "HEAD":
+                self.wfile.write(body)
+
+        def _json(self, status, data, headers=None):
+            self._send(status, json.dumps(data).encode("utf-8"), "application/json", headers)
+
+        def _redirect(self, location, headers=None):
+            self._send(303, b"", headers=dict(headers or {}, Location=location))
+
+        def _login(self):
+            """Login of the session cookie or of Basic auth, else None."""
+            cookie = SimpleCookie(self.headers.get("Cookie", ""))
+            if SESSION_COOKIE in cookie:
+                login = portal.session_login(cookie[SESSION_COOKIE].value)
+                if login:
+                    return login
+            auth = self.headers.get("Authorization", "")
+            if auth.startswith("Basic "):
+                try:
+                    login, _, password = base64.b64decode(auth[6:]).decode("utf-8").partition(":")
+                except ValueError:
+                    return None
+                if portal.check_password(login, password):
+                    return login
+            return None
+
+        def _wants_json(self):
+            return "application/json" in self.headers.get("Accept", "")
+
+        def _unauthorized(self):
+            if self._wants_json() or self.headers.get("Authorization"):
+                return self._json(401, {"error": "login required"}, {"WWW-Authenticate": 'Basic realm="teacher"'})
+            return self._redirect("/")
+
+        # ---- routes ----
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/healthz":
+                return self._send(200, b"ok", "text/plain")
+            if path == "/":
+                if self._login():
+                    return self._redirect("/report")
+                return self._send(200, _LOGIN_PAGE.format(message="").encode("utf-8"))
+            login = self._login()
+            if login is None:
+                return self._unauthorized()
+            if path == "/report":
+                return self._report(login)
+            if path.startswith("/status/"):
+                job = portal.job(path[len("/status/"):])
+                if job is None or job.student_id != login:
+                    return self._json(404, {"error": "unknown job"})
+                return self._json(200, job.to_dict())
+            self._send(404, b"Not found", "text/plain")
+
+        def _bad_request(self, status, message):
+            # The body may be unread, so the connection can't be reused
+            self.close_connection = True
+            self._send(status, message.encode("utf-8"), "text/plain", {"Connection": "close"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                return self._bad_request(400, "Invalid Content-Length")
+            if length < 0:
+                return self._bad_request(400, "Invalid Content-Length")
+            if length > MAX_FORM_BYTES:
+                return self._bad_request(413, "Request body too large")
+            try:
+                form = parse_qs(self.rfile.read(length).decode("utf-8")) if length else {}
+            except UnicodeDecodeError:
+                return self._bad_request(400, "Form data must be UTF-8")
+            if self.path == "/login":
+                login = (form.get("login") or [""])[0].strip()
+                password = (form.get("password") or [""])[0]
+                if not portal.check_password(login, password):
+                    message = "<p style=\"color: #a00\">Неверный логин или пароль.</p>"
+                    return self._send(401, _LOGIN_PAGE.format(message=message).encode("utf-8"))
+                cookie = (
+                    f"{SESSION_COOKIE}={portal.make_session(login)}; Path=/; HttpOnly; SameSite=Lax; "
+                    f"Max-Age={int(portal.session_ttl)}"
+                )
+                if os.getenv("PORTAL_SECURE_COOKIE") == "1":
+                    cookie += "; Secure"
+                return self._redirect("/report", {"Set-Cookie": cookie})
+            if self.path == "/logout":
+                return self._redirect("/", {"Set-Cookie": f"{SESSION_COOKIE}=; Path=/; Max-Age=0"})
+            self._send(404, b"Not found", "text/plain")
+
+        def _report(self, login):
+            try:
+                prepared, job = portal.report(login)
+            except KeyError:
+                return self._json(404, {"error": "student not found"})
+
+            if prepared is None:
+                status_url = f"/status/{job.id}"
+                headers = {"Location": status_url, "Retry-After": "5", "Cache-Control": "no-store"}
+                if self._wants_json():
+                    return self._json(202, dict(job.to_dict(), status_url=status_url), headers)
+                page = _PENDING_PAGE.format(retry=5, status=html.escape(job.status), status_url=status_url)
+                return self._send(202, page.encode("utf-8"), headers=headers)
+
+            use_gzip = _accepts_gzip(self.headers.get("Accept-Encoding"))
+            etag = prepared.gzip_etag if use_gzip else prepared.etag
+            headers = {
+                "ETag": etag,
+                "Cache-Control": "private, no-cache",  # always revalidate, usually a 304
+                "Vary": "Accept-Encoding, Cookie, Authorization",
+            }
+            if_none_match = self.headers.get("If-None-Match", "")
+            if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+                return self._send(304, headers=headers)
+            if use_gzip:
+                headers["Content-Encoding"] = "gzip"
+                return self._send(200, prepared.gzipped, headers=headers)
+            return self._send(200, prepared.body, headers=headers)
+
+    return Handler
+
+
+def main():
+    dotenv.load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Web portal serving cached teacher conclusions.")
+    parser.add_argument("--host", default=os.getenv("PORTAL_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORTAL_PORT", "8080")))
+    parser.add_argument("--db", default=None,
+                        help="SQLite student database (default: STUDENT_DB_PATH or the built-in sample data)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Reports generated at once")
+    parser.add_argument("--output-dir", default="output", help="Directory for the HTML files the flow writes")
+    parser.add_argument("--per-subject", action="store_true", help="Assess each subject in its own LLM call")
+    parser.add_argument("--priority", choices=PRIORITY_MODES, default="llm", help="How subjects are ranked")
+    parser.add_argument("--precompute", action="store_true",
+                        help="Queue reports for every student without a cached one at startup")
+    parser.add_argument("--access-log", action="store_true", help="Print one line per request")
+    args = parser.parse_args()
+    # build_shared options of the flow runs
+    args.no_cache = False
+    args.stream = False
+    args.max_subjects = 10
+    args.max_topics = 10
+
+    portal = Portal(get_database(args.db), get_report_cache(), args)
+    if not os.getenv("PORTAL_SECRET"):
+        print("⚠️  PORTAL_SECRET is not set: sessions end when the portal restarts")
+    if args.precompute:
+        print(f"🧮 Queued {portal.precompute()} reports")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(portal))
+    server.daemon_threads = True
+    print(f"🌐 Teacher portal on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
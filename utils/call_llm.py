@@ -1,46 +1,87 @@
-from google import genai
 import os
-import logging
+import re
 import json
-import requests
-from datetime import datetime
-
-# Configure logging
-log_directory = os.getenv("LOG_DIR", "logs")
-os.makedirs(log_directory, exist_ok=True)
-log_file = os.path.join(
-    log_directory, f"llm_calls_{datetime.now().strftime('%Y%m%d')}.log"
+import asyncio
+import weakref
+import threading
+import time
+from functools import lru_cache
+from utils.llm_cache import get_cache, make_cache_key
+from utils.llm_errors import (
+    LLMConnectionError, LLMResponseError, LLMTimeoutError, LLMTruncatedError, error_for_status, parse_retry_after,
 )
+from utils.hedge import hedging_enabled, get_latency_tracker, hedged_call, ahedged_call
+from utils.single_flight import SingleFlight, AsyncSingleFlight
+from utils.rate_limit import get_rate_limiter
+from utils.prompt_format import estimate_tokens
+from utils.llm_log import log_llm_call
+from utils.metrics import record_llm_call
 
-# Set up logger
-logger = logging.getLogger("llm_logger")
-logger.setLevel(logging.INFO)
-logger.propagate = False  # Prevent propagation to root logger
-file_handler = logging.FileHandler(log_file, encoding='utf-8')
-file_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-)
-logger.addHandler(file_handler)
+# Every call is logged as one JSONL record by a background thread (utils.llm_log)
 
-# Simple cache configuration
-cache_file = "llm_cache.json"
+# Provider SDKs and HTTP clients are imported on first use, not at import time:
+# google.genai alone costs more than half a second, and a run only needs the
+# client of its provider (requests for sync calls, httpx for asyncio).
 
 
-def load_cache():
-    try:
-        with open(cache_file, 'r') as f:
-            return json.load(f)
-    except:
-        logger.warning(f"Failed to load cache.")
-    return {}
+def _genai():
+    from google import genai
+    return genai
 
 
-def save_cache(cache):
-    try:
-        with open(cache_file, 'w') as f:
-            json.dump(cache, f)
-    except:
-        logger.warning(f"Failed to save cache")
+# Identical cached prompts in flight at the same time share one request
+_in_flight = SingleFlight()
+_async_in_flight = AsyncSingleFlight()
+
+
+def get_single_flight_stats():
+    return {"threads": _in_flight.stats(), "asyncio": _async_in_flight.stats()}
+
+
+# Reused HTTP session (keep-alive + connection pool), created on first use
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_timeout():
+    """(connect, read) timeout in seconds from LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT."""
+    return (
+        float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+        float(os.getenv("LLM_READ_TIMEOUT", "300")),
+    )
+
+
+def get_http_session():
+    """
+    Process-wide requests.Session for OpenAI compatible providers.
+    Connections are kept alive and pooled, so only the first request to a host
+    pays for the TCP/TLS handshake. Pool size comes from LLM_HTTP_POOL_SIZE.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                pool_size = int(os.getenv("LLM_HTTP_POOL_SIZE", "32"))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+                _http_session = session
+    return _http_session
+
+
+@lru_cache(maxsize=8)
+def _get_gemini_client(project_id, location, api_key, timeout_ms):
+    """One genai.Client per configuration, reused across calls."""
+    genai = _genai()
+    http_options = genai.types.HttpOptions(timeout=timeout_ms)
+    if project_id:
+        return genai.Client(vertexai=True, project=project_id, location=location, http_options=http_options)
+    return genai.Client(api_key=api_key, http_options=http_options)
 
 
 def get_llm_provider():
@@ -51,18 +92,35 @@ def get_llm_provider():
     return provider
 
 
-def _call_llm_provider(prompt: str) -> str:
+def get_llm_model():
+    """Model name of the configured provider (part of the cache key)."""
+    provider = get_llm_provider()
+    if provider == "GEMINI":
+        return os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
+    if provider:
+        return os.getenv(f"{provider}_MODEL", "")
+    return ""
+
+
+def _cache_key(prompt, max_tokens=None, stop=None):
+    """Output limits change the answer, so they are part of the key when set."""
+    model = get_llm_model()
+    if max_tokens or stop:
+        model = f"{model}|max_tokens={max_tokens}|stop={stop}"
+    return make_cache_key(prompt, model)
+
+
+def _provider_request(prompt: str, max_tokens=None, stop=None):
     """
-    Call an LLM provider based on environment variables.
+    Build the request for an OpenAI compatible provider from environment variables.
     Environment variables:
     - LLM_PROVIDER: "OLLAMA" or "XAI"
     - <provider>_MODEL: Model name (e.g., OLLAMA_MODEL, XAI_MODEL)
     - <provider>_BASE_URL: Base URL without endpoint (e.g., OLLAMA_BASE_URL, XAI_BASE_URL)
     - <provider>_API_KEY: API key (e.g., OLLAMA_API_KEY, XAI_API_KEY; optional for providers that don't require it)
     The endpoint /v1/chat/completions will be appended to the base URL.
+    Returns (provider, url, headers, payload).
     """
-    logger.info(f"PROMPT: {prompt}") # log the prompt
-
     # Read the provider from environment variable
     provider = os.environ.get("LLM_PROVIDER")
     if not provider:
@@ -88,9 +146,7 @@ def _call_llm_provider(prompt: str) -> str:
     url = f"{base_url.rstrip('/')}/v1/chat/completions"
 
     # Configure headers and payload based on provider
-    headers = {
-        "Content-Type": "application/json",
-    }
+    headers = {"Content-Type": "application/json"}
     if api_key:  # Only add Authorization header if API key is provided
         headers["Authorization"] = f"Bearer {api_key}"
 
@@ -99,82 +155,574 @@ def _call_llm_provider(prompt: str) -> str:
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.7,
     }
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    if stop:
+        payload["stop"] = stop
+    return provider, url, headers, payload
+
+
+def _truncated(provider):
+    return LLMTruncatedError(
+        f"{provider} answer stopped at max_tokens (finish reason \"length\"); raise LLM_MAX_TOKENS_<NODE>", provider)
+
+
+def _provider_text(provider, data):
+    """Answer text of a chat-completions response; a cut-off answer is an error, so it is never cached."""
+    choice = data["choices"][0]
+    if choice.get("finish_reason") == "length":
+        raise _truncated(provider)
+    return choice["message"]["content"]
+
+
+def _http_error(provider, status, reason, headers, body):
+    """Typed error for an HTTP error response (see utils.llm_errors)."""
+    error_message = f"HTTP error occurred: {status} {reason} from {provider}"
+    try:
+        error_details = json.loads(body).get("error", "No additional details")
+        error_message += f" (Details: {error_details})"
+    except (ValueError, AttributeError):
+        pass
+    return error_for_status(provider, status, error_message, parse_retry_after(headers.get("Retry-After")))
+
+
+def _gemini_error(e):
+    """Typed error for a google.genai APIError."""
+    return error_for_status("GEMINI", getattr(e, "code", None), f"Gemini API error: {e}")
+
+
+def _hedge_key(max_tokens=None, stop=None):
+    return f"{get_llm_provider()}:{get_llm_model()}:{max_tokens}:{stop}"
+
+
+def _rate_limit(prompt, max_tokens=None):
+    """
+    (limiter, reserved tokens) for one request, see utils.rate_limit.
+    The reservation is the prompt estimate plus max_tokens for the answer.
+    """
+    limiter = get_rate_limiter(get_llm_provider(), get_llm_model())
+    return limiter, estimate_tokens(prompt) + (max_tokens or 0)
+
+
+def _settle(limiter, reserved, prompt, response_text):
+    """Charge the estimated real usage; a failed request (response_text None) refunds the reservation."""
+    if limiter:
+        used = estimate_tokens(prompt) + estimate_tokens(response_text) if response_text is not None else 0
+        limiter.settle(reserved, used)
+
+
+async def _asettle(limiter, reserved, prompt, response_text):
+    if limiter:
+        used = estimate_tokens(prompt) + estimate_tokens(response_text) if response_text is not None else 0
+        await limiter.asettle(reserved, used)
+
+
+def _call_llm_provider(prompt: str, max_tokens=None, stop=None) -> str:
+    """Call an OpenAI compatible provider (see _provider_request for configuration)."""
+    import requests
+
+    provider, url, headers, payload = _provider_request(prompt, max_tokens, stop)
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response_json = response.json() # Log the response
-        logger.info("RESPONSE:\n%s", json.dumps(response_json, indent=2))
-        #logger.info(f"RESPONSE: {response.json()}")
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.HTTPError as e:
-        error_message = f"HTTP error occurred: {e}"
+        response = get_http_session().post(url, headers=headers, json=payload, timeout=get_http_timeout())
+        if response.status_code >= 400:
+            raise _http_error(provider, response.status_code, response.reason, response.headers, response.text)
+        return _provider_text(provider, response.json())
+    except requests.exceptions.ConnectionError:
+        raise LLMConnectionError(f"Failed to connect to {provider} API. Check your network connection.", provider)
+    except requests.exceptions.Timeout:
+        raise LLMTimeoutError(f"Request to {provider} API timed out.", provider)
+    except requests.exceptions.RequestException as e:
+        raise LLMConnectionError(f"An error occurred while making the request to {provider}: {e}", provider)
+    except (ValueError, KeyError, IndexError):
+        raise LLMResponseError(f"Failed to parse response as JSON from {provider}. The server might have returned an invalid response.", provider)
+
+# By default, we Google Gemini 2.5 pro, as it shows great performance for code understanding
+def call_llm(prompt: str, use_cache: bool = True, max_tokens=None, stop=None) -> str:
+    start = time.monotonic()
+    try:
+        response_text, cache, latency = _call_llm_cached(prompt, use_cache, max_tokens, stop)
+    except Exception as e:
+        _log_call(prompt, None, "miss" if use_cache else "off", start, error=e)
+        raise
+    _log_call(prompt, response_text, cache, start, latency=latency)
+    return response_text
+
+
+def _log_call(prompt, response_text, cache, start, stream=False, error=None, latency=None):
+    """
+    Call log record (utils.llm_log) and metrics (utils.metrics) for one call.
+    latency: seconds of the provider request itself (without cache lookups or
+    rate limiter waits); when no request was made, the time since start.
+    """
+    provider, model = get_llm_provider(), get_llm_model()
+    if latency is None:
+        latency = time.monotonic() - start
+    prompt_tokens = estimate_tokens(prompt)
+    output_tokens = estimate_tokens(response_text) if response_text is not None else None
+    record_llm_call(provider, model, cache, latency, prompt_tokens, output_tokens, error)
+    log_llm_call(
+        prompt, response_text,
+        provider=provider, model=model, cache=cache, latency=latency,
+        prompt_tokens=prompt_tokens, output_tokens=output_tokens,
+        stream=stream, error=error,
+    )
+
+
+def _call_llm_cached(prompt, use_cache, max_tokens=None, stop=None):
+    """
+    (response text, cache status, provider latency or None) - see
+    utils.llm_log.log_llm_call for the statuses.
+    """
+    if not use_cache:
+        response_text, latency = _fetch(prompt, max_tokens, stop)
+        return response_text, "off", latency
+
+    cache_key = _cache_key(prompt, max_tokens, stop)
+    cached = get_cache().get(cache_key)
+    if cached is not None:
+        return cached, "hit", None
+    # Concurrent callers with the same key wait for one request.
+    # Uncached calls (retries) always get their own request.
+    leader = []
+
+    def fetch():
+        leader.append(True)
+        return _fetch(prompt, max_tokens, stop, cache_key)
+
+    response_text, latency = _in_flight.do(cache_key, fetch)
+    if not leader:
+        return response_text, "shared", None
+    return response_text, "miss" if latency is not None else "hit", latency
+
+
+def _fetch(prompt, max_tokens=None, stop=None, cache_key=None):
+    """
+    (response text, provider latency) from the provider; cached under
+    cache_key if given. The latency is None when the cache answered after all.
+    """
+    if cache_key:
+        # The previous call for this key may have finished right after our cache miss
+        cached = get_cache().get(cache_key)
+        if cached is not None:
+            return cached, None
+
+    provider = get_llm_provider()
+    tracker = get_latency_tracker(_hedge_key(max_tokens, stop))
+
+    def request():
+        # Wait for RPM/TPM quota before the request instead of getting a 429
+        limiter, reserved = _rate_limit(prompt, max_tokens)
+        if limiter:
+            limiter.acquire(reserved)
+        start = time.monotonic()
         try:
-            error_details = response.json().get("error", "No additional details")
-            error_message += f" (Details: {error_details})"
-        except:
-            pass
-        raise Exception(error_message)
+            if provider == "GEMINI":
+                text = _call_llm_gemini(prompt, max_tokens, stop)
+            else:  # generic method using a URL that is OpenAI compatible API (Ollama, ...)
+                text = _call_llm_provider(prompt, max_tokens, stop)
+        except BaseException:
+            _settle(limiter, reserved, prompt, None)
+            raise
+        latency = time.monotonic() - start
+        tracker.record(latency)
+        _settle(limiter, reserved, prompt, text)
+        return text, latency
+
+    # Optionally a second request after the p95 latency (see utils.hedge)
+    response_text, latency = hedged_call(request, tracker) if hedging_enabled() else request()
+
+    # Update cache if enabled (one entry written, nothing re-read)
+    if cache_key:
+        get_cache().set(cache_key, response_text)
+
+    return response_text, latency
+
+
+def _gemini_client():
+    project_id = os.getenv("GEMINI_PROJECT_ID")
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not project_id and not api_key:
+        raise ValueError("Either GEMINI_PROJECT_ID or GEMINI_API_KEY must be set in the environment")
+    connect_timeout, read_timeout = get_http_timeout()
+    return _get_gemini_client(
+        project_id,
+        os.getenv("GEMINI_LOCATION", "us-central1"),
+        None if project_id else api_key,
+        int((connect_timeout + read_timeout) * 1000),
+    )
+
+
+def _gemini_thinking_model(model):
+    # The -latest aliases (gemini-flash-latest, gemini-pro-latest, ...) point at thinking models too
+    return re.match(r"gemini-(2\.5|[3-9])", model) is not None or model.endswith("-latest")
+
+
+def _gemini_config(model, max_tokens=None, stop=None):
+    # Gemini 2.5+ models think before answering and max_output_tokens counts
+    # the thinking tokens too, so a capped answer gets a fixed thinking budget
+    # (GEMINI_THINKING_BUDGET, default 1024) on top of its own max_tokens
+    types = _genai().types
+    thinking = None
+    if max_tokens and _gemini_thinking_model(model):
+        budget = int(os.getenv("GEMINI_THINKING_BUDGET", "1024"))
+        thinking = types.ThinkingConfig(thinking_budget=budget)
+        max_tokens += budget
+    if not max_tokens and not stop:
+        return None
+    return types.GenerateContentConfig(max_output_tokens=max_tokens, stop_sequences=stop, thinking_config=thinking)
+
+
+def _gemini_finished(response):
+    """Raise if a Gemini response (or stream chunk) stopped at the token limit."""
+    candidates = response.candidates or []
+    if candidates and candidates[0].finish_reason == "MAX_TOKENS":
+        raise LLMTruncatedError(
+            "Gemini answer stopped at max_output_tokens (thinking tokens count too); "
+            "raise LLM_MAX_TOKENS_<NODE> or GEMINI_THINKING_BUDGET", "GEMINI")
+
+
+def _gemini_text(response):
+    """Answer text; an empty or cut-off answer is an error, so it is never cached."""
+    _gemini_finished(response)
+    text = response.text
+    if text is None:
+        candidates = response.candidates or []
+        reason = candidates[0].finish_reason if candidates else None
+        raise LLMResponseError(f"Gemini returned no text (finish reason {reason})", "GEMINI")
+    return text
+
+
+def _call_llm_gemini(prompt: str, max_tokens=None, stop=None) -> str:
+    client = _gemini_client()
+    model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
+    try:
+        response = client.models.generate_content(
+            model=model,
+            contents=[prompt],
+            config=_gemini_config(model, max_tokens, stop),
+        )
+    except _genai().errors.APIError as e:
+        raise _gemini_error(e)
+    return _gemini_text(response)
+
+
+def _sse_delta(line, provider=None):
+    """
+    Text delta of one chat-completions stream line ("data: {...}"), or None.
+    Raises LLMTruncatedError on the chunk that finishes at the length limit.
+    """
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    choices = json.loads(data).get("choices") or []
+    if not choices:
+        return None
+    if choices[0].get("finish_reason") == "length":
+        raise _truncated(provider)
+    return (choices[0].get("delta") or {}).get("content")
+
+
+def _stream_llm_provider(prompt: str, max_tokens=None, stop=None):
+    """Stream an OpenAI compatible provider (chat-completions with stream=true)."""
+    import requests
+
+    provider, url, headers, payload = _provider_request(prompt, max_tokens, stop)
+    payload["stream"] = True
+
+    try:
+        with get_http_session().post(url, headers=headers, json=payload,
+                                     timeout=get_http_timeout(), stream=True) as response:
+            if response.status_code >= 400:
+                raise _http_error(provider, response.status_code, response.reason, response.headers, response.text)
+            # SSE responses often have no charset, decode the bytes ourselves
+            for raw_line in response.iter_lines():
+                text = _sse_delta(raw_line.decode("utf-8"), provider)
+                if text:
+                    yield text
     except requests.exceptions.ConnectionError:
-        raise Exception(f"Failed to connect to {provider} API. Check your network connection.")
+        raise LLMConnectionError(f"Failed to connect to {provider} API. Check your network connection.", provider)
     except requests.exceptions.Timeout:
-        raise Exception(f"Request to {provider} API timed out.")
+        raise LLMTimeoutError(f"Request to {provider} API timed out.", provider)
     except requests.exceptions.RequestException as e:
-        raise Exception(f"An error occurred while making the request to {provider}: {e}")
+        raise LLMConnectionError(f"An error occurred while making the request to {provider}: {e}", provider)
     except ValueError:
-        raise Exception(f"Failed to parse response as JSON from {provider}. The server might have returned an invalid response.")
+        raise LLMResponseError(f"Failed to parse stream chunk as JSON from {provider}.", provider)
 
-# By default, we Google Gemini 2.5 pro, as it shows great performance for code understanding
-def call_llm(prompt: str, use_cache: bool = True) -> str:
-    # Log the prompt
-    logger.info(f"PROMPT: {prompt}")
 
-    # Check cache if enabled
+def _stream_llm_gemini(prompt: str, max_tokens=None, stop=None):
+    client = _gemini_client()
+    model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
+    try:
+        for chunk in client.models.generate_content_stream(
+                model=model, contents=[prompt], config=_gemini_config(model, max_tokens, stop)):
+            if chunk.text:
+                yield chunk.text
+            _gemini_finished(chunk)
+    except _genai().errors.APIError as e:
+        raise _gemini_error(e)
+
+
+def stream_llm(prompt: str, use_cache: bool = True, max_tokens=None, stop=None):
+    """
+    Like call_llm, but yields the response text in chunks as they arrive.
+    A cached response is yielded as one chunk; a complete streamed response is cached.
+    """
+    start = time.monotonic()
     if use_cache:
-        # Load cache from disk
-        cache = load_cache()
-        # Return from cache if exists
-        if prompt in cache:
-            logger.info(f"RESPONSE: {cache[prompt]}")
-            return cache[prompt]
+        cache_key = _cache_key(prompt, max_tokens, stop)
+        cached = get_cache().get(cache_key)
+        if cached is not None:
+            _log_call(prompt, cached, "hit", start, stream=True)
+            yield cached
+            return
 
+    limiter, reserved = _rate_limit(prompt, max_tokens)
+    if limiter:
+        limiter.acquire(reserved)
     provider = get_llm_provider()
+    request_start = time.monotonic()
     if provider == "GEMINI":
-        response_text = _call_llm_gemini(prompt)
-    else:  # generic method using a URL that is OpenAI compatible API (Ollama, ...)
-        response_text = _call_llm_provider(prompt)
-
-    # Log the response
-    logger.info(f"RESPONSE: {response_text}")
+        chunks = _stream_llm_gemini(prompt, max_tokens, stop)
+    else:
+        chunks = _stream_llm_provider(prompt, max_tokens, stop)
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        _settle(limiter, reserved, prompt, None)
+        _log_call(prompt, None, "miss" if use_cache else "off", start, stream=True, error=e)
+        raise
+    latency = time.monotonic() - request_start
+    response_text = "".join(parts)
+    _settle(limiter, reserved, prompt, response_text)
+    _log_call(prompt, response_text, "miss" if use_cache else "off", start, stream=True, latency=latency)
 
-    # Update cache if enabled
     if use_cache:
-        # Load cache again to avoid overwrites
-        cache = load_cache()
-        # Add to cache and save
-        cache[prompt] = response_text
-        save_cache(cache)
+        get_cache().set(cache_key, response_text)
 
-    return response_text
 
+# ---------------------------------------------------------------------------
+# asyncio path: same providers, cache and logging as call_llm, but without
+# blocking the event loop, so one loop can drive many student flows.
+# ---------------------------------------------------------------------------
+
+# httpx.AsyncClient pools are bound to the event loop they were created on
+_async_http_clients = weakref.WeakKeyDictionary()
 
-def _call_llm_gemini(prompt: str) -> str:
-    if os.getenv("GEMINI_PROJECT_ID"):
-        client = genai.Client(
-            vertexai=True,
-            project=os.getenv("GEMINI_PROJECT_ID"),
-            location=os.getenv("GEMINI_LOCATION", "us-central1")
+
+def get_async_http_client():
+    """Pooled keep-alive httpx.AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        import httpx
+
+        connect_timeout, read_timeout = get_http_timeout()
+        pool_size = int(os.getenv("LLM_HTTP_POOL_SIZE", "32"))
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
         )
-    elif os.getenv("GEMINI_API_KEY"):
-        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    else:
-        raise ValueError("Either GEMINI_PROJECT_ID or GEMINI_API_KEY must be set in the environment")
+        _async_http_clients[loop] = client
+    return client
+
+
+async def _acall_llm_provider(prompt: str, max_tokens=None, stop=None) -> str:
+    """Async version of _call_llm_provider."""
+    import httpx
+
+    provider, url, headers, payload = _provider_request(prompt, max_tokens, stop)
+
+    try:
+        response = await get_async_http_client().post(url, headers=headers, json=payload)
+        if response.status_code >= 400:
+            raise _http_error(provider, response.status_code, response.reason_phrase, response.headers, response.text)
+        return _provider_text(provider, response.json())
+    except httpx.ConnectError:
+        raise LLMConnectionError(f"Failed to connect to {provider} API. Check your network connection.", provider)
+    except httpx.TimeoutException:
+        raise LLMTimeoutError(f"Request to {provider} API timed out.", provider)
+    except httpx.HTTPError as e:
+        raise LLMConnectionError(f"An error occurred while making the request to {provider}: {e}", provider)
+    except (ValueError, KeyError, IndexError):
+        raise LLMResponseError(f"Failed to parse response as JSON from {provider}. The server might have returned an invalid response.", provider)
+
+
+async def _acall_llm_gemini(prompt: str, max_tokens=None, stop=None) -> str:
+    client = _gemini_client()
     model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
-    response = client.models.generate_content(
-        model=model,
-        contents=[prompt]
-    )
-    return response.text
+    try:
+        response = await client.aio.models.generate_content(
+            model=model,
+            contents=[prompt],
+            config=_gemini_config(model, max_tokens, stop),
+        )
+    except _genai().errors.APIError as e:
+        raise _gemini_error(e)
+    return _gemini_text(response)
+
+
+# The persistent cache tier is SQLite with a busy timeout: async callers use it
+# through worker threads, so one locked database never stalls the event loop
+async def _acache_get(key):
+    return await asyncio.to_thread(get_cache().get, key)
+
+
+async def _acache_set(key, value):
+    await asyncio.to_thread(get_cache().set, key, value)
+
+
+async def acall_llm(prompt: str, use_cache: bool = True, max_tokens=None, stop=None) -> str:
+    """Coroutine version of call_llm (same cache, same providers)."""
+    start = time.monotonic()
+    try:
+        response_text, cache, latency = await _acall_llm_cached(prompt, use_cache, max_tokens, stop)
+    except Exception as e:
+        _log_call(prompt, None, "miss" if use_cache else "off", start, error=e)
+        raise
+    _log_call(prompt, response_text, cache, start, latency=latency)
+    return response_text
+
+
+async def _acall_llm_cached(prompt, use_cache, max_tokens=None, stop=None):
+    """Async version of _call_llm_cached."""
+    if not use_cache:
+        response_text, latency = await _afetch(prompt, max_tokens, stop)
+        return response_text, "off", latency
+
+    cache_key = _cache_key(prompt, max_tokens, stop)
+    cached = await _acache_get(cache_key)
+    if cached is not None:
+        return cached, "hit", None
+    leader = []
+
+    def fetch():
+        leader.append(True)
+        return _afetch(prompt, max_tokens, stop, cache_key)
+
+    response_text, latency = await _async_in_flight.do(cache_key, fetch)
+    if not leader:
+        return response_text, "shared", None
+    return response_text, "miss" if latency is not None else "hit", latency
+
+
+async def _afetch(prompt, max_tokens=None, stop=None, cache_key=None):
+    """Async version of _fetch."""
+    if cache_key:
+        cached = await _acache_get(cache_key)
+        if cached is not None:
+            return cached, None
+
+    provider = get_llm_provider()
+    tracker = get_latency_tracker(_hedge_key(max_tokens, stop))
+
+    async def request():
+        limiter, reserved = _rate_limit(prompt, max_tokens)
+        if limiter:
+            await limiter.aacquire(reserved)
+        start = time.monotonic()
+        try:
+            if provider == "GEMINI":
+                text = await _acall_llm_gemini(prompt, max_tokens, stop)
+            else:
+                text = await _acall_llm_provider(prompt, max_tokens, stop)
+        except BaseException:  # also a hedge loser being cancelled
+            await _asettle(limiter, reserved, prompt, None)
+            raise
+        latency = time.monotonic() - start
+        tracker.record(latency)
+        await _asettle(limiter, reserved, prompt, text)
+        return text, latency
+
+    response_text, latency = await ahedged_call(request, tracker) if hedging_enabled() else await request()
+
+    if cache_key:
+        await _acache_set(cache_key, response_text)
+
+    return response_text, latency
+
+
+async def _astream_llm_provider(prompt: str, max_tokens=None, stop=None):
+    """Async version of _stream_llm_provider."""
+    import httpx
+
+    provider, url, headers, payload = _provider_request(prompt, max_tokens, stop)
+    payload["stream"] = True
+
+    try:
+        async with get_async_http_client().stream("POST", url, headers=headers, json=payload) as response:
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")
+                raise _http_error(provider, response.status_code, response.reason_phrase, response.headers, body)
+            async for line in response.aiter_lines():
+                text = _sse_delta(line, provider)
+                if text:
+                    yield text
+    except httpx.ConnectError:
+        raise LLMConnectionError(f"Failed to connect to {provider} API. Check your network connection.", provider)
+    except httpx.TimeoutException:
+        raise LLMTimeoutError(f"Request to {provider} API timed out.", provider)
+    except httpx.HTTPError as e:
+        raise LLMConnectionError(f"An error occurred while making the request to {provider}: {e}", provider)
+    except ValueError:
+        raise LLMResponseError(f"Failed to parse stream chunk as JSON from {provider}.", provider)
+
+
+async def _astream_llm_gemini(prompt: str, max_tokens=None, stop=None):
+    client = _gemini_client()
+    model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
+    try:
+        async for chunk in await client.aio.models.generate_content_stream(
+                model=model, contents=[prompt], config=_gemini_config(model, max_tokens, stop)):
+            if chunk.text:
+                yield chunk.text
+            _gemini_finished(chunk)
+    except _genai().errors.APIError as e:
+        raise _gemini_error(e)
+
+
+async def astream_llm(prompt: str, use_cache: bool = True, max_tokens=None, stop=None):
+    """Async generator version of stream_llm."""
+    start = time.monotonic()
+    if use_cache:
+        cache_key = _cache_key(prompt, max_tokens, stop)
+        cached = await _acache_get(cache_key)
+        if cached is not None:
+            _log_call(prompt, cached, "hit", start, stream=True)
+            yield cached
+            return
+
+    limiter, reserved = _rate_limit(prompt, max_tokens)
+    if limiter:
+        await limiter.aacquire(reserved)
+    provider = get_llm_provider()
+    request_start = time.monotonic()
+    if provider == "GEMINI":
+        chunks = _astream_llm_gemini(prompt, max_tokens, stop)
+    else:
+        chunks = _astream_llm_provider(prompt, max_tokens, stop)
+    parts = []
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        await _asettle(limiter, reserved, prompt, None)
+        _log_call(prompt, None, "miss" if use_cache else "off", start, stream=True, error=e)
+        raise
+    latency = time.monotonic() - request_start
+    response_text = "".join(parts)
+    await _asettle(limiter, reserved, prompt, response_text)
+    _log_call(prompt, response_text, "miss" if use_cache else "off", start, stream=True, latency=latency)
+
+    if use_cache:
+        await _acache_set(cache_key, response_text)
+
 
 if __name__ == "__main__":
     test_prompt = "greetings!"
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import threading
+from utils.node_store import stage_fingerprint
+
+# Checkpoints of the teacher flow's shared store (CHECKPOINT_PATH, default
+# checkpoints.db), so an interrupted flow resumes after its last completed
+# node instead of paying for every LLM stage again.
+# - one row per (student, run ID): the shared dict after the latest completed
+#   node as compressed JSON, plus the actions returned so far (the path
+#   through the flow); replaced after each node, deleted when the flow ends
+# - a checkpoint is only resumed while the student's data and the flow
+#   options are unchanged (fingerprint), otherwise it is dropped and the flow
+#   starts over
+# - runtime objects (report bundle, streaming callbacks) are not saved, and
+#   on resume the new run's own shared values win over the saved ones
+# The flows that use it are CheckpointedFlow / CheckpointedAsyncFlow (flow.py).
+
+LATEST = "latest"  # resume the student's most recent checkpoint, whatever its run
+TRANSIENT_KEYS = frozenset({"report_bundle", "on_html_block"})
+
+
+def new_run_id() -> str:
+    """Sortable run ID, e.g. 20260118-213005-4f2a9c."""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+def _encode(state) -> bytes:
+    return zlib.compress(json.dumps(state, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class CheckpointStore:
+    def __init__(self, path="checkpoints.db"):
+        self.path = path
+        self._local = threading.local()  # sqlite connections are per-thread
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " student_id TEXT NOT NULL,"
+                " run_id TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " node TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " state BLOB NOT NULL,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (student_id, run_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_checkpoints_latest ON checkpoints(student_id, updated)")
+            self._local.conn = conn
+        return conn
+
+    def save(self, student_id, run_id, fingerprint, node, path, state):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO checkpoints (student_id, run_id, fingerprint, node, path, state, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (student_id, run_id, fingerprint, node, json.dumps(path), _encode(state), time.time()),
+        )
+
+    def load(self, student_id, run_id=None):
+        """The checkpoint of this run (or the student's latest when run_id is None), or None."""
+        query = "SELECT run_id, fingerprint, node, path, state FROM checkpoints WHERE student_id = ?"
+        if run_id is None:
+            row = self._conn().execute(query + " ORDER BY updated DESC LIMIT 1", (student_id,)).fetchone()
+        else:
+            row = self._conn().execute(query + " AND run_id = ?", (student_id, run_id)).fetchone()
+        if row is None:
+            return None
+        run_id, fingerprint, node, path, state = row
+        try:
+            return {"run_id": run_id, "fingerprint": fingerprint, "node": node,
+                    "path": json.loads(path), "state": _decode(state)}
+        except (ValueError, zlib.error):
+            self.delete(student_id, run_id)
+            return None
+
+    def delete(self, student_id, run_id):
+        self._conn().execute("DELETE FROM checkpoints WHERE student_id = ? AND run_id = ?", (student_id, run_id))
+
+
+class Checkpoint:
+    """
+    Checkpointing of one student's flow in one run.
+    resume_from: None (start over), a run ID, or LATEST. When a matching
+    checkpoint is found the flow continues under that checkpoint's run ID.
+    """
+
+    def __init__(self, student_id, run_id=None, resume_from=None, store=None):
+        self.student_id = str(student_id)
+        self.run_id = run_id or new_run_id()
+        self.resume_from = resume_from
+        self.store = store or get_checkpoint_store()
+        self.fingerprint = None
+
+    def restore(self, shared, options=None):
+        """
+        Actions of the nodes completed by the resumed run (empty: start from
+        the first node). Saved values missing from shared are filled in.
+        """
+        self.fingerprint = stage_fingerprint("checkpoint:v1", {
+            "student": shared.get("student_data"),
+            "max_subjects": shared.get("max_subjects"),
+            "max_topics": shared.get("max_topics"),
+            "options": options or {},
+        })
+        if not self.resume_from:
+            return []
+        saved = self.store.load(self.student_id, None if self.resume_from == LATEST else self.resume_from)
+        if saved is None:
+            return []
+        if saved["fingerprint"] != self.fingerprint:
+            print(f"⚠️  Checkpoint {saved['run_id']} of {self.student_id} does not match the current data "
+                  f"or flow options, starting over")
+            self.store.delete(self.student_id, saved["run_id"])
+            return []
+        for key, value in saved["state"].items():
+            shared.setdefault(key, value)
+        self.run_id = saved["run_id"]
+        print(f"⏩ Resuming {self.student_id} (run {self.run_id}) after {saved['node']}")
+        return saved["path"]
+
+    def save(self, shared, path, node):
+        state = {
+            key: value for key, value in shared.items()
+            if key not in TRANSIENT_KEYS and not callable(value)
+        }
+        self.store.save(self.student_id, self.run_id, self.fingerprint, node, path, state)
+
+    def finish(self):
+        """The flow completed: nothing is left to resume."""
+        self.store.delete(self.student_id, self.run_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """Process-wide checkpoint store (SQLite file CHECKPOINT_PATH, default checkpoints.db)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CheckpointStore(os.getenv("CHECKPOINT_PATH", "checkpoints.db"))
+    return _store
@@ -1,6 +1,153 @@
 import os
+import re
+import time
 import fnmatch
 import pathspec
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Single pass over the tree with os.scandir: directories are pruned while
+# scanning, every path is checked once against one precompiled matcher
+# (.gitignore + exclude + include), and directories are listed and their
+# files read on a thread pool (CRAWL_THREADS) while the scan goes on. Files
+# with NUL bytes in their first block are skipped as binary. Progress is
+# printed at most every PROGRESS_INTERVAL seconds instead of once per file.
+
+SNIFF_BYTES = 8192
+READ_CHUNK = 64  # files of one directory read per pool task
+PROGRESS_INTERVAL = 1.0
+
+
+def _compile_patterns(patterns):
+    """One regex for a set of fnmatch patterns (None when there are none)."""
+    if not patterns:
+        return None
+    if isinstance(patterns, str):
+        patterns = {patterns}
+    return re.compile("|".join(fnmatch.translate(os.path.normcase(p)) for p in patterns))
+
+
+class PathMatcher:
+    """
+    .gitignore, exclude and include patterns of one crawl, compiled once.
+    Include/exclude use fnmatch semantics on the file's key (relative path
+    or full path, as returned); .gitignore is matched relative to the root.
+    """
+
+    def __init__(self, include_patterns=None, exclude_patterns=None, gitignore_spec=None):
+        self.include = _compile_patterns(include_patterns)
+        self.exclude = _compile_patterns(exclude_patterns)
+        self.gitignore = gitignore_spec
+
+    def skip_dir(self, relpath, name) -> bool:
+        if self.gitignore and self.gitignore.match_file(relpath + "/"):
+            return True
+        if self.exclude:
+            return bool(self.exclude.match(os.path.normcase(relpath)) or self.exclude.match(os.path.normcase(name)))
+        return False
+
+    def skip_file(self, relpath, key) -> bool:
+        if self.gitignore and self.gitignore.match_file(relpath):
+            return True
+        key = os.path.normcase(key)
+        if self.exclude and self.exclude.match(key):
+            return True
+        return bool(self.include and not self.include.match(key))
+
+
+def _load_gitignore(directory):
+    gitignore_path = os.path.join(directory, ".gitignore")
+    if not os.path.exists(gitignore_path):
+        return None
+    try:
+        with open(gitignore_path, "r", encoding="utf-8-sig") as f:
+            spec = pathspec.PathSpec.from_lines("gitwildmatch", f.readlines())
+        print(f"Loaded .gitignore patterns from {gitignore_path}")
+        return spec
+    except Exception as e:
+        print(f"Warning: Could not read or parse .gitignore file {gitignore_path}: {e}")
+        return None
+
+
+def _list_dir(path, relpath, matcher, use_relative_paths):
+    """
+    (files [(path, key, DirEntry)], subdirectories [(path, relpath)], excluded
+    count) of one directory. Symlinked directories are not followed.
+    """
+    files, subdirs, excluded = [], [], 0
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        print(f"Warning: Could not list directory {path}: {e}")
+        return files, subdirs, excluded
+    for entry in entries:
+        entry_rel = os.path.join(relpath, entry.name) if relpath else entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if not entry.is_symlink() and not matcher.skip_dir(entry_rel, entry.name):
+                subdirs.append((entry.path, entry_rel))
+            continue
+        key = entry_rel if use_relative_paths else entry.path
+        if matcher.skip_file(entry_rel, key):
+            excluded += 1
+        else:
+            files.append((entry.path, key, entry))
+    return files, subdirs, excluded
+
+
+def _read_text(filepath, entry, max_file_size):
+    """(content, None), or (None, "size" | "binary") for skipped files; raises OSError."""
+    if max_file_size and entry.stat().st_size > max_file_size:
+        return None, "size"
+    with open(filepath, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+        if b"\0" in head:
+            return None, "binary"
+        data = head + f.read()
+    try:
+        content = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return None, "binary"
+    if "\r" in content:  # same newlines as reading in text mode
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content, None
+
+
+def _read_chunk(files, max_file_size):
+    """[(path, key, content, skip reason or read error)] of some files of one directory."""
+    results = []
+    for filepath, key, entry in files:
+        try:
+            content, skipped = _read_text(filepath, entry, max_file_size)
+        except OSError as e:
+            content, skipped = None, e
+        results.append((filepath, key, content, skipped))
+    return results
+
+
+class _Progress:
+    """Counts of one crawl, printed at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(("dirs", "found", "excluded", "read", "size", "binary", "error"), 0)
+        self._next = time.monotonic() + PROGRESS_INTERVAL
+
+    def add(self, name, count=1):
+        self.counts[name] += count
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + PROGRESS_INTERVAL
+            self.show()
+
+    def show(self, final=False):
+        c = self.counts
+        label = "Crawled" if final else "Progress"
+        print(f"\033[92m{label}: {c['dirs']} directories, {c['found']} files found, {c['read']} read, "
+              f"{c['excluded']} excluded, {c['size']} over size limit, {c['binary']} binary, "
+              f"{c['error']} unreadable\033[0m")
 
 
 def crawl_local_files(
@@ -9,6 +156,7 @@ def crawl_local_files(
     exclude_patterns=None,
     max_file_size=None,
     use_relative_paths=True,
+    max_workers=None,
 ):
     """
     Crawl files in a local directory with similar interface as crawl_github_files.
@@ -18,114 +166,58 @@ def crawl_local_files(
         exclude_patterns (set): File patterns to exclude (e.g. {"tests/*"})
         max_file_size (int): Maximum file size in bytes
         use_relative_paths (bool): Whether to use paths relative to directory
+        max_workers (int): Threads listing and reading (default: CRAWL_THREADS or 16)
 
     Returns:
-        dict: {"files": {filepath: content}}
+        dict: {"files": {filepath: content}} in directory walk order;
+        binary and undecodable files are skipped
     """
     if not os.path.isdir(directory):
         raise ValueError(f"Directory does not exist: {directory}")
 
-    files_dict = {}
-
-    # --- Load .gitignore ---
-    gitignore_path = os.path.join(directory, ".gitignore")
-    gitignore_spec = None
-    if os.path.exists(gitignore_path):
-        try:
-            with open(gitignore_path, "r", encoding="utf-8-sig") as f:
-                gitignore_patterns = f.readlines()
-            gitignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", gitignore_patterns)
-            print(f"Loaded .gitignore patterns from {gitignore_path}")
-        except Exception as e:
-            print(f"Warning: Could not read or parse .gitignore file {gitignore_path}: {e}")
-
-    all_files = []
-    for root, dirs, files in os.walk(directory):
-        # Filter directories using .gitignore and exclude_patterns early
-        excluded_dirs = set()
-        for d in dirs:
-            dirpath_rel = os.path.relpath(os.path.join(root, d), directory)
-
-            if gitignore_spec and gitignore_spec.match_file(dirpath_rel):
-                excluded_dirs.add(d)
-                continue
-
-            if exclude_patterns:
-                for pattern in exclude_patterns:
-                    if fnmatch.fnmatch(dirpath_rel, pattern) or fnmatch.fnmatch(d, pattern):
-                        excluded_dirs.add(d)
-                        break
-
-        for d in dirs.copy():
-            if d in excluded_dirs:
-                dirs.remove(d)
-
-        for filename in files:
-            filepath = os.path.join(root, filename)
-            all_files.append(filepath)
-
-    total_files = len(all_files)
-    processed_files = 0
-
-    for filepath in all_files:
-        relpath = os.path.relpath(filepath, directory) if use_relative_paths else filepath
-
-        # --- Exclusion check ---
-        excluded = False
-        if gitignore_spec and gitignore_spec.match_file(relpath):
-            excluded = True
-
-        if not excluded and exclude_patterns:
-            for pattern in exclude_patterns:
-                if fnmatch.fnmatch(relpath, pattern):
-                    excluded = True
-                    break
-
-        included = False
-        if include_patterns:
-            for pattern in include_patterns:
-                if fnmatch.fnmatch(relpath, pattern):
-                    included = True
-                    break
-        else:
-            included = True
-
-        processed_files += 1 # Increment processed count regardless of inclusion/exclusion
-
-        status = "processed"
-        if not included or excluded:
-            status = "skipped (excluded)"
-            # Print progress for skipped files due to exclusion
-            if total_files > 0:
-                percentage = (processed_files / total_files) * 100
-                rounded_percentage = int(percentage)
-                print(f"\033[92mProgress: {processed_files}/{total_files} ({rounded_percentage}%) {relpath} [{status}]\033[0m")
-            continue # Skip to next file if not included or excluded
-
-        if max_file_size and os.path.getsize(filepath) > max_file_size:
-            status = "skipped (size limit)"
-            # Print progress for skipped files due to size limit
-            if total_files > 0:
-                percentage = (processed_files / total_files) * 100
-                rounded_percentage = int(percentage)
-                print(f"\033[92mProgress: {processed_files}/{total_files} ({rounded_percentage}%) {relpath} [{status}]\033[0m")
-            continue # Skip large files
-
-        # --- File is being processed ---        
-        try:
-            with open(filepath, "r", encoding="utf-8-sig") as f:
-                content = f.read()
-            files_dict[relpath] = content
-        except Exception as e:
-            print(f"Warning: Could not read file {filepath}: {e}")
-            status = "skipped (read error)"
-
-        # --- Print progress for processed or error files ---
-        if total_files > 0:
-            percentage = (processed_files / total_files) * 100
-            rounded_percentage = int(percentage)
-            print(f"\033[92mProgress: {processed_files}/{total_files} ({rounded_percentage}%) {relpath} [{status}]\033[0m")
+    matcher = PathMatcher(include_patterns, exclude_patterns, _load_gitignore(directory))
+    progress = _Progress()
+    max_workers = max_workers or int(os.getenv("CRAWL_THREADS", "16"))
 
+    files_dict = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl") as pool:
+        # Directories are listed in parallel; a listed directory queues its
+        # files for reading (in chunks) and its subdirectories for listing
+        listing = {pool.submit(_list_dir, directory, "", matcher, use_relative_paths): ""}
+        listed = {}  # relpath -> (read futures, subdirectory relpaths)
+        while listing:
+            done, _ = wait(listing, return_when=FIRST_COMPLETED)
+            for future in done:
+                relpath = listing.pop(future)
+                files, subdirs, excluded = future.result()
+                chunks = [
+                    pool.submit(_read_chunk, files[i:i + READ_CHUNK], max_file_size)
+                    for i in range(0, len(files), READ_CHUNK)
+                ]
+                listed[relpath] = (chunks, [sub_rel for _, sub_rel in subdirs])
+                for sub_path, sub_rel in subdirs:
+                    listing[pool.submit(_list_dir, sub_path, sub_rel, matcher, use_relative_paths)] = sub_rel
+                progress.add("excluded", excluded)
+                progress.add("found", len(files))
+                progress.add("dirs")
+
+        # Collect in os.walk order: a directory's files, then its subdirectories
+        stack = [""]
+        while stack:
+            chunks, subdirs = listed.pop(stack.pop())
+            for chunk in chunks:
+                for filepath, key, content, skipped in chunk.result():
+                    if content is not None:
+                        files_dict[key] = content
+                        progress.add("read")
+                    elif isinstance(skipped, OSError):
+                        print(f"Warning: Could not read file {filepath}: {skipped}")
+                        progress.add("error")
+                    else:
+                        progress.add(skipped)
+            stack.extend(reversed(subdirs))
+
+    progress.show(final=True)
     return {"files": files_dict}
 
 
@@ -144,4 +236,4 @@ if __name__ == "__main__":
     )
     print(f"Found {len(files_data['files'])} files:")
     for path in files_data["files"]:
-        print(f"  {path}")
\ No newline at end of file
+        print(f"  {path}")
@@ -0,0 +1,149 @@
+from array import array
+
+import numpy as np
+
+# Marks at or below this value count as failing (5-point scale)
+FAILING_MARK = 2
+
+STAT_NAMES = ("mean", "median", "trend", "variance", "failing", "count", "percentile")
+
+
+class CohortAnalytics:
+    """
+    Per-subject grade statistics of a cohort that is streamed in once
+    (add / from_students), without keeping the student records: only a
+    login -> row index and flat numeric arrays of marks per subject. The
+    statistics are computed with array operations when the cohort is
+    complete; get() builds one student's dict on demand.
+    """
+
+    def __init__(self):
+        self._rows = {}  # login -> row number
+        self._marks = {}  # subject -> (rows, lengths, values) as flat arrays
+        self._stats = None  # subject -> (row -> position, {stat: np.ndarray})
+
+    @classmethod
+    def from_students(cls, students):
+        """From (student_id, normalized student) pairs; a student may be None (no marks)."""
+        cohort = cls()
+        for student_id, student in students:
+            cohort.add(student_id, student)
+        return cohort
+
+    def add(self, student_id, student):
+        if student_id in self._rows:
+            return
+        row = self._rows[student_id] = len(self._rows)
+        self._stats = None
+        for subject, marks in ((student or {}).get("Marks") or {}).items():
+            if marks:
+                rows, lengths, values = self._marks.setdefault(subject, (array("q"), array("q"), array("d")))
+                rows.append(row)
+                lengths.append(len(marks))
+                values.extend(marks)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def logins(self):
+        """Student ids in the order they were added."""
+        return iter(self._rows)
+
+    def _compute(self):
+        self._stats = {}
+        for subject, (rows, lengths, values) in self._marks.items():
+            lengths = np.frombuffer(lengths, dtype=np.int64)
+            rows = np.frombuffer(rows, dtype=np.int64)
+            # Ragged mark lists -> one NaN-padded matrix, without a Python loop
+            marks = np.full((len(lengths), int(lengths.max())), np.nan)
+            starts = np.cumsum(lengths) - lengths
+            row_index = np.repeat(np.arange(len(lengths)), lengths)
+            column_index = np.arange(len(values)) - np.repeat(starts, lengths)
+            marks[row_index, column_index] = np.frombuffer(values, dtype=float)
+            position = {int(row): i for i, row in enumerate(rows)}
+            self._stats[subject] = (position, _matrix_stats(marks))
+
+    def get(self, student_id):
+        """{subject: {"mean", "median", ...}} of one student ({} without marks), None if unknown."""
+        row = self._rows.get(student_id)
+        if row is None:
+            return None
+        if self._stats is None:
+            self._compute()
+        result = {}
+        for subject, (position, stats) in self._stats.items():
+            i = position.get(row)
+            if i is not None:
+                result[subject] = {name: stats[name][i].item() for name in STAT_NAMES}
+        return result
+
+
+def compute_cohort_analytics(students: dict) -> dict:
+    """
+    Per-subject grade statistics for a whole cohort, computed with array
+    operations (one padded matrix per subject, no per-student Python loops
+    over marks).
+
+    Args:
+        students (dict): {student_id: normalized student data (with "Marks")}
+
+    Returns:
+        dict: {student_id: {subject: {"mean", "median", "trend", "variance",
+               "failing", "count", "percentile"}}}
+        trend is the least-squares slope of the marks in points per mark,
+        percentile is the rank of the student's mean among everyone in the
+        cohort who has that subject (0-100).
+        Large cohorts should use CohortAnalytics directly.
+    """
+    cohort = CohortAnalytics.from_students(students.items())
+    return {student_id: cohort.get(student_id) for student_id in students}
+
+
+def _matrix_stats(marks):
+    """Statistics for one subject; marks is a NaN-padded matrix (one row per student)."""
+    width = marks.shape[1]
+    present = ~np.isnan(marks)
+    count = present.sum(axis=1)
+
+    mean = np.nanmean(marks, axis=1)
+    median = np.nanmedian(marks, axis=1)
+    variance = np.nanvar(marks, axis=1)
+    failing = np.sum(present & (marks <= FAILING_MARK), axis=1)
+
+    # Least-squares slope over the position of each mark
+    x = np.where(present, np.arange(width, dtype=float), np.nan)
+    x_centered = x - np.nanmean(x, axis=1, keepdims=True)
+    y_centered = marks - mean[:, None]
+    denominator = np.nansum(x_centered ** 2, axis=1)
+    numerator = np.nansum(x_centered * y_centered, axis=1)
+    trend = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+    # Percentile rank of the mean inside the cohort (ties count half)
+    sorted_means = np.sort(mean)
+    below = np.searchsorted(sorted_means, mean, side="left")
+    not_above = np.searchsorted(sorted_means, mean, side="right")
+    percentile = (below + not_above) / 2 / len(marks) * 100
+
+    return {
+        "mean": np.round(mean, 2),
+        "median": np.round(median, 2),
+        "trend": np.round(trend, 2) + 0.0,  # + 0.0 turns -0.0 into 0.0
+        "variance": np.round(variance, 2),
+        "failing": failing.astype(int),
+        "count": count.astype(int),
+        "percentile": np.round(percentile).astype(int),
+    }
+
+
+def format_analytics(analytics: dict, include_percentile: bool = True) -> str:
+    """Compact one-line-per-subject text for prompts."""
+    lines = []
+    for subject, s in analytics.items():
+        line = (
+            f"{subject}: mean {s['mean']}, median {s['median']}, trend {s['trend']:+}/mark, "
+            f"variance {s['variance']}, failing {s['failing']}/{s['count']}"
+        )
+        if include_percentile:
+            line += f", cohort percentile {s['percentile']}"
+        lines.append(line)
+    return "\n".join(lines)
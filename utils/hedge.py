@@ -0,0 +1,129 @@
+import os
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Hedged requests: if a call is still running after the p95 latency of recent
+# calls, a second identical request is sent and the first answer wins.
+# Off by default (LLM_HEDGE=1 to enable). To avoid hammering the provider:
+#   - no hedging until LLM_HEDGE_MIN_SAMPLES (20) latencies were recorded
+#   - at most LLM_HEDGE_MAX_RATIO (0.05) of the calls are hedged
+#   - never more than one extra request per call
+
+
+class LatencyTracker:
+    """Sliding window of call latencies plus the hedge budget."""
+
+    def __init__(self, window=200, min_samples=20, max_ratio=0.05):
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self._latencies = deque(maxlen=window)
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def deadline(self):
+        """p95 latency in seconds, or None if there are too few samples."""
+        with self._lock:
+            self._calls += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def try_hedge(self):
+        """Take one hedge from the budget; False when the budget is used up."""
+        with self._lock:
+            if self._hedges + 1 > self._calls * self.max_ratio:
+                return False
+            self._hedges += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self._calls, "hedges": self._hedges, "samples": len(self._latencies)}
+
+
+def hedging_enabled():
+    return os.getenv("LLM_HEDGE", "0") == "1"
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+_hedge_pool = None
+
+
+def get_latency_tracker(key):
+    """One tracker per provider/model."""
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = LatencyTracker(
+                min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+                max_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05")),
+            )
+            _trackers[key] = tracker
+        return tracker
+
+
+def _get_pool():
+    global _hedge_pool
+    with _trackers_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_THREADS", "16")),
+                                             thread_name_prefix="llm-hedge")
+        return _hedge_pool
+
+
+def hedged_call(fn, tracker):
+    """
+    Run fn() in a worker thread; start a second fn() after the p95 deadline.
+    The first successful result is returned; the error is raised only if both fail.
+    The slower request can't be cancelled and finishes in the background.
+    """
+    deadline = tracker.deadline()
+    if deadline is None:
+        return fn()
+    pool = _get_pool()
+    pending = {pool.submit(fn)}
+    done, pending = wait(pending, timeout=deadline)
+    if not done and tracker.try_hedge():
+        pending.add(pool.submit(fn))
+    error = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+
+async def ahedged_call(make_coro, tracker):
+    """Async version of hedged_call; the slower request is cancelled."""
+    deadline = tracker.deadline()
+    if deadline is None:
+        return await make_coro()
+    pending = {asyncio.ensure_future(make_coro())}
+    done, pending = await asyncio.wait(pending, timeout=deadline)
+    if not done and tracker.try_hedge():
+        pending.add(asyncio.ensure_future(make_coro()))
+    error = None
+    try:
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
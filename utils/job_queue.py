@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+# Durable report job queue in one SQLite file (JOB_QUEUE_PATH, default
+# jobs.db), shared by every worker process on the host.
+# - lease(): the highest-priority available job is handed to one worker for
+#   visibility_timeout seconds; a worker that dies without finishing loses the
+#   lease and the job becomes available again
+# - heartbeat() extends a lease while a long flow is still running
+# - fail(): the job is retried later (retry_delay * 2^(attempts-1)) until
+#   max_attempts is used up, then it is dead-lettered (status "dead"); errors
+#   a retry can't fix are dead-lettered at once (retry=False)
+# - every lease gets a new token, so a worker whose lease expired can no
+#   longer complete or fail a job that another worker has taken over
+# States: queued -> leased -> done | queued (retry) | dead
+
+STATUSES = ("queued", "leased", "done", "dead")
+
+
+class Job:
+    __slots__ = ("id", "student_id", "priority", "attempts", "max_attempts", "payload", "lease_token")
+
+    def __init__(self, id, student_id, priority, attempts, max_attempts, payload, lease_token):
+        self.id = id
+        self.student_id = student_id
+        self.priority = priority
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.payload = json.loads(payload) if payload else {}
+        self.lease_token = lease_token
+
+
+class SQLiteJobQueue:
+    def __init__(self, path="jobs.db"):
+        self.path = path
+        self._local = threading.local()  # sqlite connections are per-thread
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY,"
+                " student_id TEXT NOT NULL,"
+                " payload TEXT,"
+                " priority INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL DEFAULT 'queued',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL,"
+                " available_at REAL NOT NULL,"
+                " lease_token TEXT,"
+                " lease_expires REAL,"
+                " worker TEXT,"
+                " last_error TEXT,"
+                " result TEXT,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            # Next job to lease: one index range scan
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_next ON jobs(status, priority DESC, available_at, id)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(status, lease_expires)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_student ON jobs(student_id, status)")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, student_ids, priority=0, max_attempts=3, payload=None):
+        """
+        Queue one job per student. Students that already have a queued or
+        leased job are skipped (their priority is raised if the new one is
+        higher). Returns the number of new jobs.
+        """
+        now = time.time()
+        payload = json.dumps(payload, ensure_ascii=False) if payload else None
+
+        def work(conn):
+            added = 0
+            for student_id in student_ids:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE student_id = ? AND status IN ('queued', 'leased')", (student_id,)
+                ).fetchone()
+                if row:
+                    conn.execute("UPDATE jobs SET priority = MAX(priority, ?) WHERE id = ?", (priority, row[0]))
+                    continue
+                conn.execute(
+                    "INSERT INTO jobs (student_id, payload, priority, max_attempts, available_at, created, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (student_id, payload, priority, max_attempts, now, now, now),
+                )
+                added += 1
+            return added
+
+        return self._transaction(work)
+
+    def lease(self, worker, visibility_timeout=600):
+        """The next job for this worker (highest priority, oldest first), or None."""
+        now = time.time()
+        token = uuid.uuid4().hex
+
+        def work(conn):
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                "SELECT id, student_id, priority, attempts, max_attempts, payload FROM jobs"
+                " WHERE status = 'queued' AND available_at <= ?"
+                " ORDER BY priority DESC, available_at, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, student_id, priority, attempts, max_attempts, payload = row
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_token = ?,"
+                " lease_expires = ?, worker = ?, updated = ? WHERE id = ?",
+                (token, now + visibility_timeout, worker, now, job_id),
+            )
+            return Job(job_id, student_id, priority, attempts + 1, max_attempts, payload, token)
+
+        return self._transaction(work)
+
+    @staticmethod
+    def _expire_leases(conn, now):
+        # Expired leases count as failed attempts: dead-lettered when used up
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,"
+            " last_error = 'lease expired (worker ' || COALESCE(worker, '?') || ')',"
+            " lease_token = NULL, available_at = ?, updated = ?"
+            " WHERE status = 'leased' AND lease_expires < ?",
+            (now, now, now),
+        )
+
+    def heartbeat(self, job, visibility_timeout=600):
+        """Extend the lease; False if it was lost (expired and taken over)."""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (now + visibility_timeout, now, job.id, job.lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job, result=None):
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_token = NULL, updated = ?"
+            " WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (json.dumps(result, ensure_ascii=False) if result is not None else None, now, job.id, job.lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job, error, retry_delay=60, retry=True):
+        """Retry later with exponential backoff, or dead-letter. Returns the new status (None if lease lost)."""
+        now = time.time()
+        status = "dead" if not retry or job.attempts >= job.max_attempts else "queued"
+        available_at = now + retry_delay * 2 ** (job.attempts - 1)
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = ?, last_error = ?, available_at = ?, lease_token = NULL, updated = ?"
+            " WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (status, str(error)[:2000], available_at, now, job.id, job.lease_token),
+        )
+        return status if cursor.rowcount == 1 else None
+
+    def release(self, job):
+        """Give a leased job back untouched (worker shutting down); the attempt is not counted."""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_token = NULL,"
+            " available_at = ?, updated = ? WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (now, now, job.id, job.lease_token),
+        )
+
+    def requeue_dead(self):
+        """
+        Move dead-lettered jobs back to the queue with fresh attempts: the
+        latest dead job of each student that has no queued or leased job.
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated = ?"
+            " WHERE id IN (SELECT MAX(id) FROM jobs WHERE status = 'dead' GROUP BY student_id)"
+            " AND student_id NOT IN (SELECT student_id FROM jobs WHERE status IN ('queued', 'leased'))",
+            (now, now),
+        )
+        return cursor.rowcount
+
+    def purge_done(self, older_than=0):
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND updated < ?", (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def stats(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for status, count in self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def pending(self):
+        """Jobs that may still run: queued (now or later) or leased."""
+        row = self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'leased')").fetchone()
+        return row[0]
+
+    def dead_jobs(self, limit=20):
+        return self._conn().execute(
+            "SELECT id, student_id, attempts, last_error FROM jobs WHERE status = 'dead' ORDER BY updated DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+
+def get_job_queue(path=None):
+    return SQLiteJobQueue(path or os.getenv("JOB_QUEUE_PATH", "jobs.db"))
@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("llm_logger")
+
+# How many inserts happen between two eviction passes
+EVICT_EVERY = 100
+
+
+def make_cache_key(prompt: str, model: str = "") -> str:
+    """
+    Stable cache key for a (model, prompt) pair.
+    The same prompt sent to another model must not share a cache entry.
+    """
+    return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """
+    Persistent LLM cache stored in a single SQLite file.
+    - WAL journal: readers never block the writer, many processes can share the file
+    - key is the PRIMARY KEY, so a lookup is one index probe
+    - every insert writes exactly one row
+    - entries are evicted by age (max_age, seconds) and by size
+      (max_entries, max_bytes), oldest first
+    """
+
+    def __init__(self, path="llm_cache.db", max_entries=None, max_bytes=None, max_age=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._local = threading.local()  # sqlite connections are per-thread
+        self._inserts = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " size INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT response, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read LLM cache {self.path}: {e}")
+            return None
+        if row is None:
+            return None
+        response, created = row
+        if self.max_age and time.time() - created > self.max_age:
+            self.delete(key)
+            return None
+        return response
+
+    def set(self, key, response):
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created, size) VALUES (?, ?, ?, ?)",
+                (key, response, time.time(), len(response.encode("utf-8"))),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write LLM cache {self.path}: {e}")
+            return
+        self._inserts += 1
+        if self._inserts % EVICT_EVERY == 0:
+            self.evict()
+
+    def delete(self, key):
+        try:
+            self._conn().execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to delete from LLM cache {self.path}: {e}")
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones until size limits hold."""
+        try:
+            conn = self._conn()
+            if self.max_age:
+                conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY created DESC) AS total FROM llm_cache)"
+                    " WHERE total > ?)",
+                    (self.max_bytes,),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to evict LLM cache {self.path}: {e}")
+
+
+class DirectoryCache:
+    """
+    Persistent LLM cache as a sharded directory: <root>/<key[:2]>/<key>.json.
+    Each entry is its own file written atomically (temp file + rename),
+    so concurrent processes never see half-written entries.
+    """
+
+    def __init__(self, root="llm_cache", max_entries=None, max_bytes=None, max_age=None):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._inserts = 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.max_age and time.time() - os.path.getmtime(path) > self.max_age:
+                self.delete(key)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to read LLM cache entry {path}: {e}")
+            return None
+
+    def set(self, key, response):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"response": response}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write LLM cache entry {path}: {e}")
+            return
+        self._inserts += 1
+        if self._inserts % EVICT_EVERY == 0:
+            self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to delete LLM cache entry {key}: {e}")
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones until size limits hold."""
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort(reverse=True)  # newest first
+
+        now = time.time()
+        total_bytes = 0
+        for index, (mtime, size, path) in enumerate(entries):
+            total_bytes += size
+            if (
+                (self.max_age and now - mtime > self.max_age)
+                or (self.max_entries and index >= self.max_entries)
+                or (self.max_bytes and total_bytes > self.max_bytes)
+            ):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class MemoryCache:
+    """
+    Bounded in-process LRU cache with optional TTL (seconds).
+    Limits apply to the number of entries and to the total size of the
+    stored responses in bytes. Thread-safe.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (response, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            response, size, stored_at = item
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def set(self, key, response):
+        size = len(response.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (response, size, time.monotonic())
+            self._bytes += size
+            while self._data and (
+                (self.max_entries and len(self._data) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class TieredCache:
+    """
+    In-memory LRU tier in front of a persistent cache.
+    Disk hits are promoted to memory, so a repeated prompt touches disk once.
+    """
+
+    def __init__(self, memory, persistent):
+        self.memory = memory
+        self.persistent = persistent
+        self.persistent_hits = 0
+        self.persistent_misses = 0
+
+    def get(self, key):
+        response = self.memory.get(key)
+        if response is not None:
+            return response
+        response = self.persistent.get(key)
+        if response is None:
+            self.persistent_misses += 1
+            return None
+        self.persistent_hits += 1
+        self.memory.set(key, response)
+        return response
+
+    def set(self, key, response):
+        self.memory.set(key, response)
+        self.persistent.set(key, response)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        self.persistent.delete(key)
+
+    def evict(self):
+        self.persistent.evict()
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "persistent_hits": self.persistent_hits,
+            "persistent_misses": self.persistent_misses,
+        }
+
+
+CACHE_BACKENDS = {
+    "sqlite": SQLiteCache,
+    "dir": DirectoryCache,
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _int_env(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def get_cache():
+    """
+    Return the process-wide LLM cache: an in-memory LRU tier in front of
+    a persistent backend, configured from environment variables:
+    - LLM_CACHE_BACKEND: "sqlite" (default) or "dir"
+    - LLM_CACHE_PATH: database file or directory (default: llm_cache.db / llm_cache)
+    - LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES: size limits (optional)
+    - LLM_CACHE_MAX_AGE: entry lifetime in seconds (optional)
+    - LLM_MEMORY_CACHE_MAX_ENTRIES: in-memory entries (default 1024, 0 disables the tier)
+    - LLM_MEMORY_CACHE_MAX_BYTES: in-memory size limit (default 64 MiB)
+    - LLM_MEMORY_CACHE_TTL: in-memory entry lifetime in seconds (optional)
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = os.getenv("LLM_CACHE_BACKEND", "sqlite").lower()
+                if backend not in CACHE_BACKENDS:
+                    raise ValueError(f"Unknown LLM_CACHE_BACKEND '{backend}', expected one of {list(CACHE_BACKENDS)}")
+                default_path = "llm_cache.db" if backend == "sqlite" else "llm_cache"
+                persistent = CACHE_BACKENDS[backend](
+                    os.getenv("LLM_CACHE_PATH", default_path),
+                    max_entries=_int_env("LLM_CACHE_MAX_ENTRIES"),
+                    max_bytes=_int_env("LLM_CACHE_MAX_BYTES"),
+                    max_age=_int_env("LLM_CACHE_MAX_AGE"),
+                )
+                memory_entries = _int_env("LLM_MEMORY_CACHE_MAX_ENTRIES")
+                if memory_entries == 0:
+                    _cache = persistent
+                else:
+                    memory = MemoryCache(
+                        max_entries=memory_entries or 1024,
+                        max_bytes=_int_env("LLM_MEMORY_CACHE_MAX_BYTES") or 64 * 1024 * 1024,
+                        ttl=_int_env("LLM_MEMORY_CACHE_TTL"),
+                    )
+                    _cache = TieredCache(memory, persistent)
+    return _cache
+
+
+def get_cache_stats():
+    """Hit/miss/eviction counters of the process-wide cache ({} before first use)."""
+    if _cache is None or not hasattr(_cache, "stats"):
+        return {}
+    return _cache.stats()
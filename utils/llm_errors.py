@@ -0,0 +1,77 @@
+import time
+from email.utils import parsedate_to_datetime
+
+# Typed provider errors. They subclass Exception like the generic errors they
+# replace, so existing `except Exception` code keeps working; the retry policy
+# (utils.retry_policy) uses the type to decide whether and how long to wait.
+
+
+class LLMError(Exception):
+    """Base class of provider errors."""
+
+    retryable = True
+
+    def __init__(self, message, provider=None, status=None, retry_after=None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after  # seconds requested by the server, if any
+
+
+class LLMRateLimitError(LLMError):
+    """HTTP 429 - too many requests / tokens."""
+
+
+class LLMServerError(LLMError):
+    """HTTP 5xx - provider side failure."""
+
+
+class LLMClientError(LLMError):
+    """Other HTTP 4xx - bad request, auth, unknown model; retrying won't help."""
+
+    retryable = False
+
+
+class LLMTimeoutError(LLMError):
+    """Connect or read timeout."""
+
+
+class LLMConnectionError(LLMError):
+    """Provider unreachable."""
+
+
+class LLMResponseError(LLMError):
+    """Response body is not the expected JSON."""
+
+
+class LLMTruncatedError(LLMResponseError):
+    """The answer stopped at the output token limit; the same request would stop there again."""
+
+    retryable = False
+
+
+def parse_retry_after(value):
+    """Retry-After header (seconds or HTTP date) -> seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_for_status(provider, status, message, retry_after=None):
+    """LLMError subclass instance for an HTTP status code."""
+    if status == 429:
+        error_class = LLMRateLimitError
+    elif status == 408:
+        error_class = LLMTimeoutError
+    elif status is not None and status >= 500:
+        error_class = LLMServerError
+    else:
+        error_class = LLMClientError
+    return error_class(message, provider=provider, status=status, retry_after=retry_after)
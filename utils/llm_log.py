@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import gzip
+import queue
+import atexit
+import random
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# LLM call log: one JSONL record per call, written by a background thread.
+# call_llm only puts the record on a bounded queue (a full queue drops the
+# record instead of blocking), the listener thread formats and writes it.
+# Files rotate by size and rotated files are gzip-compressed, so each log
+# stays bounded (max_bytes * (backups + 1), before compression).
+# Size-based rotation is not safe with several processes writing one file, so
+# every process writes its own log, llm_calls_<pid>.jsonl; worker processes
+# (jobs.py --processes) never rotate each other's files. When a process sets up
+# its log, a background thread prunes the logs of earlier processes, oldest
+# first, down to LLM_LOG_MAX_FILES files and LLM_LOG_MAX_TOTAL_BYTES in total,
+# so one run per student does not make the directory grow without bound.
+#
+# Configuration:
+# - LOG_DIR: log directory (default: logs)
+# - LLM_LOG_MAX_BYTES: size of one log file before rotation (default 10 MiB)
+# - LLM_LOG_BACKUPS: number of rotated .gz files to keep (default 5)
+# - LLM_LOG_MAX_FILES: log files (with rotated ones) kept in LOG_DIR (default 200)
+# - LLM_LOG_MAX_TOTAL_BYTES: total size of LOG_DIR logs (default 200 MiB)
+# - LLM_LOG_BODY_SAMPLE: share of calls logged with full prompt and response
+#   (0 = hashes and numbers only (default), 1 = every call)
+# - LLM_LOG_QUEUE_SIZE: max records waiting to be written (default 10000)
+
+LOGGER_NAME = "llm_logger"
+LOG_FILE_NAME = "llm_calls_{pid}.jsonl"
+LOG_FILE_PATTERN = re.compile(r"llm_calls_\d+\.jsonl(\.\d+\.gz)?$")
+
+_setup_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking."""
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Formatting happens in the listener thread, keep the record as is
+        return record
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            data = record.msg
+        else:
+            data = {"message": record.getMessage()}
+        data = dict(data, ts=datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                    level=record.levelname)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def prune_logs(log_directory, keep_path=None, max_files=200, max_total_bytes=200 * 1024 * 1024):
+    """
+    Delete per-process logs (and their rotated .gz files), oldest first, until
+    at most max_files remain and they take at most max_total_bytes. keep_path
+    (the current process's log) is never deleted. Returns the number deleted.
+    """
+    logs = []
+    try:
+        with os.scandir(log_directory) as it:
+            for entry in it:
+                if LOG_FILE_PATTERN.match(entry.name) and entry.path != keep_path:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    logs.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return 0
+    logs.sort(reverse=True)  # newest first
+    kept = 1 if keep_path else 0
+    total = 0
+    deleted = 0
+    for mtime, size, path in logs:
+        if kept < max_files and total + size <= max_total_bytes:
+            kept += 1
+            total += size
+            continue
+        try:
+            os.remove(path)
+            deleted += 1
+        except OSError:
+            pass  # removed by another process meanwhile
+    return deleted
+
+
+def setup_llm_logging():
+    """
+    Attach the queue handler to the llm logger and start the writer thread.
+    Called on the first logged call, never at import time. Safe to call again.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_directory = os.getenv("LOG_DIR", "logs")
+        os.makedirs(log_directory, exist_ok=True)
+        log_path = os.path.join(log_directory, LOG_FILE_NAME.format(pid=os.getpid()))
+        # Logs of earlier processes are pruned off the calling thread
+        threading.Thread(
+            target=prune_logs, name="llm-log-prune", daemon=True,
+            args=(log_directory, log_path,
+                  int(os.getenv("LLM_LOG_MAX_FILES", "200")),
+                  int(os.getenv("LLM_LOG_MAX_TOTAL_BYTES", str(200 * 1024 * 1024)))),
+        ).start()
+        file_handler = RotatingFileHandler(
+            log_path,
+            maxBytes=int(os.getenv("LLM_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            backupCount=int(os.getenv("LLM_LOG_BACKUPS", "5")),
+            encoding="utf-8",
+        )
+        file_handler.namer = lambda name: name + ".gz"
+        file_handler.rotator = _gzip_rotator
+        file_handler.setFormatter(_JsonFormatter())
+
+        _handler = _DroppingQueueHandler(queue.Queue(int(os.getenv("LLM_LOG_QUEUE_SIZE", "10000"))))
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False  # Prevent propagation to root logger
+        logger.addHandler(_handler)
+
+        _listener = QueueListener(_handler.queue, file_handler)
+        _listener.start()
+        atexit.register(shutdown_llm_logging)
+
+
+def shutdown_llm_logging():
+    """Write the queued records and stop the writer thread."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger(LOGGER_NAME).removeHandler(_handler)
+        _listener = _handler = None
+
+
+def dropped_records():
+    return _handler.dropped if _handler else 0
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _log_bodies():
+    sample = float(os.getenv("LLM_LOG_BODY_SAMPLE", "0"))
+    return sample > 0 and (sample >= 1 or random.random() < sample)
+
+
+def log_llm_call(prompt, response=None, *, provider, model, cache, latency,
+                 prompt_tokens=None, output_tokens=None, stream=False, error=None):
+    """
+    Queue one call record. cache: "hit", "miss", "shared" (answered by an
+    identical call in flight) or "off". Token counts are estimates.
+    """
+    setup_llm_logging()
+    record = {
+        "provider": provider,
+        "model": model,
+        "prompt_hash": prompt_hash(prompt),
+        "cache": cache,
+        "latency_ms": round(latency * 1000, 1),
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+    }
+    if stream:
+        record["stream"] = True
+    if error is not None:
+        record["error"] = f"{type(error).__name__}: {error}"
+    if _log_bodies():
+        record["prompt"] = prompt
+        record["response"] = response
+    logger = logging.getLogger(LOGGER_NAME)
+    if error is not None:
+        logger.error(record)
+    else:
+        logger.info(record)
@@ -0,0 +1,106 @@
+import re
+import threading
+
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code']
+
+# One configured Markdown converter per thread: the extensions are loaded
+# once, not on every call (a converter is not safe to share across threads)
+_converters = threading.local()
+
+
+def render_markdown(text: str) -> str:
+    converter = getattr(_converters, "converter", None)
+    if converter is None:
+        import markdown  # imported on first render, not at startup
+
+        converter = _converters.converter = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return converter.reset().convert(text)
+
+
+# A list item marker at the start of a line ("- ", "* ", "+ ", "1. ", "1) ")
+_LIST_MARKER = re.compile(r"([*+-]|\d+[.)])(\s|$)")
+
+
+class MarkdownBlockSplitter:
+    """
+    Cuts streamed Markdown into complete blocks that can be rendered on
+    their own. A block ends at a blank line outside a fenced code block, but
+    only when the next line starts a new top-level block (column 0, not a
+    list item). Lists with loose items or indented continuations, tables and
+    code therefore stay in one block, and the blocks rendered one by one
+    give the same HTML as rendering the whole text.
+
+    splitter = MarkdownBlockSplitter()
+    for chunk in chunks:
+        for block in splitter.feed(chunk): ...
+    for block in splitter.flush(): ...
+    """
+
+    def __init__(self):
+        self._partial = ""  # text after the last newline
+        self._lines = []    # complete lines of the current block
+        self._in_fence = False
+        self._after_blank = False
+
+    def feed(self, chunk: str):
+        self._partial += chunk
+        *complete, self._partial = self._partial.split("\n")
+        blocks = []
+        for line in complete:
+            block = self._add_line(line)
+            if block:
+                blocks.append(block)
+        return blocks
+
+    def flush(self):
+        if self._partial:
+            self._lines.append(self._partial)
+            self._partial = ""
+        block = "\n".join(self._lines).strip("\n")
+        self._lines = []
+        self._in_fence = False
+        self._after_blank = False
+        return [block] if block.strip() else []
+
+    def _add_line(self, line):
+        block = None
+        if not self._in_fence:
+            if not line.strip():
+                self._after_blank = True
+            else:
+                # The block before a blank line is complete once a new
+                # top-level block starts; indented lines and list items
+                # may still belong to it
+                if self._after_blank and not line[0].isspace() and not _LIST_MARKER.match(line):
+                    block = "\n".join(self._lines).strip("\n")
+                    self._lines = []
+                self._after_blank = False
+        if line.strip().startswith("```"):
+            self._in_fence = not self._in_fence
+        self._lines.append(line)
+        return block if block and block.strip() else None
+
+
+def _check_streaming(samples, chunk_size=7):
+    """Streamed blocks, rendered one by one, must give the whole-text HTML."""
+    for text in samples:
+        splitter = MarkdownBlockSplitter()
+        blocks = []
+        for i in range(0, len(text), chunk_size):
+            blocks += splitter.feed(text[i:i + chunk_size])
+        blocks += splitter.flush()
+        streamed = "\n".join(render_markdown(block) for block in blocks)
+        whole = render_markdown(text)
+        assert streamed == whole, f"streamed HTML differs for {text!r}:\n{streamed}\n---\n{whole}"
+    print(f"OK: {len(samples)} samples render the same streamed and whole")
+
+
+if __name__ == "__main__":
+    _check_streaming([
+        "1. Math\n\n2. Physics\n\n    continued paragraph\n\n3. Eng",
+        "# Title\n\nIntro paragraph\nsecond line\n\n- a\n- b\n\n  - nested\n\nAfter the list",
+        "| Subject | Level |\n|---|---|\n| Math | High |\n| Physics | Low |\n\nText after the table",
+        "Code:\n\n```python\nx = 1\n\n\ny = 2\n```\n\n## Next\n\n* one\n\n* two\n",
+        "Para\n\n    indented code\n\n    more code\n\nEnd",
+        "1) first\n\n   still first\n\n2) second\n\n---\n\n> quote\n> more\n\nlast",
+    ])
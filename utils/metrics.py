@@ -0,0 +1,243 @@
+import os
+import time
+import tempfile
+import threading
+import contextvars
+from collections import deque
+
+# In-process metrics for the teacher flow:
+# - every node run: wall time split into prep / exec / post, retries,
+#   result store hits, failures
+# - every call_llm call: cache status, provider latency, estimated tokens,
+#   attributed to the node that made the call
+# Exported as Prometheus text format (write_prometheus, e.g. for the
+# node_exporter textfile collector) and as a JSON summary (summary()).
+
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Node that is running in the current thread / task (labels the LLM calls it makes)
+current_node = contextvars.ContextVar("current_node", default=None)
+
+
+class Histogram:
+    """Cumulative buckets for Prometheus plus a bounded sample for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, max_samples=10000):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def describe(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "p50": _round(self.percentile(0.50)),
+            "p95": _round(self.percentile(0.95)),
+            "p99": _round(self.percentile(0.99)),
+            "max": _round(max(self.samples) if self.samples else None),
+        }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Per-run JSON summary: per node and per LLM model."""
+        nodes, llm = {}, {}
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if name.startswith("teacher_node_"):
+                    node = nodes.setdefault(labels["node"], {})
+                    field = name.removeprefix("teacher_node_").removesuffix("_total")
+                    if field == "runs":
+                        field = "failed" if labels["status"] == "error" else "runs"
+                    node[field] = node.get(field, 0) + value
+                elif name == "llm_calls_total":
+                    model = llm.setdefault(f"{labels['provider']}:{labels['model']}", {"cache": {}})
+                    model["calls"] = model.get("calls", 0) + value
+                    model["cache"][labels["cache"]] = model["cache"].get(labels["cache"], 0) + value
+                    if labels["status"] == "error":
+                        model["errors"] = model.get("errors", 0) + value
+                    if labels.get("node"):
+                        node = nodes.setdefault(labels["node"], {})
+                        node["llm_calls"] = node.get("llm_calls", 0) + value
+                elif name == "llm_tokens_total":
+                    field = f"{labels['direction']}_tokens"
+                    model = llm.setdefault(f"{labels['provider']}:{labels['model']}", {"cache": {}})
+                    model[field] = model.get(field, 0) + value
+                    if labels.get("node"):
+                        node = nodes.setdefault(labels["node"], {})
+                        node[field] = node.get(field, 0) + value
+            for (name, labels), histogram in self.histograms.items():
+                labels = dict(labels)
+                if name == "teacher_node_seconds":
+                    node = nodes.setdefault(labels["node"], {})
+                    if labels["phase"] == "total":
+                        node["wall_seconds"] = histogram.describe()
+                    else:
+                        node[f"{labels['phase']}_seconds"] = round(histogram.sum, 3)
+                elif name == "llm_request_seconds":
+                    llm.setdefault(f"{labels['provider']}:{labels['model']}", {"cache": {}})["latency"] = histogram.describe()
+        for model in llm.values():
+            lookups = sum(model["cache"].get(status, 0) for status in ("hit", "miss", "shared"))
+            model["cache_hit_rate"] = round(model["cache"].get("hit", 0) / lookups, 3) if lookups else None
+        return {"elapsed": round(time.time() - self.started, 3), "nodes": nodes, "llm": llm}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+class NodeRun:
+    """
+    Times one node run:
+
+    with NodeRun("AssessStudentLevel") as run:
+        with run.phase("prep"): ...
+        run.store_hit()
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self._token = None
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        self._token = current_node.set(self.node)
+        return self
+
+    def phase(self, phase):
+        return _Phase(self.node, phase)
+
+    def store_hit(self):
+        _metrics.inc("teacher_node_store_hits_total", {"node": self.node})
+
+    def __exit__(self, exc_type, exc, tb):
+        current_node.reset(self._token)
+        _metrics.observe("teacher_node_seconds", time.monotonic() - self._start, {"node": self.node, "phase": "total"})
+        status = "error" if exc_type else "ok"
+        _metrics.inc("teacher_node_runs_total", {"node": self.node, "status": status})
+        return False
+
+
+class _Phase:
+    def __init__(self, node, phase):
+        self.labels = {"node": node, "phase": phase}
+
+    def __enter__(self):
+        self._start = time.monotonic()
+
+    def __exit__(self, exc_type, exc, tb):
+        _metrics.observe("teacher_node_seconds", time.monotonic() - self._start, self.labels)
+        return False
+
+
+def record_retry(node):
+    _metrics.inc("teacher_node_retries_total", {"node": node})
+
+
+def record_llm_call(provider, model, cache, latency, prompt_tokens=None, output_tokens=None, error=None):
+    """One call_llm call; provider latency is only observed for real requests."""
+    labels = {"provider": provider or "", "model": model or ""}
+    node = current_node.get() or ""
+    _metrics.inc("llm_calls_total", dict(labels, node=node, cache=cache, status="error" if error else "ok"))
+    if cache in ("miss", "off") and not error:
+        _metrics.observe("llm_request_seconds", latency, labels)
+    if prompt_tokens:
+        _metrics.inc("llm_tokens_total", dict(labels, node=node, direction="prompt"), prompt_tokens)
+    if output_tokens:
+        _metrics.inc("llm_tokens_total", dict(labels, node=node, direction="output"), output_tokens)
+
+
+def write_prometheus(path):
+    """Write the metrics atomically (a scraper never sees a half-written file)."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(_metrics.to_prometheus())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
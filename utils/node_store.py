@@ -0,0 +1,54 @@
+import os
+import json
+import threading
+from utils.llm_cache import SQLiteCache, MemoryCache, TieredCache, make_cache_key
+
+# Content-addressed store of parsed node outputs.
+# A stage's result is saved under a fingerprint of its semantic inputs, so a
+# rerun with unchanged inputs skips the stage: no prompt, no LLM call, no YAML.
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def stage_fingerprint(stage: str, inputs, model: str = "") -> str:
+    """
+    Fingerprint of a stage run: stage name (with version), the model and the
+    canonical JSON of the inputs. Dict key order does not change the result.
+    """
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return make_cache_key(f"{stage}\x00{payload}", model)
+
+
+class NodeResultStore:
+    """JSON (de)serializing wrapper around a cache backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key):
+        raw = self.backend.get(key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            self.backend.delete(key)
+            return None
+
+    def set(self, key, result):
+        self.backend.set(key, json.dumps(result, ensure_ascii=False, default=str))
+
+
+def get_node_store():
+    """
+    Process-wide node result store (SQLite file NODE_STORE_PATH,
+    default node_results.db, with an in-memory LRU tier in front).
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                persistent = SQLiteCache(os.getenv("NODE_STORE_PATH", "node_results.db"))
+                _store = NodeResultStore(TieredCache(MemoryCache(max_entries=4096), persistent))
+    return _store
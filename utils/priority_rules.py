@@ -0,0 +1,71 @@
+# Rule-based subject ranking - the same rules PrioritizeSubjects asks the LLM
+# to apply, computed locally:
+#   - knowledge level: Very Low -> High (Very Low = highest priority)
+#   - more gaps = higher priority
+#   - strengths never lower the priority
+# Ties are broken with the grade analytics (lower mean, more failing marks,
+# falling trend first) and finally by subject name, so the order is stable.
+
+LEVEL_RANK = {
+    "very low": 0,
+    "low": 0,
+    "below average": 1,
+    "average": 1,
+    "above average": 2,
+    "high": 3,
+}
+
+
+def _level_rank(level):
+    return LEVEL_RANK.get(str(level or "").strip().lower(), 1)
+
+
+def _subjects(student_profile):
+    profile = student_profile.get("student_profile", student_profile) if student_profile else {}
+    return profile.get("subjects") or []
+
+
+def rank_subjects(student_profile, analytics=None):
+    """
+    Rank the subjects of a student profile (AssessStudentLevel output).
+
+    Returns:
+        list: [{"subject", "priority", "reasoning"}], priority 1 = needs most attention
+    """
+    analytics = analytics or {}
+
+    def sort_key(subject):
+        stats = analytics.get(subject.get("name"), {})
+        return (
+            _level_rank(subject.get("level")),
+            -len(subject.get("gaps") or []),
+            stats.get("mean", 5),
+            -stats.get("failing", 0),
+            stats.get("trend", 0),
+            str(subject.get("name", "")),
+        )
+
+    ranked = sorted(_subjects(student_profile), key=sort_key)
+    return [
+        {
+            "subject": subject.get("name", ""),
+            "priority": index,
+            "reasoning": explain_rank(subject, analytics.get(subject.get("name"))),
+        }
+        for index, subject in enumerate(ranked, start=1)
+    ]
+
+
+def explain_rank(subject, stats=None):
+    """Short template reasoning for one ranked subject."""
+    gaps = [str(gap) for gap in (subject.get("gaps") or []) if gap]
+    text = f"Knowledge level: {subject.get('level') or 'unknown'}; {len(gaps)} gap(s)"
+    if gaps:
+        text += f" ({'; '.join(gaps[:2])})"
+    text += "."
+    if stats:
+        text += f" Average mark {stats['mean']}, trend {stats['trend']:+} per mark"
+        if stats.get("failing"):
+            text += f", {stats['failing']} failing mark(s)"
+        text += "."
+    return text
@@ -0,0 +1,115 @@
+import os
+import yaml
+
+# Compact prompt serialization and token budgets.
+# Earlier stage outputs are rendered as compact YAML (empty fields removed)
+# instead of Python dict reprs, and shrunk step by step until they fit the
+# node's input budget.
+
+# Per node: input budget for the data sections and max output tokens.
+# Override with LLM_INPUT_BUDGET_<NODE> / LLM_MAX_TOKENS_<NODE>
+# (e.g. LLM_MAX_TOKENS_FINALTEACHERCONCLUSION=6000); 0 disables the limit.
+TOKEN_BUDGETS = {
+    "AssessStudentLevel": {"input": 1500, "output": 3000},
+    "AssessStudentLevelPerSubject": {"input": 400, "output": 600},
+    "PrioritizeSubjects": {"input": 1500, "output": 1500},
+    "PrioritizeSubjectsByRules": {"input": 1500, "output": 1500},
+    "KnowledgeToDiscover": {"input": 2000, "output": 3000},
+    "FinalTeacherConclusion": {"input": 3000, "output": 4000},
+}
+
+# The YAML answer is complete once the closing fence is written
+YAML_STOP = ["\n```\n"]
+
+# Shrink steps: (max string length, max list length, keys to drop)
+SHRINK_STEPS = [
+    (None, None, ()),
+    (300, 8, ()),
+    (160, 5, ()),
+    (100, 3, ("reasoning",)),
+    (60, 2, ("reasoning", "examples", "based_from")),
+]
+
+
+def _budget(node_name, kind, env_prefix):
+    value = os.getenv(f"{env_prefix}_{node_name.upper()}")
+    if value is not None:
+        return int(value) or None
+    return TOKEN_BUDGETS.get(node_name, {}).get(kind)
+
+
+def get_input_budget(node_name):
+    return _budget(node_name, "input", "LLM_INPUT_BUDGET")
+
+
+def get_max_tokens(node_name):
+    return _budget(node_name, "output", "LLM_MAX_TOKENS")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 bytes of UTF-8 per token (Cyrillic ~2 chars per token)."""
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def shorten(text, budget) -> str:
+    """text cut to about budget tokens (ending with "..."); unchanged if it fits."""
+    text = text or ""
+    if budget is None or estimate_tokens(text) <= budget:
+        return text
+    data = text.encode("utf-8")[:max(budget - 1, 0) * 4]
+    return data.decode("utf-8", "ignore").rstrip() + "..."
+
+
+def unwrap(obj, key):
+    """{"student_profile": {...}} -> {...}; other values are returned as is."""
+    if isinstance(obj, dict) and key in obj and len(obj) == 1:
+        return obj[key]
+    return obj
+
+
+def compact(obj, max_str=None, max_list=None, drop_keys=()):
+    """Copy of obj without empty values, with long strings and lists cut."""
+    if isinstance(obj, dict):
+        result = {}
+        for key, value in obj.items():
+            if key in drop_keys:
+                continue
+            value = compact(value, max_str, max_list, drop_keys)
+            if value not in (None, "", [], {}):
+                result[key] = value
+        return result
+    if isinstance(obj, (list, tuple)):
+        items = [compact(item, max_str, max_list, drop_keys) for item in obj]
+        items = [item for item in items if item not in (None, "", [], {})]
+        return items[:max_list] if max_list else items
+    if isinstance(obj, str):
+        text = " ".join(obj.split())
+        if max_str and len(text) > max_str:
+            text = text[:max_str - 1].rstrip() + "…"
+        return text
+    return obj
+
+
+def to_yaml(obj) -> str:
+    return yaml.safe_dump(obj, allow_unicode=True, sort_keys=False, width=1000).strip()
+
+
+def fit_sections(sections: dict, budget=None) -> dict:
+    """
+    Render every section as compact YAML. If the total is above the budget
+    (tokens), all sections are shrunk together until it fits or the last
+    shrink step is reached.
+    """
+    rendered = {}
+    for max_str, max_list, drop_keys in SHRINK_STEPS:
+        rendered = {
+            name: to_yaml(compact(value, max_str, max_list, drop_keys))
+            for name, value in sections.items()
+        }
+        if not budget or sum(estimate_tokens(text) for text in rendered.values()) <= budget:
+            break
+    return rendered
+
+
+def fit_yaml(obj, budget=None) -> str:
+    return fit_sections({"value": obj}, budget)["value"]
@@ -0,0 +1,230 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger("llm_logger")
+
+# Client-side requests-per-minute / tokens-per-minute limits (token buckets).
+# Callers wait for capacity instead of running into provider 429s.
+# Limits are set per provider with <PROVIDER>_RPM / <PROVIDER>_TPM (e.g.
+# GEMINI_RPM=60, XAI_TPM=200000), falling back to LLM_RPM / LLM_TPM; unset or
+# 0 means unlimited. Buckets are kept per provider and model.
+# The default "sqlite" backend keeps the buckets in one SQLite file
+# (LLM_RATE_LIMIT_PATH, default rate_limits.db), so every worker process on
+# the host draws from the same quota; "memory" limits one process only.
+# LLM_RATE_LIMIT_BURST: seconds of quota that may be used at once (default 60).
+
+
+def _refill(state, now, rate, capacity):
+    level, updated = state if state else (capacity, now)
+    return min(capacity, level + max(0.0, now - updated) * rate)
+
+
+def _take(states, needs, now):
+    """
+    states: {bucket: (level, updated)}; needs: [(bucket, amount, rate, capacity)].
+    Returns (new states, 0) when every bucket has enough, else (None, seconds to wait).
+    """
+    levels = {}
+    wait = 0.0
+    for bucket, amount, rate, capacity in needs:
+        level = _refill(states.get(bucket), now, rate, capacity)
+        amount = min(amount, capacity)  # a request larger than the bucket waits for a full bucket
+        if level < amount:
+            wait = max(wait, (amount - level) / rate)
+        levels[bucket] = level - amount
+    if wait:
+        return None, wait
+    return {bucket: (level, now) for bucket, level in levels.items()}, 0.0
+
+
+class MemoryBuckets:
+    """Bucket state of one process."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, needs):
+        with self._lock:
+            new_states, wait = _take(self._states, needs, time.time())
+            if new_states:
+                self._states.update(new_states)
+            return wait
+
+    def adjust(self, bucket, delta, rate, capacity):
+        with self._lock:
+            now = time.time()
+            level = _refill(self._states.get(bucket), now, rate, capacity)
+            self._states[bucket] = (min(capacity, level - delta), now)
+
+
+class SQLiteBuckets:
+    """
+    Bucket state shared by all processes through a SQLite file. Every
+    take/adjust is one short BEGIN IMMEDIATE transaction.
+    """
+
+    def __init__(self, path="rate_limits.db"):
+        self.path = path
+        self._local = threading.local()  # sqlite connections are per-thread
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " bucket TEXT PRIMARY KEY,"
+                " level REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, buckets, update):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            placeholders = ",".join("?" * len(buckets))
+            states = {
+                bucket: (level, updated)
+                for bucket, level, updated in conn.execute(
+                    f"SELECT bucket, level, updated FROM rate_buckets WHERE bucket IN ({placeholders})", buckets
+                )
+            }
+            new_states, result = update(states)
+            if new_states:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (bucket, level, updated) VALUES (?, ?, ?)",
+                    [(bucket, level, updated) for bucket, (level, updated) in new_states.items()],
+                )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take(self, needs):
+        return self._transaction(
+            [bucket for bucket, *_ in needs],
+            lambda states: _take(states, needs, time.time()),
+        )
+
+    def adjust(self, bucket, delta, rate, capacity):
+        def update(states):
+            now = time.time()
+            level = _refill(states.get(bucket), now, rate, capacity)
+            return {bucket: (min(capacity, level - delta), now)}, None
+
+        self._transaction([bucket], update)
+
+
+class RateLimiter:
+    """
+    Limits for one provider/model. acquire(tokens) blocks (aacquire awaits)
+    until one request and `tokens` tokens are available; settle() corrects the
+    token estimate once the real usage is known.
+    """
+
+    def __init__(self, name, buckets, rpm=None, tpm=None, burst_seconds=60):
+        self.name = name
+        self.buckets = buckets
+        self.limits = {}  # bucket -> (rate per second, capacity)
+        for kind, per_minute in (("requests", rpm), ("tokens", tpm)):
+            if per_minute:
+                rate = per_minute / 60.0
+                self.limits[f"{name}:{kind}"] = (rate, max(1.0, rate * burst_seconds))
+        self.waited = 0.0  # total seconds callers of this process waited
+
+    def _needs(self, tokens):
+        needs = []
+        for bucket, (rate, capacity) in self.limits.items():
+            amount = 1 if bucket.endswith(":requests") else tokens
+            needs.append((bucket, amount, rate, capacity))
+        return needs
+
+    def _try(self, tokens):
+        try:
+            return self.buckets.take(self._needs(tokens))
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limiter {self.name} unavailable, not limiting: {e}")
+            return 0.0
+
+    def _pause(self, wait):
+        # A little jitter so waiting callers don't all retry at the same moment
+        pause = wait + random.uniform(0, min(0.05, wait))
+        self.waited += pause
+        return pause
+
+    def acquire(self, tokens=0):
+        while True:
+            wait = self._try(tokens)
+            if not wait:
+                return
+            time.sleep(self._pause(wait))
+
+    async def aacquire(self, tokens=0):
+        while True:
+            # The SQLite transaction may wait for other processes' locks: keep it off the event loop
+            if isinstance(self.buckets, SQLiteBuckets):
+                wait = await asyncio.to_thread(self._try, tokens)
+            else:
+                wait = self._try(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(self._pause(wait))
+
+    def settle(self, reserved, used):
+        """Charge (or refund) the difference between reserved and used tokens."""
+        bucket = f"{self.name}:tokens"
+        if bucket not in self.limits or used == reserved:
+            return
+        rate, capacity = self.limits[bucket]
+        try:
+            self.buckets.adjust(bucket, used - reserved, rate, capacity)
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limiter {self.name} unavailable: {e}")
+
+    async def asettle(self, reserved, used):
+        """settle() without blocking the event loop on the SQLite backend."""
+        if isinstance(self.buckets, SQLiteBuckets):
+            await asyncio.to_thread(self.settle, reserved, used)
+        else:
+            self.settle(reserved, used)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _per_minute(provider, kind):
+    value = os.getenv(f"{provider}_{kind}") or os.getenv(f"LLM_{kind}")
+    return float(value) if value else None
+
+
+def get_rate_limiter(provider, model):
+    """Process-wide RateLimiter for provider/model, or None when no limit is set."""
+    key = f"{provider}:{model}"
+    with _limiters_lock:
+        if key not in _limiters:
+            rpm = _per_minute(provider, "RPM")
+            tpm = _per_minute(provider, "TPM")
+            limiter = None
+            if rpm or tpm:
+                if os.getenv("LLM_RATE_LIMIT_BACKEND", "sqlite") == "memory":
+                    buckets = MemoryBuckets()
+                else:
+                    buckets = SQLiteBuckets(os.getenv("LLM_RATE_LIMIT_PATH", "rate_limits.db"))
+                burst = float(os.getenv("LLM_RATE_LIMIT_BURST", "60"))
+                limiter = RateLimiter(key, buckets, rpm, tpm, burst)
+            _limiters[key] = limiter
+        return _limiters[key]
@@ -0,0 +1,77 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.llm_cache import SQLiteCache
+from utils.node_store import stage_fingerprint
+
+# Finished HTML reports of the web portal, keyed by student and data version.
+# The data version is a fingerprint of the student's record and the model, so
+# changed marks (or another model) give a new key and the old report is simply
+# never asked for again. Pages are kept in SQLite (REPORT_CACHE_PATH, default
+# reports.db); the most recent ones also stay in memory ready to send: bytes,
+# gzip-compressed bytes and ETag are computed once per report, not per view.
+
+# Bump to invalidate all cached reports (e.g. after a template change)
+REPORT_VERSION = 1
+
+
+def report_key(student_id, student_data, model=""):
+    """Cache key of a student's report for the current data version."""
+    return stage_fingerprint(
+        f"portal_report:v{REPORT_VERSION}", {"student_id": student_id, "student": student_data}, model
+    )
+
+
+class PreparedReport:
+    """A report ready to be served: raw and gzip bodies with their ETags."""
+
+    __slots__ = ("body", "gzipped", "etag", "gzip_etag")
+
+    def __init__(self, html: str):
+        self.body = html.encode("utf-8")
+        # mtime=0: the same page always compresses to the same bytes
+        self.gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        # Each representation has its own strong ETag
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+class ReportCache:
+    def __init__(self, path="reports.db", max_entries=1024):
+        self.persistent = SQLiteCache(path)
+        self.max_entries = max_entries
+        self._prepared = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            prepared = self._prepared.get(key)
+            if prepared is not None:
+                self._prepared.move_to_end(key)
+                return prepared
+        html = self.persistent.get(key)
+        if html is None:
+            return None
+        return self._remember(key, PreparedReport(html))
+
+    def set(self, key, html):
+        self.persistent.set(key, html)
+        return self._remember(key, PreparedReport(html))
+
+    def _remember(self, key, prepared):
+        with self._lock:
+            self._prepared[key] = prepared
+            self._prepared.move_to_end(key)
+            while len(self._prepared) > self.max_entries:
+                self._prepared.popitem(last=False)
+        return prepared
+
+
+def get_report_cache():
+    return ReportCache(
+        os.getenv("REPORT_CACHE_PATH", "reports.db"),
+        int(os.getenv("REPORT_CACHE_MEMORY_ENTRIES", "1024")),
+    )
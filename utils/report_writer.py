@@ -0,0 +1,260 @@
+import os
+import re
+import html
+import uuid
+import hashlib
+import zipfile
+import threading
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
+from utils.markdown_stream import render_markdown
+
+# HTML report writing for FinalTeacherConclusion, off the node's critical path:
+# - the page template is parsed once (string.Template), values are escaped
+# - Markdown rendering and the file write run on a worker pool
+#   (REPORT_WRITER_THREADS, default 4), the async flow awaits the future
+# - writes are atomic (temp file + os.replace) and skipped when the file
+#   already has the same content, so unchanged reports keep their mtime
+# - file names come from the student Login, not from Full Name
+# - streaming mode appends each rendered block to <report>.partial as it
+#   arrives; the finished page replaces the report atomically
+# - batch runs get an index page, or one zip archive instead of many files
+
+REPORT_SUFFIX = "_teacher_conclusion.html"
+PARTIAL_SUFFIX = ".partial"
+ARCHIVE_NAME = "teacher_reports.zip"
+INDEX_NAME = "index.html"
+
+_STYLE = """
+body { font-family: DejaVu Sans, Arial, sans-serif; line-height: 1.5; padding: 20px; }
+h1,h2,h3,h4 { margin-top: 20px; }
+table { border-collapse: collapse; width: 100%; margin: 10px 0; }
+table, th, td { border: 1px solid #333; padding: 6px; }
+code { background-color: #f0f0f0; padding: 2px 4px; border-radius: 4px; }
+pre { background-color: #f9f9f9; padding: 10px; border-radius: 4px; overflow-x: auto; }
+ul, ol { padding-left: 20px; }
+"""
+
+_HEAD = Template("""
+<html>
+<head>
+<meta charset="utf-8">
+<title>Заключение учителя: $name</title>
+<style>$style</style>
+</head>
+<body>
+<h1>Итоговое заключение учителя для $name</h1>
+<h2>Класс: $grade</h2>
+""")
+
+HTML_TAIL = """
+</body>
+</html>
+"""
+
+_INDEX = Template("""<html>
+<head>
+<meta charset="utf-8">
+<title>Заключения учителя</title>
+<style>$style</style>
+</head>
+<body>
+<h1>Заключения учителя ($count)</h1>
+<table>
+<tr><th>Ученик</th><th>Статус</th><th>Секунд</th></tr>
+$rows
+</table>
+</body>
+</html>
+""")
+
+
+def html_head(student_data) -> str:
+    return _HEAD.substitute(
+        name=html.escape(str(student_data.get("Full Name", "ученик"))),
+        grade=html.escape(str(student_data.get("Class", "N/A"))),
+        style=_STYLE,
+    )
+
+
+def render_report(text, student_data):
+    """(full HTML page, HTML body) of a Markdown conclusion."""
+    body = render_markdown(text)
+    return html_head(student_data) + body + HTML_TAIL, body
+
+
+def report_file_name(student_id) -> str:
+    """
+    File name of a student's report. Logins are unique, so a Login made of
+    safe characters is used as is; anything else is slugged and gets a short
+    hash of the original, so two ids never map to the same file.
+    """
+    student_id = str(student_id)
+    if re.fullmatch(r"[A-Za-z0-9_.-]+", student_id) and not student_id.startswith("."):
+        return student_id + REPORT_SUFFIX
+    slug = re.sub(r"[^\w]+", "_", student_id).strip("_")[:64] or "student"
+    digest = hashlib.sha256(student_id.encode("utf-8")).hexdigest()[:10]
+    return f"{slug}_{digest}{REPORT_SUFFIX}"
+
+
+def _same_content(path, data: bytes) -> bool:
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+    except OSError:
+        return False
+    return digest.digest() == hashlib.sha256(data).digest()
+
+
+def open_temp(path, mode="w"):
+    """
+    (temp path, open file) next to path, for a later os.replace. Unlike
+    mkstemp, the file gets the usual umask permissions, not 0600.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex[:12]}.tmp")
+    encoding = None if "b" in mode else "utf-8"
+    return tmp_path, open(tmp_path, mode.replace("w", "x"), encoding=encoding)
+
+
+def write_if_changed(path, content: str) -> bool:
+    """
+    Atomically write content to path unless the file already holds exactly
+    this content. Returns True if the file was written.
+    """
+    data = content.encode("utf-8")
+    if _same_content(path, data):
+        return False
+    tmp_path, f = open_temp(path, "wb")
+    try:
+        with f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+
+class StreamingReportFile:
+    """
+    A report written while it is generated: the head first, then every
+    rendered Markdown block as soon as it is complete, in <path>.partial.
+    commit() adds the tail and moves the page into place (unless the report
+    already holds the same page); discard() removes an unfinished one.
+    Blocks joined by newlines render the same as the whole text (see
+    utils.markdown_stream), so the page is the one ReportWriter.write makes.
+    """
+
+    def __init__(self, path, student_data):
+        self.path = path
+        self.partial_path = path + PARTIAL_SUFFIX
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+        self._file.write(html_head(student_data))
+        self._file.flush()
+        self._blocks = []
+
+    def add(self, html_block):
+        self._file.write(("\n" if self._blocks else "") + html_block)
+        self._file.flush()
+        self._blocks.append(html_block)
+
+    def commit(self):
+        """{"html_file", "html_body", "changed"}, like ReportWriter.write."""
+        self._file.write(HTML_TAIL)
+        self._file.close()
+        with open(self.partial_path, "rb") as f:
+            data = f.read()
+        changed = not _same_content(self.path, data)
+        if changed:
+            os.replace(self.partial_path, self.path)
+        else:
+            os.unlink(self.partial_path)
+        return {"html_file": self.path, "html_body": "\n".join(self._blocks), "changed": changed}
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self.partial_path)
+        except FileNotFoundError:
+            pass
+
+
+class ReportBundle:
+    """
+    All reports of one batch run in a single zip archive (one HTML page per
+    student plus index.html), built next to the target and moved into place
+    by close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._tmp_path = path + ".tmp"
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_DEFLATED)
+        self._lock = threading.Lock()
+
+    def add(self, name, content: str):
+        with self._lock:
+            self._zip.writestr(name, content)
+        return f"{self.path}#{name}"
+
+    def close(self, records=()):
+        with self._lock:
+            self._zip.writestr(INDEX_NAME, index_page(records))
+            self._zip.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def index_page(records) -> str:
+    """Index of a batch run from its manifest records (student_id, status, html_file)."""
+    rows = []
+    for record in sorted(records, key=lambda r: r["student_id"]):
+        student_id = html.escape(record["student_id"])
+        if record.get("status") == "ok" and record.get("html_file"):
+            href = html.escape(os.path.basename(record["html_file"].split("#")[-1]), quote=True)
+            student = f'<a href="{href}">{student_id}</a>'
+        else:
+            student = student_id
+        status = html.escape(record.get("status", "") if record.get("status") == "ok"
+                             else f"{record.get('status')}: {record.get('error', '')}")
+        rows.append(f"<tr><td>{student}</td><td>{status}</td><td>{record.get('seconds', '')}</td></tr>")
+    return _INDEX.substitute(style=_STYLE, count=len(rows), rows="\n".join(rows))
+
+
+class ReportWriter:
+    """Renders and writes reports on a thread pool; submit() returns a Future."""
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+
+    def submit(self, text, student_data, path, bundle=None):
+        return self._pool.submit(self.write, text, student_data, path, bundle)
+
+    @staticmethod
+    def write(text, student_data, path, bundle=None):
+        """{"html_file", "html_body", "changed"} of one rendered report."""
+        page, body = render_report(text, student_data)
+        if bundle is not None:
+            return {"html_file": bundle.add(os.path.basename(path), page), "html_body": body, "changed": True}
+        return {"html_file": path, "html_body": body, "changed": write_if_changed(path, page)}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_report_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ReportWriter(int(os.getenv("REPORT_WRITER_THREADS", "4")))
+    return _writer
@@ -0,0 +1,55 @@
+import os
+import random
+from utils.llm_errors import LLMError
+
+# Retry policy for the LLM nodes, replacing PocketFlow's fixed wait:
+#   - parse errors (ValueError) retry immediately, waiting doesn't fix them
+#   - 429 / 5xx with Retry-After wait as long as the server asks
+#   - timeouts, connection and server errors back off exponentially with jitter
+#   - other 4xx (bad request, auth) are not retried
+# Configuration: LLM_RETRY_MAX_ATTEMPTS (3), LLM_RETRY_BASE_DELAY (1s),
+# LLM_RETRY_MAX_DELAY (30s), LLM_RETRY_JITTER (0.5).
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, jitter=0.5, max_retry_after=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter  # share of the backoff that is randomized (0 = none)
+        self.max_retry_after = max_retry_after
+
+    @classmethod
+    def fixed(cls, max_attempts, wait):
+        """PocketFlow-like policy: the same wait after every failure."""
+        return cls(max_attempts=max_attempts, base_delay=wait, max_delay=wait, jitter=0)
+
+    def with_attempts(self, max_attempts):
+        return RetryPolicy(max_attempts, self.base_delay, self.max_delay, self.jitter, self.max_retry_after)
+
+    def delay(self, attempt, error):
+        """
+        Seconds to wait before the next attempt after `error` on attempt
+        `attempt` (0-based), or None when the error should not be retried.
+        """
+        if attempt >= self.max_attempts - 1:
+            return None
+        if isinstance(error, ValueError):
+            return 0.0
+        if isinstance(error, LLMError):
+            if not error.retryable:
+                return None
+            if error.retry_after is not None:
+                return min(error.retry_after, self.max_retry_after)
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return backoff * (1 - self.jitter * random.random())
+
+
+def get_retry_policy():
+    """Policy configured from the environment."""
+    return RetryPolicy(
+        max_attempts=int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3")),
+        base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1")),
+        max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "30")),
+        jitter=float(os.getenv("LLM_RETRY_JITTER", "0.5")),
+    )
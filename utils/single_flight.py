@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import weakref
+
+# Single-flight: identical calls that are in flight at the same time share one
+# execution. The first caller for a key runs the function, everyone else who
+# asks for the same key meanwhile waits and gets the same result (or error).
+# Used by call_llm / acall_llm with the cache key, so students with identical
+# inputs in a cohort run cause one provider request instead of many.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"executed": self.executed, "shared": self.shared}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version. The call runs as its own task and every caller awaits it
+    through asyncio.shield, so a cancelled waiter doesn't cancel the others.
+    Tasks belong to one event loop, so in-flight calls are tracked per loop.
+    """
+
+    def __init__(self):
+        self._tasks = weakref.WeakKeyDictionary()  # loop -> {key: task}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, make_coro):
+        tasks = self._tasks.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        if task is None:
+            self.executed += 1
+            task = tasks[key] = asyncio.ensure_future(make_coro())
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"executed": self.executed, "shared": self.shared}
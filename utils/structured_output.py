@@ -0,0 +1,206 @@
+import re
+import yaml
+
+# Shared parser for the YAML answers of the nodes.
+# 1. finds the YAML even without fences or with an unterminated block
+# 2. repairs common mistakes locally (tabs, unquoted ": " in values, cut-off tail,
+#    missing top-level key)
+# 3. reports fields that are still missing, so the node can ask the LLM for
+#    only those fields (repair_prompt / apply_repair) instead of regenerating
+#    the whole answer
+
+
+class OutputSpec:
+    """
+    Expected shape of a node's YAML answer.
+    root: top-level key; items_key: key of the item list inside root
+    (None: root itself is the list); required: fields every item must have;
+    id_field: field that identifies an item when asking for missing fields.
+    single=True: root is one mapping instead of a list of items.
+    """
+
+    def __init__(self, root, required=(), id_field=None, items_key=None, single=False):
+        self.root = root
+        self.required = tuple(required)
+        self.id_field = id_field
+        self.items_key = items_key
+        self.single = single
+
+
+class MissingFieldsError(ValueError):
+    """Parsed answer lacks required fields; .missing is [(item id or None, [fields])]."""
+
+    def __init__(self, spec, data, missing):
+        self.spec = spec
+        self.data = data
+        self.missing = missing
+        described = "; ".join(f"{item or spec.root}: {', '.join(fields)}" for item, fields in missing)
+        super().__init__(f"Missing fields in LLM output ({described})")
+
+
+_FENCE_RE = re.compile(r"```[ \t]*(?:yaml|yml)?[ \t]*\n(.*?)(?:\n[ \t]*```|$)", re.DOTALL | re.IGNORECASE)
+_PLAIN_VALUE_RE = re.compile(r"^(\s*(?:- )?[^\s:#'\"][^:#]*?):[ \t]+(.+?)\s*$")
+
+
+def extract_yaml_block(text: str, root: str = None) -> str:
+    """YAML part of an LLM answer: fenced block (closed or not) or the text from the root key on."""
+    match = _FENCE_RE.search(text)
+    if match:
+        return match.group(1).strip("\n")
+    if root:
+        start = re.search(rf"^{re.escape(root)}\s*:", text, re.MULTILINE)
+        if start:
+            return text[start.start():].strip("\n")
+    return text.strip()
+
+
+def _quote_values(text: str) -> str:
+    """Quote plain scalar values that contain ': ' or ' #' or start with a YAML indicator."""
+    lines = []
+    for line in text.split("\n"):
+        match = _PLAIN_VALUE_RE.match(line)
+        if match:
+            key, value = match.groups()
+            needs_quotes = (
+                ": " in value or " #" in value or value[0] in "*&!%@`"
+            ) and value[0] not in "\"'|>[{"
+            if needs_quotes:
+                escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+                line = f'{key}: "{escaped}"'
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def load_yaml(text: str, max_trim: int = 20):
+    """
+    yaml.safe_load with local repairs; raises ValueError when nothing helps.
+    The last resort drops trailing lines (an answer cut off by max_tokens).
+    """
+    candidates = [text, text.replace("\t", "  ")]
+    candidates.append(_quote_values(candidates[-1]))
+    error = None
+    for candidate in candidates:
+        try:
+            return yaml.safe_load(candidate)
+        except yaml.YAMLError as e:
+            error = e
+    lines = candidates[-1].split("\n")
+    for cut in range(1, min(max_trim, len(lines) - 1) + 1):
+        try:
+            data = yaml.safe_load("\n".join(lines[:-cut]))
+            if data:
+                return data
+        except yaml.YAMLError:
+            continue
+    raise ValueError(f"Could not parse YAML in LLM output: {error}")
+
+
+def _items(spec, data):
+    value = data[spec.root]
+    if spec.single:
+        return [value]
+    if spec.items_key:
+        value = value.get(spec.items_key) if isinstance(value, dict) else None
+    return value if isinstance(value, list) else None
+
+
+def _wrap_root(spec, data):
+    """Put answers that forgot the top-level key back under it."""
+    if isinstance(data, dict) and spec.root in data:
+        return data
+    if spec.single:
+        if isinstance(data, dict):
+            return {spec.root: data}
+    elif spec.items_key:
+        if isinstance(data, dict) and spec.items_key in data:
+            return {spec.root: data}
+        if isinstance(data, list):
+            return {spec.root: {spec.items_key: data}}
+    elif isinstance(data, list):
+        return {spec.root: data}
+    elif isinstance(data, dict) and len(data) == 1 and isinstance(next(iter(data.values())), list):
+        return {spec.root: next(iter(data.values()))}
+    return data
+
+
+def _missing_fields(spec, items):
+    missing = []
+    for item in items:
+        fields = [field for field in spec.required if item.get(field) in (None, "", [])]
+        if fields:
+            item_id = item.get(spec.id_field) if spec.id_field else None
+            missing.append((item_id, fields))
+    return missing
+
+
+def validate(spec, data):
+    """Check the parsed data against spec; returns it or raises ValueError / MissingFieldsError."""
+    data = _wrap_root(spec, data)
+    if not isinstance(data, dict) or spec.root not in data:
+        raise ValueError(f"Missing '{spec.root}' key in LLM output.")
+    items = _items(spec, data)
+    if items is None:
+        raise ValueError(f"Missing or invalid '{spec.root}' in LLM output.")
+    items[:] = [item for item in items if isinstance(item, dict)]
+    if spec.id_field and not spec.single:
+        # Items without an identifier can't be completed later, drop them
+        items[:] = [item for item in items if item.get(spec.id_field) not in (None, "")]
+    missing = _missing_fields(spec, items)
+    if missing:
+        raise MissingFieldsError(spec, data, missing)
+    return data
+
+
+def parse_structured(text: str, spec: OutputSpec):
+    """Extract, repair and validate the YAML answer of a node."""
+    return validate(spec, load_yaml(extract_yaml_block(text, spec.root)))
+
+
+def repair_prompt(error: MissingFieldsError) -> str:
+    """Small prompt that asks only for the missing fields."""
+    spec = error.spec
+    wanted = sorted({field for _, fields in error.missing for field in fields})
+    if spec.single:
+        template = "\n".join(f'  {field}: ""' for field in wanted)
+        listing = f"- {', '.join(wanted)}"
+    else:
+        template = f'  - {spec.id_field}: ""\n' + "\n".join(f'    {field}: ""' for field in wanted)
+        listing = "\n".join(f'- "{item}": {", ".join(fields)}' for item, fields in error.missing)
+    return f"""
+Your previous answer was valid YAML but some required fields were empty or missing.
+
+Previous answer:
+```yaml
+{yaml.safe_dump(error.data, allow_unicode=True, sort_keys=False).strip()}
+```
+
+Provide ONLY these missing fields:
+{listing}
+
+Output STRICTLY in YAML format:
+
+```yaml
+fixes:
+{template}
+```"""
+
+
+def apply_repair(error: MissingFieldsError, text: str):
+    """Merge the answer to repair_prompt into the partial data and validate again."""
+    spec = error.spec
+    fixes = load_yaml(extract_yaml_block(text, "fixes"))
+    if isinstance(fixes, dict):
+        fixes = fixes.get("fixes", fixes)
+    items = _items(spec, error.data)
+    if spec.single:
+        if isinstance(fixes, list) and fixes:
+            fixes = fixes[0]
+        if isinstance(fixes, dict):
+            items[0].update({k: v for k, v in fixes.items() if v not in (None, "", [])})
+    elif isinstance(fixes, list):
+        by_id = {str(item.get(spec.id_field)): item for item in items}
+        for fix in fixes:
+            if isinstance(fix, dict) and str(fix.get(spec.id_field)) in by_id:
+                target = by_id[str(fix.get(spec.id_field))]
+                target.update({k: v for k, v in fix.items() if v not in (None, "", [])})
+    return validate(spec, error.data)